@@ -1,6 +1,8 @@
 class HmmModel(object):
-     def __init__(self,name,path,long_score,meta_score):
+     def __init__(self,name,path,long_score,meta_score,length=None,checksum=None):
              self.name = name                      
              self.path = path
              self.long_score = long_score          
              self.meta_score = meta_score          
+             self.length = length
+             self.checksum = checksum
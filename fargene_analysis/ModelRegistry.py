@@ -0,0 +1,170 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import shlex
+import subprocess as sp
+from collections import OrderedDict
+from distutils.spawn import find_executable
+from os import path
+
+from HmmModel import HmmModel
+
+MANIFEST = 'models.json'
+BUILTIN_DIR = path.join(path.dirname(path.abspath(__file__)), 'models')
+PRESSED_SUFFIXES = ['.h3m', '.h3i', '.h3f', '.h3p']
+
+def md5sum(filename):
+    checksum = hashlib.md5()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+def read_model_length(hmmfile):
+    with open(hmmfile) as f:
+        for line in f:
+            if line.startswith('LENG'):
+                return int(line.split()[1])
+    return None
+
+class ModelRegistry(object):
+    '''
+    Catalog of the HMMs that can be given by name to --hmm-model.
+    The predefined models are described by the manifest shipped in the
+    models directory, custom models are registered in the manifest of
+    catalogDir. Each entry holds the path, checksum, model length and
+    thresholds, so the .hmm files do not have to be parsed at startup.
+    The models are hmmpress'ed once, hmmsearch then reads the binary
+    database (<model>.hmm.h3m) instead of the text file.
+    '''
+
+    def __init__(self, catalogDir):
+        self.catalogDir = path.abspath(path.expanduser(catalogDir))
+        self.manifest = path.join(self.catalogDir, MANIFEST)
+        self.models = OrderedDict()
+        self.custom = set()
+        self.load(path.join(BUILTIN_DIR, MANIFEST), BUILTIN_DIR)
+        if path.isfile(self.manifest):
+            for name in self.load(self.manifest, self.catalogDir):
+                self.custom.add(name)
+
+    def load(self, manifest, directory):
+        with open(manifest) as f:
+            entries = json.load(f)['models']
+        names = []
+        for entry in entries:
+            name = str(entry['name']).lower()
+            self.models[name] = HmmModel(name, path.join(directory, entry['file']),
+                    entry['long_score'], entry.get('meta_score'),
+                    entry.get('length'), entry.get('md5'))
+            names.append(name)
+        return names
+
+    def save(self):
+        entries = []
+        for name in self.custom:
+            model = self.models[name]
+            entries.append({'name': model.name, 'file': path.basename(model.path),
+                'long_score': model.long_score, 'meta_score': model.meta_score,
+                'length': model.length, 'md5': model.checksum})
+        entries.sort(key=lambda entry: entry['name'])
+        if not path.isdir(self.catalogDir):
+            os.makedirs(self.catalogDir)
+        tmpManifest = '%s.tmp' %(self.manifest)
+        with open(tmpManifest, 'w') as f:
+            json.dump({'models': entries}, f, indent=4, sort_keys=True)
+            f.write('\n')
+        os.rename(tmpManifest, self.manifest)
+
+    def names(self):
+        return self.models.keys()
+
+    def get(self, name):
+        '''
+        Returns the validated model registered as name, or None.
+        '''
+        model = self.models.get(name.lower())
+        if model is None or not path.isfile(model.path):
+            return None
+        self.validate(model)
+        return model
+
+    def validate(self, model):
+        checksum = md5sum(model.path)
+        if checksum == model.checksum and model.length:
+            return
+        logging.warning('The checksum of %s does not match the model registry, '\
+                'updating the entry for %s' %(model.path, model.name))
+        model.checksum = checksum
+        model.length = read_model_length(model.path)
+        self.remove_database(model.path)
+        if model.name in self.custom:
+            self.save()
+
+    def register(self, name, hmmfile, long_score, meta_score=None):
+        '''
+        Copies hmmfile into the catalog and registers it as name.
+        '''
+        name = name.lower()
+        if name in self.models and name not in self.custom:
+            raise ValueError('%s is the name of a predefined model' %(name))
+        if not path.isdir(self.catalogDir):
+            os.makedirs(self.catalogDir)
+        target = path.join(self.catalogDir, '%s.hmm' %(name))
+        if path.abspath(hmmfile) != target:
+            shutil.copyfile(hmmfile, target)
+            self.remove_database(target)
+        self.models[name] = HmmModel(name, target, float(long_score), meta_score,
+                read_model_length(target), md5sum(target))
+        self.custom.add(name)
+        self.save()
+        logging.info('Registered %s as model %s in %s' %(hmmfile, name, self.manifest))
+        return self.models[name]
+
+    def database(self, model):
+        '''
+        Returns the path of the model to give to hmmsearch, next to which
+        the pressed binary database is built the first time it is needed.
+        Predefined models are copied into the catalog if the models
+        directory is not writable.
+        '''
+        hmmfile = model.path
+        if not os.access(path.dirname(hmmfile), os.W_OK):
+            hmmfile = path.join(self.catalogDir, path.basename(model.path))
+            if not path.isfile(hmmfile) or md5sum(hmmfile) != model.checksum:
+                if not path.isdir(self.catalogDir):
+                    os.makedirs(self.catalogDir)
+                shutil.copyfile(model.path, hmmfile)
+                self.remove_database(hmmfile)
+        if self.is_pressed(hmmfile) or self.press(hmmfile):
+            return hmmfile
+        return model.path
+
+    def is_pressed(self, hmmfile):
+        for suffix in PRESSED_SUFFIXES:
+            pressed = hmmfile + suffix
+            if not path.isfile(pressed) or path.getmtime(pressed) < path.getmtime(hmmfile):
+                return False
+        return True
+
+    def press(self, hmmfile):
+        if not find_executable('hmmpress'):
+            logging.warning('Did not find hmmpress in path, searching with the text model %s' %(hmmfile))
+            return False
+        msg = 'hmmpress -f %s' %(hmmfile)
+        logging.info('Running command: %s' %(msg))
+        commands = shlex.split(msg)
+        process = sp.Popen(commands, stdin=sp.PIPE, stdout=sp.PIPE, stderr=sp.PIPE)
+        process.communicate()
+        if process.returncode != 0:
+            logging.warning('Could not press %s, searching with the text model' %(hmmfile))
+            self.remove_database(hmmfile)
+            return False
+        return True
+
+    def remove_database(self, hmmfile):
+        for suffix in PRESSED_SUFFIXES:
+            if path.isfile(hmmfile + suffix):
+                os.remove(hmmfile + suffix)
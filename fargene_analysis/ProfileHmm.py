@@ -0,0 +1,396 @@
+import math
+
+import numpy as np
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+# HMMER's null model: the amino acid composition of BLOSUM62
+BACKGROUND = np.array([0.0787945, 0.0151600, 0.0535222, 0.0668298, 0.0397062,
+                       0.0695071, 0.0229198, 0.0590092, 0.0594422, 0.0963728,
+                       0.0237718, 0.0414386, 0.0482904, 0.0395639, 0.0540978,
+                       0.0683364, 0.0540687, 0.0673417, 0.0114135, 0.0304133])
+DEGENERATE = [('B','DN'), ('J','IL'), ('Z','EQ'), ('O','K'), ('U','C'), ('X',AMINO_ACIDS)]
+STOP = len(AMINO_ACIDS) + len(DEGENERATE)
+NUM_CODES = STOP + 1
+
+UNKNOWN = len(AMINO_ACIDS) + [d[0] for d in DEGENERATE].index('X')
+RESIDUE_CODES = np.full(256, UNKNOWN, dtype=np.int64)
+for code, residue in enumerate(AMINO_ACIDS + ''.join([d[0] for d in DEGENERATE])):
+    RESIDUE_CODES[ord(residue)] = code
+    RESIDUE_CODES[ord(residue.lower())] = code
+RESIDUE_CODES[ord('*')] = STOP
+
+OMEGA = 1.0/256
+# Posterior thresholds used by HMMER to define the domain regions
+RT1 = 0.25
+RT2 = 0.10
+NINF = -np.inf
+
+def log_probability(field):
+    if field == '*':
+        return NINF
+    return -float(field)
+
+def logsum(*arrays):
+    result = arrays[0]
+    for array in arrays[1:]:
+        result = np.logaddexp(result, array)
+    return result
+
+def linear_recurrence(a, logb):
+    '''
+    Solves x[k] = logsum(a[k], x[k-1] + logb[k-1]) along the last axis
+    in one pass (the delete state chain), x[0] = a[0].
+    '''
+    logb = np.maximum(logb, -1e4)
+    cumulative = np.concatenate(([0.0], np.cumsum(logb)))[:a.shape[-1]]
+    with np.errstate(invalid='ignore'):
+        return cumulative + np.logaddexp.accumulate(a - cumulative, axis=-1)
+
+class ProfileHmm(object):
+    '''
+    In-process scoring of protein sequences against a HMMER3 profile,
+    intended for the small rescoring steps of the pipeline.
+
+    The scores follow hmmsearch: Forward scores of the local multihit
+    model corrected with the null2 (bias) model, and domain envelopes
+    from the posterior decoding. Regions that HMMER would split into
+    several domains by stochastic clustering are reported as one
+    envelope, and no acceleration filters are applied (as hmmsearch --max).
+    '''
+
+    def __init__(self, hmmfile):
+        self.path = hmmfile
+        self.name = None
+        self.forwardStats = None
+        alphabet = []
+        with open(hmmfile) as f:
+            for line in f:
+                fields = line.split()
+                if not fields:
+                    continue
+                if fields[0] == 'NAME':
+                    self.name = fields[1]
+                elif fields[0] == 'STATS' and fields[2] == 'FORWARD':
+                    self.forwardStats = (float(fields[3]), float(fields[4]))
+                elif fields[0] == 'HMM':
+                    alphabet = fields[1:]
+                    break
+            next(f)
+            lines = []
+            for line in f:
+                if line.startswith('//'):
+                    break
+                lines.append(line.split())
+        if lines and lines[0][0] == 'COMPO':
+            lines = lines[1:]
+        # Node 0 has no match emissions
+        match = [[NINF]*20] + [[log_probability(value) for value in fields[1:21]] for fields in lines[2::3]]
+        transitions = [[log_probability(value) for value in fields] for fields in lines[1::3]]
+        if ''.join(alphabet) != AMINO_ACIDS:
+            raise ValueError('%s is not an amino acid HMM' %(hmmfile))
+        self.length = len(match) - 1
+        self.configure(np.array(match), np.array(transitions))
+
+    def configure(self, match, transitions):
+        M = self.length
+        t = np.exp(transitions)
+        # Local entry into M_k weighted by the occupancy of M_k
+        occupancy = np.zeros(M+1)
+        occupancy[1] = t[0,0] + t[0,1]
+        for k in range(2, M+1):
+            occupancy[k] = occupancy[k-1]*(t[k-1,0] + t[k-1,1]) + (1.0 - occupancy[k-1])*t[k-1,5]
+        Z = np.sum(occupancy[1:]*(M - np.arange(1, M+1) + 1))
+        with np.errstate(divide='ignore'):
+            self.tBM = np.log(occupancy/Z)
+        self.tBM[0] = NINF
+        tsc = transitions.copy()
+        tsc[0,:] = NINF
+        tsc[M,:] = NINF
+        self.tMM, self.tMI, self.tMD, self.tIM, self.tII, self.tDM, self.tDD = [tsc[:,i] for i in range(7)]
+
+        logOdds = match - np.log(BACKGROUND)
+        logOdds[0,:] = NINF
+        self.msc = np.full((NUM_CODES, M+1), NINF)
+        self.msc[:20,:] = logOdds.T
+        self.nullOdds = np.zeros((NUM_CODES, M+1))
+        self.nullOdds[:20,:] = np.exp(logOdds.T)
+        for code, (residue, members) in enumerate(DEGENERATE):
+            indices = [AMINO_ACIDS.index(member) for member in members]
+            weights = BACKGROUND[indices]/np.sum(BACKGROUND[indices])
+            self.msc[20+code,:] = np.dot(weights, logOdds.T[indices,:])
+            self.msc[20+code,0] = NINF
+        self.isc = np.zeros(NUM_CODES)
+        self.msc[STOP,:] = NINF
+
+    def special_transitions(self, lengths, multihit):
+        nj = 1.0 if multihit else 0.0
+        L = np.asarray(lengths, dtype=float)
+        move = np.log((2.0 + nj)/(L + 2.0 + nj))
+        loop = np.log(L/(L + 2.0 + nj))
+        if multihit:
+            eloop, emove = math.log(0.5), math.log(0.5)
+        else:
+            eloop, emove = NINF, 0.0
+        return loop, move, eloop, emove
+
+    def encode(self, sequences):
+        '''
+        Packs the sequences right aligned into one residue matrix,
+        so that Forward and Backward can run on the whole batch.
+        '''
+        T = max([len(seq) for seq in sequences])
+        dsq = np.full((len(sequences), T+1), UNKNOWN, dtype=np.int64)
+        offsets = np.zeros(len(sequences), dtype=np.int64)
+        for b, seq in enumerate(sequences):
+            offsets[b] = T - len(seq)
+            dsq[b, offsets[b]+1:] = RESIDUE_CODES[np.frombuffer(seq.encode('ascii'), dtype=np.uint8)]
+        return dsq, offsets
+
+    def forward(self, dsq, offsets, configLengths, multihit, storeMatrices=False):
+        B, T = dsq.shape[0], dsq.shape[1] - 1
+        M = self.length
+        loop, move, eloop, emove = self.special_transitions(configLengths, multihit)
+        special = dict((state, np.full((B, T+1), NINF)) for state in 'NBEJC')
+        matchRows, insertRows = [], []
+        Mrow = np.full((B, M+1), NINF)
+        Irow = np.full((B, M+1), NINF)
+        Drow = np.full((B, M+1), NINF)
+        for i in range(0, T+1):
+            notStarted = offsets >= i
+            if i > 0:
+                msc = self.msc[dsq[:,i]]
+                isc = self.isc[dsq[:,i]][:,None]
+                Bprev = special['B'][:,i-1][:,None]
+                newM = np.full((B, M+1), NINF)
+                newM[:,1:] = msc[:,1:] + logsum(Mrow[:,:-1] + self.tMM[:-1], Irow[:,:-1] + self.tIM[:-1],
+                        Bprev + self.tBM[1:], Drow[:,:-1] + self.tDM[:-1])
+                newI = np.full((B, M+1), NINF)
+                newI[:,1:M] = isc + logsum(Mrow[:,1:M] + self.tMI[1:M], Irow[:,1:M] + self.tII[1:M])
+                newD = np.full((B, M+1), NINF)
+                newD[:,2:] = linear_recurrence(newM[:,1:M] + self.tMD[1:M], self.tDD[2:M])
+                Mrow, Irow, Drow = newM, newI, newD
+                E = np.logaddexp(np.logaddexp.reduce(Mrow, axis=1), np.logaddexp.reduce(Drow, axis=1))
+                J = np.logaddexp(special['J'][:,i-1] + loop, E + eloop)
+                C = np.logaddexp(special['C'][:,i-1] + loop, E + emove)
+                N = special['N'][:,i-1] + loop
+            else:
+                E = J = C = np.full(B, NINF)
+                N = np.zeros(B)
+            N = np.where(notStarted, 0.0, N)
+            for state, row in (('E', E), ('J', J), ('C', C)):
+                special[state][:,i] = np.where(notStarted, NINF, row)
+            special['N'][:,i] = N
+            special['B'][:,i] = np.logaddexp(N + move, special['J'][:,i] + move)
+            Mrow[notStarted] = NINF
+            Irow[notStarted] = NINF
+            Drow[notStarted] = NINF
+            if storeMatrices:
+                matchRows.append(Mrow)
+                insertRows.append(Irow)
+        score = special['C'][:,T] + move
+        return score, special, matchRows, insertRows
+
+    def backward(self, dsq, offsets, configLengths, multihit, forwardMatrices=None, total=None):
+        '''
+        Backward pass. If the Forward matrices are given, the expected
+        number of times each match and insert state is used is summed up
+        on the way (needed for the null2 model).
+        '''
+        B, T = dsq.shape[0], dsq.shape[1] - 1
+        M = self.length
+        loop, move, eloop, emove = self.special_transitions(configLengths, multihit)
+        special = dict((state, np.full((B, T+1), NINF)) for state in 'NBEJC')
+        expectedMatch = np.zeros((B, M+1))
+        expectedInsert = np.zeros((B, M+1))
+        for i in range(T, -1, -1):
+            if i == T:
+                C = move + np.zeros(B)
+                E = C + emove
+                J = N = Bsp = np.full(B, NINF)
+                Mrow = np.full((B, M+1), NINF)
+                Irow = np.full((B, M+1), NINF)
+                Drow = np.full((B, M+1), NINF)
+                Drow[:,1:] = linear_recurrence(np.repeat(E[:,None], M, axis=1)[:,::-1],
+                        self.tDD[M-1:0:-1])[:,::-1]
+                Mrow[:,M] = E
+                Mrow[:,1:M] = np.logaddexp(E[:,None], Drow[:,2:] + self.tMD[1:M])
+            else:
+                msc = self.msc[dsq[:,i+1]]
+                isc = self.isc[dsq[:,i+1]][:,None]
+                nextM = Mrow + msc
+                Bsp = np.logaddexp.reduce(nextM[:,1:] + self.tBM[1:], axis=1)
+                J = np.logaddexp(special['J'][:,i+1] + loop, Bsp + move)
+                C = special['C'][:,i+1] + loop
+                E = np.logaddexp(J + eloop, C + emove)
+                N = np.logaddexp(special['N'][:,i+1] + loop, Bsp + move)
+                newD = np.full((B, M+1), NINF)
+                newD[:,M] = E
+                exits = np.logaddexp(nextM[:,2:] + self.tDM[1:M], E[:,None])
+                chain = np.concatenate((E[:,None], exits[:,::-1]), axis=1)
+                newD[:,1:] = linear_recurrence(chain, self.tDD[M-1:0:-1])[:,::-1]
+                newM = np.full((B, M+1), NINF)
+                newM[:,M] = E
+                newM[:,1:M] = logsum(nextM[:,2:] + self.tMM[1:M], Irow[:,1:M] + isc + self.tMI[1:M],
+                        E[:,None], newD[:,2:] + self.tMD[1:M])
+                newI = np.full((B, M+1), NINF)
+                newI[:,1:M] = np.logaddexp(nextM[:,2:] + self.tIM[1:M], Irow[:,1:M] + isc + self.tII[1:M])
+                Mrow, Irow, Drow = newM, newI, newD
+            for state, row in (('N', N), ('B', Bsp), ('E', E), ('J', J), ('C', C)):
+                special[state][:,i] = row
+            if forwardMatrices is not None and i > 0:
+                inSequence = (offsets < i)[:,None]
+                with np.errstate(invalid='ignore'):
+                    expectedMatch += np.where(inSequence, np.exp(forwardMatrices[0][i] + Mrow - total[:,None]), 0.0)
+                    expectedInsert += np.where(inSequence, np.exp(forwardMatrices[1][i] + Irow - total[:,None]), 0.0)
+        return special, expectedMatch, expectedInsert
+
+    def emission_posteriors(self, forwardSpecial, backwardSpecial, offsets, configLengths, multihit, total):
+        '''
+        Per residue posteriors of starting (B) and ending (E) a domain
+        and of being emitted by N, J or C.
+        '''
+        loop = self.special_transitions(configLengths, multihit)[0][:,None]
+        t = total[:,None]
+        begin = np.exp(forwardSpecial['B'][:,:-1] + backwardSpecial['B'][:,:-1] - t)
+        end = np.exp(forwardSpecial['E'][:,1:] + backwardSpecial['E'][:,1:] - t)
+        flanking = sum([np.exp(forwardSpecial[state][:,:-1] + backwardSpecial[state][:,1:] + loop - t)
+            for state in 'NJC'])
+        return begin, end, flanking
+
+    def find_regions(self, begin, end, flanking):
+        '''
+        HMMER's posterior decoding heuristic for where the domains are,
+        for one sequence. Returns 1-based (start, end) of each region.
+        '''
+        regions = []
+        occupancy = 1.0 - flanking
+        start = -1
+        triggered = False
+        for j in range(1, len(occupancy) + 1):
+            if not triggered:
+                if occupancy[j-1] - begin[j-1] < RT2:
+                    start = j
+                elif start == -1:
+                    start = j
+                if occupancy[j-1] >= RT1:
+                    triggered = True
+            elif occupancy[j-1] - end[j-1] < RT2:
+                regions.append((start, j))
+                start = -1
+                triggered = False
+        return regions
+
+    def null_score(self, lengths):
+        L = np.asarray(lengths, dtype=float)
+        return L*np.log(L/(L + 1.0)) + np.log(1.0/(L + 1.0))
+
+    def null2_scores(self, expectedMatch, expectedInsert, flanking, lengths):
+        '''
+        Per residue log odds of the null2 model of each envelope.
+        '''
+        odds = np.dot(expectedMatch[:,1:], self.nullOdds[:20,1:].T)
+        odds += np.sum(expectedInsert, axis=1)[:,None] + flanking[:,None]
+        odds = odds/np.asarray(lengths, dtype=float)[:,None]
+        null2 = np.ones((odds.shape[0], NUM_CODES))
+        null2[:,:20] = odds
+        for code, (residue, members) in enumerate(DEGENERATE):
+            null2[:,20+code] = np.mean(odds[:,[AMINO_ACIDS.index(member) for member in members]], axis=1)
+        return np.log(null2)
+
+    def batches(self, sequences, maxCells):
+        batch, longest = [], 0
+        for index, seq in enumerate(sequences):
+            longest = max(longest, len(seq))
+            if batch and (len(batch) + 1)*longest*(self.length + 1) > maxCells:
+                yield batch
+                batch, longest = [], len(seq)
+            batch.append(index)
+        if batch:
+            yield batch
+
+    def search(self, sequences, maxCells=4000000):
+        '''
+        Scores a list of (name, sequence) pairs. Returns one
+        (name, length, score, bias, domains) per sequence, where each domain is
+        (score, bias, envFrom, envTo). Scores are in bits.
+        '''
+        sequences = [(name, seq) for name, seq in sequences if len(seq) > 0]
+        seqs = [seq for name, seq in sequences]
+        results = [None]*len(sequences)
+        envelopes = []
+        for batch in self.batches(seqs, maxCells):
+            lengths = [len(seqs[b]) for b in batch]
+            dsq, offsets = self.encode([seqs[b] for b in batch])
+            total, forwardSpecial, _, _ = self.forward(dsq, offsets, lengths, True)
+            backwardSpecial = self.backward(dsq, offsets, lengths, True)[0]
+            begin, end, flanking = self.emission_posteriors(forwardSpecial, backwardSpecial,
+                    offsets, lengths, True, total)
+            for row, b in enumerate(batch):
+                offset = offsets[row]
+                regions = self.find_regions(begin[row,offset:], end[row,offset:], flanking[row,offset:])
+                results[b] = [total[row], regions]
+                for start, stop in regions:
+                    envelopes.append((b, start, stop))
+
+        domainScores = dict()
+        subsequences = [seqs[b][start-1:stop] for b, start, stop in envelopes]
+        for batch in self.batches(subsequences, maxCells):
+            parents = [envelopes[e][0] for e in batch]
+            configLengths = [len(seqs[b]) for b in parents]
+            envLengths = [len(subsequences[e]) for e in batch]
+            dsq, offsets = self.encode([subsequences[e] for e in batch])
+            envsc, forwardSpecial, matchRows, insertRows = self.forward(dsq, offsets, configLengths, False, True)
+            backwardSpecial, expectedMatch, expectedInsert = self.backward(dsq, offsets, configLengths, False,
+                    (matchRows, insertRows), envsc)
+            flanking = self.emission_posteriors(forwardSpecial, backwardSpecial, offsets,
+                    configLengths, False, envsc)[2]
+            flanking = np.array([np.sum(flanking[row,offsets[row]:]) for row in range(len(batch))])
+            null2 = self.null2_scores(expectedMatch, expectedInsert, flanking, envLengths)
+            for row, e in enumerate(batch):
+                residueScores = null2[row][dsq[row,offsets[row]+1:]]
+                domainScores[e] = (envsc[row], residueScores)
+
+        hits = []
+        for b, (name, seq) in enumerate(sequences):
+            L = float(len(seq))
+            fwdsc, regions = results[b]
+            nullsc = self.null_score([L])[0]
+            domains = []
+            seqNull2 = 0.0
+            for e, (parent, start, stop) in enumerate(envelopes):
+                if parent != b:
+                    continue
+                envsc, residueScores = domainScores[e]
+                seqNull2 += np.sum(residueScores)
+                Ld = stop - start + 1
+                domcorrection = max(0.0, np.sum(residueScores))
+                dombias = np.logaddexp(0.0, math.log(OMEGA) + domcorrection)
+                score = envsc + (L - Ld)*math.log(L/(L + 3.0))
+                domains.append(((score - (nullsc + dombias))/math.log(2), dombias/math.log(2), start, stop))
+            seqbias = np.logaddexp(0.0, math.log(OMEGA) + seqNull2) if domains else 0.0
+            hits.append((name, len(seq), (fwdsc - (nullsc + seqbias))/math.log(2), seqbias/math.log(2), domains))
+        return hits
+
+    def evalue(self, score, Z):
+        if self.forwardStats is None:
+            return float('nan')
+        tau, lam = self.forwardStats
+        return Z*min(1.0, math.exp(-lam*(score - tau)))
+
+    def write_domtblout(self, hits, outfile, Z=None):
+        '''
+        Writes the hits in the hmmsearch --domtblout format.
+        Columns that are not computed (hmm and alignment coordinates
+        and accuracy) are given as the envelope or '-'.
+        '''
+        if Z is None:
+            Z = len(hits)
+        with open(outfile, 'w') as f:
+            f.write('# target name accession tlen query name accession qlen E-value score bias # of '
+                    'c-Evalue i-Evalue score bias hmm-from hmm-to ali-from ali-to env-from env-to acc description\n')
+            for name, length, score, bias, domains in hits:
+                for d, (domScore, domBias, envFrom, envTo) in enumerate(domains):
+                    f.write('%-20s - %5d %-20s - %5d %9.2g %6.1f %5.1f %3d %3d %9.2g %9.2g %6.1f %5.1f - - %5d %5d %5d %5d - -\n' \
+                            %(name, length, self.name, self.length, self.evalue(score, Z), score, bias,
+                              d+1, len(domains), self.evalue(domScore, Z), self.evalue(domScore, Z),
+                              domScore, domBias, envFrom, envTo, envFrom, envTo))
@@ -1,53 +1,56 @@
-import shlex
-import subprocess as sp
+import json
+from collections import OrderedDict
 from os import path
 
+METRICS = ['hits', 'retrieved_reads', 'retrieved_bases', 'genes', 'gene_bases',
+        'contigs', 'contig_bases', 'orfs', 'orf_bases']
+BASES = {'retrieved_reads': 'retrieved_bases', 'genes': 'gene_bases',
+        'contigs': 'contig_bases', 'orfs': 'orf_bases'}
 
 class ResultsSummary(object):
+    '''
+    Collects the counts of the pipeline per model and sample (input file,
+    or read pair) as the records are written, so that no output has to
+    be read again to summarize it. The writers return the number of
+    records (and bases) they wrote, which are added with add().
+    '''
 
     def __init__(self, summaryFile, numInputFiles,hmmModel):
         self.outfile = summaryFile
         self.hmmerModel = path.basename(hmmModel)
         self.inputFiles = numInputFiles
-        self.retrievedSequences = 0
-        self.contigs = None
-        self.retrievedContigs = None
-        self.predictedOrfs = 0
+        self.counts = OrderedDict()
 
-    def count_hits_deprecated(self,infiles,hitDir):
-        count = 0
-        for fastafile in infiles:
-            fastaBaseName = path.basename(fastafile).rpartition('.')[0] 
-            hitFile = '%s/%s-positives.out' %(path.abspath(hitDir),fastaBaseName)
-            msg = 'wc -l %s' %hitFile
-            commands = shlex.split(msg)
-            c,_ = sp.Popen(commands, stdin=sp.PIPE,stdout = sp.PIPE).communicate()
-            count = count + int(c.split()[0])
-        self.retrievedSequences = count
+    def add(self, sample, metric, records, bases=None, model=None):
+        '''
+        Adds records to the metric of a sample, and bases to the
+        corresponding bases metric (e.g. contigs and contig_bases).
+        '''
+        samples = self.counts.setdefault(model or self.hmmerModel, OrderedDict())
+        sampleCounts = samples.setdefault(sample, OrderedDict())
+        sampleCounts[metric] = sampleCounts.get(metric, 0) + records
+        if bases is not None:
+            sampleCounts[BASES[metric]] = sampleCounts.get(BASES[metric], 0) + bases
 
-    def count_hits(self,hitFile):
-        msg = 'wc -l %s' %hitFile
-        commands = shlex.split(msg)
-        c,_ = sp.Popen(commands, stdin=sp.PIPE,stdout = sp.PIPE).communicate()
-        self.retrievedSequences = self.retrievedSequences + int(c.split()[0])
+    def total(self, metric, model=None):
+        ''' The sum of metric over the samples, None if it was never counted. '''
+        counts = [sampleCounts[metric] for sampleCounts in self.counts.get(model or self.hmmerModel, {}).values() \
+                if metric in sampleCounts]
+        if not counts:
+            return None
+        return sum(counts)
 
-    def count_contigs(self,contigFile):
-        count = 0
-        if contigFile==None or not path.isfile(contigFile):
-            return count
-        with open(contigFile) as f:
-            for line in f:
-                if line.startswith('>'):
-                    count = count + 1
-        return count
+    @property
+    def retrievedSequences(self):
+        return self.total('hits') or 0
 
-    def count_orfs_genomes(self,orfFile):
-        if not path.isfile(orfFile):
-            return
-        with open(orfFile) as f:
-            for line in f:
-                if line.startswith('>'):
-                    self.predictedOrfs = self.predictedOrfs + 1
+    @property
+    def retrievedContigs(self):
+        return self.total('contigs')
+
+    @property
+    def predictedOrfs(self):
+        return self.total('orfs') or 0
 
     def write_summary(self,isMeta):
         #outfile = '%s/ResultsSummary.txt' %(path.abspath(outdir))
@@ -66,4 +69,16 @@ class ResultsSummary(object):
                         'Number of predicted genes:\t%s\n'\
                         'Number of predicted ORFs:\t%s'\
                         %(str(self.retrievedSequences),str(self.predictedOrfs)))
+        self.write_json('%s.json' %(path.splitext(outfile)[0]), isMeta)
 
+    def write_json(self, outfile, isMeta):
+        models = OrderedDict()
+        for model, samples in self.counts.items():
+            totals = OrderedDict((metric, self.total(metric, model)) for metric in METRICS \
+                    if self.total(metric, model) is not None)
+            models[model] = OrderedDict([('samples', samples), ('totals', totals)])
+        summary = OrderedDict([('input', 'metagenomic' if isMeta else 'genomic'),
+                ('input_files', self.inputFiles),
+                ('models', models)])
+        with open(outfile,'w') as f:
+            json.dump(summary, f, indent=4)
@@ -0,0 +1,90 @@
+from collections import defaultdict
+import logging
+
+COMPLEMENT = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
+BASES = 'ACGT'
+
+def count_reads(fastqfile):
+    count = 0
+    with open(fastqfile) as f:
+        for i, line in enumerate(f):
+            if i % 4 == 0 and line.startswith('@'):
+                count = count + 1
+    return count
+
+def read_fastq_sequences(fastqfile):
+    with open(fastqfile) as f:
+        for i, line in enumerate(f):
+            if i % 4 == 1:
+                yield line.strip().upper()
+
+def reverse_complement(seq):
+    return ''.join(COMPLEMENT.get(base, 'N') for base in reversed(seq))
+
+def canonical(kmer):
+    rc = reverse_complement(kmer)
+    if rc < kmer:
+        return rc
+    return kmer
+
+def count_kmers(fastqfiles, kmerSize):
+    kmerCounts = defaultdict(int)
+    for fastqfile in fastqfiles:
+        for seq in read_fastq_sequences(fastqfile):
+            for part in seq.split('N'):
+                for i in range(0, len(part) - kmerSize + 1):
+                    kmerCounts[canonical(part[i:i+kmerSize])] += 1
+    return kmerCounts
+
+def extend_right(contig, kmerCounts, used, kmerSize, minCount):
+    '''
+    Greedily extends the contig to the right, always following the most
+    abundant solid k-mer, until no unused successor is left.
+    '''
+    coverage = []
+    while True:
+        suffix = contig[-(kmerSize-1):]
+        best, bestCount = None, 0
+        for base in BASES:
+            count = kmerCounts.get(canonical(suffix + base), 0)
+            if count >= minCount and count > bestCount:
+                best, bestCount = suffix + base, count
+        if best is None or canonical(best) in used:
+            break
+        used.add(canonical(best))
+        coverage.append(bestCount)
+        contig = contig + best[-1]
+    return contig, coverage
+
+def assemble_contigs(kmerCounts, kmerSize, minCount):
+    contigs = []
+    used = set()
+    solid = [kmer for kmer, count in kmerCounts.iteritems() if count >= minCount]
+    solid.sort(key=lambda kmer: (-kmerCounts[kmer], kmer))
+    for seed in solid:
+        if seed in used:
+            continue
+        used.add(seed)
+        contig, rightCoverage = extend_right(seed, kmerCounts, used, kmerSize, minCount)
+        contig, leftCoverage = extend_right(reverse_complement(contig), kmerCounts, used, kmerSize, minCount)
+        coverage = [kmerCounts[seed]] + rightCoverage + leftCoverage
+        contigs.append((reverse_complement(contig), sum(coverage)/float(len(coverage))))
+    return contigs
+
+def assemble_reads(fastqfiles, contigFile, kmerSize=31, minCount=2, minContigLength=100):
+    '''
+    Small de Bruijn graph assembler for the (tiny) sets of retrieved reads.
+    Writes the contigs in the same format as SPAdes contigs.fasta
+    and returns the number of written contigs.
+    '''
+    kmerCounts = count_kmers(fastqfiles, kmerSize)
+    contigs = assemble_contigs(kmerCounts, kmerSize, minCount)
+    contigs = [contig for contig in contigs if len(contig[0]) >= minContigLength]
+    contigs.sort(key=lambda contig: (-len(contig[0]), -contig[1]))
+    with open(contigFile, 'w') as f:
+        for i, (seq, coverage) in enumerate(contigs):
+            f.write('>NODE_%s_length_%s_cov_%f\n' %(str(i+1), str(len(seq)), coverage))
+            for j in range(0, len(seq), 60):
+                f.write('%s\n' %(seq[j:j+60]))
+    logging.info('Assembled %s contigs from %s distinct k-mers', len(contigs), len(kmerCounts))
+    return len(contigs)
@@ -10,9 +10,11 @@ import itertools
 import importlib
 
 from Transformer import Transformer
-from HmmModel import HmmModel
-from predict_orfs import predict_orfs_orfFinder, predict_orfs_prodigal
+from ModelRegistry import ModelRegistry
+from predict_orfs import predict_orfs_orfFinder, predict_orfs_prodigal, predict_orfs_native
 from ResultsSummary import ResultsSummary
+from progress import ProgressListener, InputProgress
+import profiling
 import utils
 
 def parse_args(argv):
@@ -27,6 +29,12 @@ def parse_args(argv):
     parser.add_argument('--score','-sl', dest='long_score', required=False,
                         help = 'The threshold score for a sequence to be classified as a (almost) complete gene (default: %(default)s).')
 
+    parser.add_argument('--register-model', dest='register_model', metavar='NAME',
+                        help = 'Register the given HMM and threshold scores under NAME in the model registry, '\
+                               'so that later runs can use --hmm-model NAME.')
+    parser.add_argument('--model-registry', dest='model_registry', metavar='DIR',
+                        help = 'Directory of the registry of custom models and pressed HMM databases '\
+                               '(default: %(default)s).')
     parser.add_argument('--meta', action='store_true',
                         help='If the input data is paired end metagenomic data (default: %(default)s).')
     parser.add_argument('--meta-score','-sm', dest='meta_score', type=float,
@@ -60,15 +68,31 @@ def parse_args(argv):
                         help='Do not perform ORF prediction.')
     parser.add_argument('--no-quality-filtering', default=False, action='store_true', dest='no_quality_filtering',
                         help = 'Use if no quality control should be performed on the metagenomic data (default: %(default)s).')
+    parser.add_argument('--trim-galore', default=False, action='store_true', dest='trim_galore',
+                        help = 'Use Trim Galore! for the quality control instead of the built-in read trimming (default: %(default)s).')
     parser.add_argument('--no-assembly', action='store_true', dest='no_assembly',
                         help = 'Use if you want to skip the assembly and retrieval of contigs for metagenomic data (default: %(default)s).')
+    parser.add_argument('--builtin-assembly-max-reads', type=int, dest='builtin_assembly_max_reads',
+                        help = 'Retrieved read sets with at most this many read pairs are assembled with the '\
+                                'built-in assembler instead of SPAdes. Use 0 to always run SPAdes (default: %(default)s).')
     parser.add_argument('--orf-finder', action='store_true', dest='orf_finder',
-                        help = 'Use NCBI ORFfinder instead of prodigal for ORF prediction of genomes/contigs (default: %(default)s).')
+                        help = 'Use ORFfinder style ORF prediction instead of prodigal for genomes/contigs (default: %(default)s).')
+
+    parser.add_argument('--external-orf-finder', action='store_true', dest='external_orf_finder',
+                        help = 'Run the NCBI ORFfinder binary instead of the built-in ORF finder (default: %(default)s).')
 
     parser.add_argument('--store-peptides','-sp', default=False, action='store_true', dest='store_peptides',
                         help = 'Store the translated sequences. Useful if you plan to redo '\
                                'the analysis using a different model and want to skip the preprocessing steps '\
                                '(default: %(default)s).')
+    parser.add_argument('--reuse-hits', action='store_true', dest='reuse_hits',
+                        help = 'Translate the predicted genes using the frames and coordinates of the first hmmsearch '\
+                               'instead of translating and searching them a second time (default: %(default)s).')
+    parser.add_argument('--in-process-max-seqs', type=int, dest='in_process_max_seqs',
+                        help = 'Contigs, ORFs and predicted genes are scored against the model in-process instead of '\
+                               'with transeq and hmmsearch when there are at most this many sequences (counted '\
+                               'before the translation, which searches each in six frames). '\
+                               'Use 0 to always run hmmsearch (default: %(default)s).')
     parser.add_argument('--rerun', action='store_true',
                         help = 'Use of you want to redo the analysis or do the analysis using a different model '\
                                 'and have kept either the nucletide or amino acid sequences. '\
@@ -88,6 +112,12 @@ def parse_args(argv):
                         help='Set logging level (default: %(default)s).')
     parser.add_argument('--logfile', type=str, default='fargene_analysis.log',
                         help='Logfile (default: %(default)s).')
+    parser.add_argument('--progress-interval', type=int, dest='progress_interval',
+                        help='Seconds between the progress reports of the searches of FASTQ input '\
+                                '(default: %(default)s).')
+    parser.add_argument('--profile', action='store_true',
+                        help='Profile each stage of the pipeline and each pool worker with cProfile, and trace '\
+                                'the external tools, in OUT_DIR/profile (default: %(default)s).')
 
     parser.set_defaults(
             meta = False,
@@ -95,6 +125,8 @@ def parse_args(argv):
             protein = False,
             tmp_dir = False,
             hmm_model = None,
+            register_model = None,
+            model_registry = '~/.fargene/models',
             long_score = None,
             meta_score = None,
             sensitive = False,
@@ -103,9 +135,15 @@ def parse_args(argv):
             orf_predict = True,
             min_orf_length = None,
             rerun = False,
+            reuse_hits = False,
             amino_dir = False,
             force = False,
             orf_finder = False,
+            external_orf_finder = False,
+            builtin_assembly_max_reads = 20000,
+            in_process_max_seqs = 200,
+            progress_interval = 60,
+            profile = False,
             out_dir = './fargene_output')
 
     options = parser.parse_args()
@@ -165,6 +203,8 @@ def main():
     utils.create_dir(options.hmm_out_dir)
     utils.create_dir(options.tmp_dir)
     utils.create_dir(options.final_gene_dir)
+    if options.profile:
+        profiling.enable('%s/profile' %(outdir))
 
     if options.meta:
         utils.create_dir(options.res_dir)
@@ -192,6 +232,9 @@ def main():
         numGenes = Results.retrievedContigs
         retrieved = 'retrieved contigs'
     logger.info('Done with pipeline')
+    profileDir = profiling.finish()
+    if profileDir:
+        logger.info('Profiles and the trace of the external tools can be found in %s' %(profileDir))
     
     msg = ('fARGene is done.\n'
            'Total number of {}: {}\n'
@@ -202,32 +245,18 @@ def main():
 
 def check_arguments(options, logger):
     predefined = False
-    model_location = path.dirname(__file__)+ '/models'
-    preDefinedModels = [
-            HmmModel("b1", model_location + "/B1.hmm", 135.8, float(0.2424)),
-            HmmModel("class_b_1_2", model_location + "/class_B_1_2.hmm", 127, float(0.3636)),
-            HmmModel("class_b_3", model_location + "/class_B_3.hmm", 103, float(0.30303)),
-            HmmModel("class_a", model_location + "/class_A.hmm", 105, float(0.2424)),
-            HmmModel("class_c", model_location + "/class_C.hmm", 248, float(0.30303)),
-            HmmModel("class_d_1", model_location + "/class_D_1.hmm", 182, float(0.3030)),
-            HmmModel("class_d_2", model_location + "/class_D_2.hmm", 234, float(0.3030)),
-            HmmModel("qnr", model_location + "/qnr.hmm", 150, float(0.51515)),
-            HmmModel("tet_efflux", model_location + "/tet_efflux.hmm", 400, float(0.3030)),
-            HmmModel("tet_rpg", model_location + "/tet_rpg.hmm", 471, float(0.4545)),
-            HmmModel("tet_enzyme", model_location + "/tet_enzyme.hmm", 300, float(0.4545))
-            ]
-
-    for model in preDefinedModels:
-        if (options.hmm_model).lower()== model.name:
-            options.hmm_model = model.path
-            if not options.long_score:
-                options.long_score = model.long_score
-            if not options.meta_score:
-                options.meta_score = model.meta_score
-            predefined = True
+    registry = ModelRegistry(options.model_registry)
+    model = registry.get(options.hmm_model)
+    if model:
+        options.hmm_model = registry.database(model)
+        if not options.long_score:
+            options.long_score = model.long_score
+        if not options.meta_score:
+            options.meta_score = model.meta_score
+        predefined = True
 
     if not path.isfile(options.hmm_model):
-        names = "\n".join([str(hmmModel.name) for hmmModel in preDefinedModels])
+        names = "\n".join([str(name) for name in registry.names()])
         msg = ("\nThe HMM file {0} could not be found.\n"
                  "Either provide a valid path to a HMM or choose "
                  "one of the following pre-defined models:\n{1}").format(
@@ -249,6 +278,15 @@ def check_arguments(options, logger):
             logger.critical(msg)
             logger.info('Exiting pipeline')
             exit()
+        if options.register_model:
+            try:
+                model = registry.register(options.register_model, options.hmm_model,
+                        options.long_score, options.meta_score)
+            except ValueError as e:
+                logger.critical(str(e))
+                logger.info('Exiting pipeline')
+                exit()
+            options.hmm_model = registry.database(model)
 
     topFile = options.infiles[0]
     if options.meta:
@@ -265,7 +303,10 @@ def check_arguments(options, logger):
             exit()              
 
     if not options.min_orf_length:
-        options.min_orf_length = utils.decide_min_ORF_length(options.hmm_model)
+        if model and model.length:
+            options.min_orf_length = round(0.9*model.length*3)
+        else:
+            options.min_orf_length = utils.decide_min_ORF_length(options.hmm_model)
 
     if options.rerun:
         fastqBaseName = path.splitext(path.basename(options.infiles[0]))[0]
@@ -294,9 +335,9 @@ def check_executables_in_path(options, logger):
     if options.meta:
         if not options.no_assembly:
             executables.append('spades.py')
-        if not options.no_quality_filtering:
+        if not options.no_quality_filtering and options.trim_galore:
             executables.append('trim_galore')
-        if options.orf_predict:
+        if options.orf_predict and options.external_orf_finder:
             executables.append('ORFfinder')
     else:
         if options.orf_predict:
@@ -322,48 +363,53 @@ def parse_fasta_input(options, Results, logger):
         hitFile = '%s/%s-positives.out' %(path.abspath(options.tmp_dir), fastaBaseName)
         elongated_fasta ='%s/%s-gene-elongated.fasta' %(path.abspath(options.tmp_dir), fastaBaseName)
         if options.protein:
-            utils.perform_hmmsearch(fastafile, options.hmm_model, hmmOut, options)
-            utils.classifier(hmmOut, hitFile, options)
-            hitDict = utils.create_dictionary(hitFile, options)
-            utils.retrieve_fasta(hitDict, fastafile, fastaOut, options)
+            with profiling.stage('search'):
+                utils.perform_hmmsearch(fastafile, options.hmm_model, hmmOut, options)
+            with profiling.stage('classify'):
+                Results.add(fastaBaseName, 'hits', utils.classifier(hmmOut, hitFile, options))
+            with profiling.stage('retrieve_genes'):
+                hitDict = utils.create_dictionary(hitFile, options)
+                Results.add(fastaBaseName, 'genes', *utils.retrieve_fasta(hitDict, fastafile, fastaOut, options))
         else: 
-            if options.store_peptides:
-                peptideFile ='%s/%s-amino.fasta' %(path.abspath(options.tmp_dir), fastaBaseName)
-                utils.translate_sequence(fastafile, peptideFile, options, frame)
-                logger.info('Performing hmmsearch')
-                utils.perform_hmmsearch(peptideFile, options.hmm_model, hmmOut, options)
-            else:
-                utils.translate_and_search(fastafile, options.hmm_model, hmmOut, options)
-            utils.classifier(hmmOut,hitFile,options)
-            hitDict = utils.create_dictionary(hitFile, options)
-            utils.retrieve_fasta(hitDict, fastafile, fastaOut, options)
+            with profiling.stage('search'):
+                if options.store_peptides:
+                    peptideFile ='%s/%s-amino.fasta' %(path.abspath(options.tmp_dir), fastaBaseName)
+                    utils.translate_sequence(fastafile, peptideFile, options, frame)
+                    logger.info('Performing hmmsearch')
+                    utils.perform_hmmsearch(peptideFile, options.hmm_model, hmmOut, options)
+                else:
+                    utils.translate_and_search(fastafile, options.hmm_model, hmmOut, options)
+            with profiling.stage('classify'):
+                Results.add(fastaBaseName, 'hits', utils.classifier(hmmOut,hitFile,options))
+            with profiling.stage('retrieve_genes'):
+                hitDict = utils.create_dictionary(hitFile, options)
+                Results.add(fastaBaseName, 'genes', *utils.retrieve_fasta(hitDict, fastafile, fastaOut, options))
             if not path.isfile(fastaOut):
                 logger.critical('Could not find file %s', fastaOut)
 #                exit()
             else:
-                utils.retrieve_surroundings(hitDict, fastafile, elongated_fasta)
-                if path.isfile(elongated_fasta):
-                    if not options.orf_finder:
-                        tmpORFfile = '%s/%s-long-orfs.fasta' %(options.tmp_dir,fastaBaseName)
-                        predict_orfs_prodigal(elongated_fasta, options.tmp_dir, tmpORFfile, options.min_orf_length) 
-                        orfFile = utils.retrieve_predicted_orfs(options, tmpORFfile)
+                with profiling.stage('orfs'):
+                    utils.retrieve_surroundings(hitDict, fastafile, elongated_fasta)
+                    if path.isfile(elongated_fasta):
+                        if not options.orf_finder:
+                            tmpORFfile = '%s/%s-long-orfs.fasta' %(options.tmp_dir,fastaBaseName)
+                            predict_orfs_prodigal(elongated_fasta, options.tmp_dir, tmpORFfile, options.min_orf_length) 
+                            orfFile, written = utils.retrieve_predicted_orfs(options, tmpORFfile)
+                            Results.add(fastaBaseName, 'orfs', *written)
+                        else:
+                            tmpORFfile = '%s/%s-long-orfs.fasta' %(options.tmp_dir, fastaBaseName)
+                            tmpORFAminoFile = find_orfs(elongated_fasta, tmpORFfile, options)
+                            orfFile, written = utils.retrieve_predicted_orfs(options, tmpORFfile, tmpORFAminoFile)
+                            Results.add(fastaBaseName, 'orfs', *written)
+                with profiling.stage('retrieve_peptides'):
+                    if options.store_peptides:
+                        options.retrieve_whole = False
+                        utils.retrieve_peptides(hitDict, peptideFile, aminoOut, options)
+                    elif options.reuse_hits:
+                        utils.retrieve_hit_peptides(hitDict, fastafile, aminoOut, options)
                     else:
-                        tmpORFfile = '%s/%s-long-orfs.fasta' %(options.tmp_dir, fastaBaseName)
-                        predict_orfs_orfFinder(elongated_fasta,options.tmp_dir, tmpORFfile, options.min_orf_length)
-                        orfFile = utils.retrieve_predicted_orfs(options, tmpORFfile)
-                if options.store_peptides:
-                    options.retrieve_whole = False
-                    utils.retrieve_peptides(hitDict, peptideFile, aminoOut, options)
-                else:
-                    tmpFastaOut = utils.make_fasta_unique(fastaOut, options)
-                    utils.retrieve_predicted_genes_as_amino(options, tmpFastaOut, aminoOut, frame='6')
-        Results.count_hits(hitFile)
-    if path.isfile(orfFile):                                      
-        if not options.orf_finder:                                
-            Results.count_orfs_genomes(orfFile)                   
-        else:                                                     
-            Results.predictedOrfs = Results.count_contigs(orfFile)
-                                                              
+                        tmpFastaOut = utils.make_fasta_unique(fastaOut, options)
+                        utils.retrieve_predicted_genes_as_amino(options, tmpFastaOut, aminoOut, frame='6')
     return orfFile
 
 
@@ -389,102 +435,148 @@ def parse_fastq_input(options, Results, logger):
 
     if not options.rerun:
         logger.info('Converting FASTQ to FASTA')
-        for fastqfile in options.infiles:
-            fastqBaseName = path.splitext(path.basename(fastqfile))[0]
-            fastafile = '%s/%s.fasta' %(path.abspath(options.tmp_dir), fastqBaseName)
-            if not path.isfile(fastafile):
-                utils.convert_fastq_to_fasta(fastqfile, fastafile)
-            elif path.getsize(fastafile) == 0:
-                utils.convert_fastq_to_fasta(fastqfile, fastafile)
-
-   
-    p = Pool(options.processes)
+        with profiling.stage('convert'):
+            for fastqfile in options.infiles:
+                fastqBaseName = path.splitext(path.basename(fastqfile))[0]
+                fastafile = '%s/%s.fasta' %(path.abspath(options.tmp_dir), fastqBaseName)
+                if not path.isfile(fastafile):
+                    utils.convert_fastq_to_fasta(fastqfile, fastafile)
+                elif path.getsize(fastafile) == 0:
+                    utils.convert_fastq_to_fasta(fastqfile, fastafile)
+
+
+    sizes = [file_size(searched_file(fastqfile, options)[0]) for fastqfile in options.infiles]
+    listener = ProgressListener(logger, sizes, options.progress_interval)
+    listener.start()
+    initializer, initargs = listener.initializer()
+    p = Pool(options.processes, initializer, initargs)
     
     logger.info('Processing and searching input files. This may take a while...')
 
     try:
-        bases_files = p.map(pooled_processing_fastq, itertools.izip((options.infiles), itertools.repeat(options)))  
+        with profiling.stage('search'):
+            bases_files = p.map(pooled_processing_fastq, itertools.izip((options.infiles), itertools.repeat(options)))  
     except KeyboardInterrupt:
         logger.warning('\nCaught a KeyboardInterrupt. Terminating...')
         p.terminate()
         p.join()
+        listener.stop()
         exit()
+    p.close()
+    p.join()
+    listener.stop()
         
     fastqDict = defaultdict(list)
-    transformer = Transformer()
-    transformer.find_file_difference(options.infiles[0], options.infiles[1])
-    transformer.find_header_endings(options.infiles[0], options.infiles[1])
-    transformer.verify_transform_is_working(options.infiles[0],options.infiles[1])
+    with profiling.stage('retrieve_hits'):
+        transformer = Transformer()
+        transformer.find_file_difference(options.infiles[0], options.infiles[1])
+        transformer.find_header_endings(options.infiles[0], options.infiles[1])
+        transformer.verify_transform_is_working(options.infiles[0],options.infiles[1])
 
-    logger.info('Retrieving hits from input files.')
+        logger.info('Retrieving hits from input files.')
     
-    for fastqbase_hitfile in bases_files:
-        fastqDict = utils.add_hits_to_fastq_dictionary(fastqbase_hitfile[1],
-                fastqDict, fastqbase_hitfile[0], options, transformer)
+        for fastqbase_hitfile in bases_files:
+            Results.add(fastqbase_hitfile[0], 'hits', fastqbase_hitfile[2])
+            fastqDict = utils.add_hits_to_fastq_dictionary(fastqbase_hitfile[1],
+                    fastqDict, fastqbase_hitfile[0], options, transformer)
     logger.info('Retrieving fastqfiles')
-    utils.retrieve_paired_end_fastq(fastqDict, fastqPath, options, transformer) 
+    with profiling.stage('retrieve_reads'):
+        for sample, numReads, numBases in utils.retrieve_paired_end_fastq(fastqDict, fastqPath, options, transformer):
+            Results.add(sample, 'retrieved_reads', numReads, numBases)
     
-    if not options.no_quality_filtering:
+    if not options.no_quality_filtering and options.trim_galore:
         logger.info('Performing quality control')
-        utils.quality(fastqDict.keys(), options)
+        with profiling.stage('quality'):
+            utils.quality(fastqDict.keys(), options)
     logger.info('Done')
     if not options.no_assembly:
-        logger.info('Running assembly using SPAdes')
-        utils.run_spades(options)
+        logger.info('Running assembly')
+        with profiling.stage('assembly'):
+            utils.run_spades(options)
         logger.info('Done')
         logger.info('Running retrieval of assembled genes.')
-        retrievedContigs,hits = utils.retrieve_assembled_genes(options)
+        with profiling.stage('retrieve_contigs'):
+            retrievedContigs,hits,written = utils.retrieve_assembled_genes(options)
+            Results.add('assembly', 'contigs', *written)
         if path.isfile(retrievedContigs):
             logger.info('Predicting ORFS.')
             elongatedFasta ='%s/%s-gene-elongated.fasta' %(path.abspath(options.tmp_dir), path.basename(retrievedContigs).rpartition('.')[0])
             orfFile = '%s/%s-long-orfs.fasta' %(options.tmp_dir, path.basename(retrievedContigs).rpartition('.')[0])
-            utils.retrieve_surroundings(hits, retrievedContigs, elongatedFasta)
-            predict_orfs_orfFinder(elongatedFasta, options.tmp_dir, orfFile, options.min_orf_length) 
-            retrievedOrfs = utils.retrieve_predicted_orfs(options, orfFile)
-            Results.predictedOrfs = Results.count_contigs(retrievedOrfs)
-        Results.retrievedContigs = Results.count_contigs(retrievedContigs)
+            with profiling.stage('orfs'):
+                utils.retrieve_surroundings(hits, retrievedContigs, elongatedFasta)
+                orfAminoFile = find_orfs(elongatedFasta, orfFile, options)
+                retrievedOrfs, written = utils.retrieve_predicted_orfs(options, orfFile, orfAminoFile)
+                Results.add('assembly', 'orfs', *written)
+
+def find_orfs(elongatedFasta, orfFile, options):
+    '''
+    ORF prediction with ORFfinder semantics. Returns the file with the
+    translated ORFs if the built-in ORF finder was used, otherwise None.
+    '''
+    if options.external_orf_finder:
+        predict_orfs_orfFinder(elongatedFasta, options.tmp_dir, orfFile, options.min_orf_length)
+        return None
+    orfAminoFile = '%s-amino.fasta' %(orfFile.rpartition('.')[0])
+    predict_orfs_native(elongatedFasta, orfFile, options.min_orf_length, orfAminoFile)
+    return orfAminoFile
+
+def searched_file(fastqfile, options):
+    '''
+    The file that the search of fastqfile reads: the stored peptides of a
+    rerun, if they exist, or else the sequences in FASTA. The second value
+    tells if it is peptides.
+    '''
+    fastqBaseName = path.splitext(path.basename(fastqfile))[0]
+    if options.rerun:
+        peptideFile ='%s/%s-amino.fasta' %(options.amino_dir, fastqBaseName)
+        if path.isfile(peptideFile):
+            return peptideFile, True
+        return '%s/%s.fasta' %(options.fasta_dir, fastqBaseName), False
+    return '%s/%s.fasta' %(path.abspath(options.tmp_dir), fastqBaseName), False
 
+def file_size(filename):
+    if path.isfile(filename):
+        return path.getsize(filename)
+    return 0
+
+@profiling.worker('search')
 def pooled_processing_fastq(fastqfile_options):
-    # Cannot send logger object to functions run in a multiprocessing Pool.
+    # Cannot send logger object to functions run in a multiprocessing Pool,
+    # the records are sent to the main process (see progress.ProgressListener).
     logger = logging.getLogger(__name__ + '.pooled_processing_fastq') 
-    print(logger.handlers)
     try:
         fastqfile, options = fastqfile_options[0], fastqfile_options[1]
         modelName = path.splitext(path.basename(options.hmm_model))[0]
         fastqBaseName = path.splitext(path.basename(fastqfile))[0]
         fastqFilesBaseName = path.basename(fastqfile)
-        fastafile = '%s/%s.fasta' %(path.abspath(options.tmp_dir), fastqBaseName)
+        fastafile, isPeptides = searched_file(fastqfile, options)
         hmmOut = '%s/%s-%s-hmmsearched.out' %(path.abspath(options.hmm_out_dir), fastqBaseName, modelName)
         hitFile = '%s/%s-positives.out' %(path.abspath(options.tmp_dir), fastqBaseName)
-        logger.info('Converting fastq to fasta')
-        if options.rerun:
-            peptideFile ='%s/%s-amino.fasta' %(options.amino_dir, fastqBaseName)
-            if path.isfile(peptideFile):
-                logger.info('Performing hmmsearch')
-                utils.perform_hmmsearch(peptideFile, options.hmm_model, hmmOut, options)
-            else:
-                fastafile = '%s/%s.fasta' %(options.fasta_dir, fastqBaseName)
-                logger.info('Translating and searching')
-                utils.translate_and_search(fastafile, options.hmm_model, hmmOut, options)
-
-        elif options.store_peptides:
+        searchPeptides = options.rerun and isPeptides
+        storePeptides = options.store_peptides and not options.rerun
+        # Only translate_and_search reports the bytes consumed, not hmmsearch of a peptide file
+        progress = InputProgress(fastqFilesBaseName, file_size(fastafile), options.progress_interval, logger,
+                not (searchPeptides or storePeptides))
+        if searchPeptides:
+            logger.info('Performing hmmsearch')
+            utils.perform_hmmsearch(fastafile, options.hmm_model, hmmOut, options)
+        elif storePeptides:
             logger.info('Translating')
             peptideFile ='%s/%s-amino.fasta' %(path.abspath(options.tmp_dir), fastqBaseName)
             frame = '6'
-            if not options.rerun:
-                utils.translate_sequence(fastafile, peptideFile, options, frame)
+            utils.translate_sequence(fastafile, peptideFile, options, frame)
             logger.info('Performing hmmsearch')
             utils.perform_hmmsearch(peptideFile, options.hmm_model, hmmOut, options)
         else:
             logger.info('Translating and searching')
-            utils.translate_and_search(fastafile, options.hmm_model, hmmOut, options)
+            utils.translate_and_search(fastafile, options.hmm_model, hmmOut, options, progress)
 
         logger.info('Start to classify')
-        utils.classifier(hmmOut, hitFile, options)
+        numHits = utils.classifier(hmmOut, hitFile, options)
         logger.info('Translating, searching, and classification done')
+        progress.done(numHits)
         
-        fastqPath = path.dirname(path.abspath(fastqfile)) # Assuming the path is the same to every input fastqfile
-        return fastqFilesBaseName, hitFile
+        return fastqFilesBaseName, hitFile, numHits
     except KeyboardInterrupt:
         raise KeyboardInterruptError()
 
@@ -1,51 +1,99 @@
 import argparse
 import glob
+import gzip
+import json
+import logging
+from collections import OrderedDict
+from itertools import imap
+from multiprocessing import Pool
+from os.path import basename
 
-from utils import read_fasta
+from utils import read_fasta, fasta_shards
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-i','--input_files',required=True)
     parser.add_argument('--length',type=int,default=600)
     parser.add_argument('-o','--output',default='longsequences.fasta')
-    parser.add_argument('--cut_stars',default=False,action='store_true')
+    parser.add_argument('--cut_stars','--cut-stars',dest='cut_stars',default=False,action='store_true')
+    parser.add_argument('-p','--processes',type=int,default=1,
+                        help='The number of files (or parts of large files) that are filtered in parallel.')
+    parser.add_argument('--shard_size',type=int,default=64,
+                        help='Files larger than this many MB are split into parts that are filtered in parallel.')
+    parser.add_argument('--compress',default=False,action='store_true',
+                        help='Write the output gzip compressed (also done if the output ends with .gz).')
+    parser.add_argument('--summary',
+                        help='The JSON file with the number of sequences and long sequences per input file '\
+                                '(default: the output file name with .summary.json).')
 
     args = parser.parse_args()
-    files = glob.glob(args.input_files)
-    outputfile = open(args.output,'w')
-    pick_long_reads(files,args.length,outputfile,args)
+    if args.shard_size < 1:
+        parser.error('argument --shard_size: must be at least 1 (MB), got %s' %(str(args.shard_size)))
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', level=logging.INFO)
+    files = sorted(glob.glob(args.input_files))
+    if args.compress or args.output.endswith('.gz'):
+        outputfile = gzip.open(args.output,'wb')
+    else:
+        outputfile = open(args.output,'w')
+    summary = pick_long_reads(files,args.length,outputfile,args)
+    summaryfile = args.summary or '%s.summary.json' %(args.output)
+    with open(summaryfile,'w') as f:
+        json.dump(summary,f,indent=4)
+    logging.info('Searched %s sequences, %s of them were longer than %s. Summary per file in %s' \
+            %(summary['sequences'],summary['passed'],args.length,summaryfile))
 
 def pick_long_reads(files,length,outputfile,args):
-    totalcount = 0
-    passedcount = 0
-
-    for fastafile in files:
-        for header, seq in read_fasta(fastafile, False):
-            totalcount = totalcount + 1
-            if len(seq) >= length:
-                longread = True
-                if args.cut_stars:
-                    seq = seq.split('*')
-                    tmp_length = 0
-                    for i in range(0,len(seq)):
-                        if len(seq[i]) > tmp_length:
-                            tmp_length = len(seq[i])
-                            j = i
-                    if tmp_length < length:
-                        print header, tmp_length
-                        longread = False
-                    seq = seq[j]
-                if longread:
-                    passedcount = passedcount + 1
-                    if header.startswith("Contig"):
-                        filename = (fastafile.split("/")[-1]).split(".")[0]
-                        header = filename + "_" + header
-                    outputfile.write('>%s\n%s\n' %(header,seq))
+    '''
+    Writes the sequences of files that are at least length long (for
+    protein sequences with cut_stars, the longest part between stop codons)
+    to outputfile. The files, or parts of files larger than the shard size,
+    are filtered by a pool of processes, and written in the order of the
+    files, so the output does not depend on the number of processes.
+    Returns the number of sequences and long sequences per file.
+    '''
+    jobs = [(fastafile, start, end, length, args.cut_stars) for fastafile in files \
+            for start, end in fasta_shards(fastafile, args.shard_size * 2**20)]
+    if args.processes > 1:
+        pool = Pool(args.processes)
+        results = pool.imap(pick_from_shard, jobs)
+    else:
+        pool = None
+        results = imap(pick_from_shard, jobs)
 
+    counts = OrderedDict((fastafile, [0, 0]) for fastafile in files)
+    for fastafile, records, totalcount, passedcount in results:
+        outputfile.write(records)
+        counts[fastafile][0] += totalcount
+        counts[fastafile][1] += passedcount
     outputfile.close()
-    print 'searched %s sequences.\n \
-            %s of them were longer than %s' \
-            %(totalcount,passedcount,length)
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    return OrderedDict([('length', length),
+            ('sequences', sum([totalcount for totalcount, passedcount in counts.values()])),
+            ('passed', sum([passedcount for totalcount, passedcount in counts.values()])),
+            ('files', [OrderedDict([('file', fastafile), ('sequences', totalcount), ('passed', passedcount)]) \
+                    for fastafile, (totalcount, passedcount) in counts.items()])])
+
+def pick_from_shard(job):
+    ''' Returns the long sequences of a byte range of a file in FASTA format, and the counts. '''
+    fastafile, start, end, length, cut_stars = job
+    filename = basename(fastafile).split(".")[0]
+    records = []
+    totalcount = 0
+    for header, seq in read_fasta(fastafile, False, start, end):
+        totalcount += 1
+        if len(seq) < length:
+            continue
+        if cut_stars and '*' in seq:
+            seq = max(seq.split('*'), key=len)
+            if len(seq) < length:
+                continue
+        if header.startswith("Contig"):
+            header = filename + "_" + header
+        records.append('>%s\n%s\n' %(header,seq))
+    return fastafile, ''.join(records), totalcount, len(records)
 
 if __name__=='__main__':
     main()
@@ -3,7 +3,9 @@ import shlex
 import subprocess as sp
 import logging
 
-from utils import read_fasta
+import numpy as np
+
+from utils import read_fasta, translate_nucleotides, reverse_complement
 
 def run_prodigal(infile,outfile):
     'prodigal -i infile -f gff -o genes.gff'
@@ -47,11 +49,6 @@ def retrieve_orfs(orfs,fastaFile,orfFile):
                 orfFile.write('>%s\n%s\n' %(header,rev_seq))
 
 
-def reverse_complement(sequence):
-    comp = {'A': 'T', 'T': 'A', 'G': 'C', 'C': 'G',\
-            'a': 't', 't': 'a', 'g': 'c', 'c': 'g'}
-    return ''.join(reversed([comp.get(base,base) for base in sequence]))
-    
 def predict_orfs_prodigal(infile,outdir,orfFile,minLength):
     basename = path.basename(infile).rpartition('.')[0]
     outdir = path.abspath(outdir)
@@ -102,3 +99,106 @@ def run_ORFFinder(infile,orfFile):
         logging.error("OS error ({0}) : {1}\nCan't find ORFfinder in path".format(e.errno,e.strerror))
         print "Can't find ORFfinder in path"
 
+NUCLEOTIDE_CODES = np.full(256, 4, dtype=np.int8)
+for i, base in enumerate('ACGT'):
+    NUCLEOTIDE_CODES[ord(base)] = i
+    NUCLEOTIDE_CODES[ord(base.lower())] = i
+
+def codon_lookup(codons):
+    lookup = np.zeros(125, dtype=bool)
+    for codon in codons:
+        lookup[25*'ACGT'.index(codon[0]) + 5*'ACGT'.index(codon[1]) + 'ACGT'.index(codon[2])] = True
+    return lookup
+
+STOP_CODONS = codon_lookup(['TAA','TAG','TGA'])
+# ATG and the alternative initiation codons of the bacterial table (11), ORFfinder -s 1
+START_CODONS = codon_lookup(['ATG','GTG','TTG','CTG','ATT','ATC','ATA'])
+COMMON_START_CODONS = codon_lookup(['ATG','GTG','TTG'])
+
+def find_orfs_in_strand(seq, minLength, startCodons, partial, commonLength=None):
+    '''
+    Returns (start, end) (0-based, end exclusive) of the ORFs in the three
+    forward frames of seq. An ORF runs from the first start codon after a
+    stop to (and including) the next stop codon. If partial, ORFs running
+    off the 3' end of the sequence are also reported. The start is moved
+    to the first common start codon if at least commonLength (default
+    minLength) nucleotides remain.
+    '''
+    if commonLength is None:
+        commonLength = minLength
+    orfs = []
+    if len(seq) < 3:
+        return orfs
+    bases = NUCLEOTIDE_CODES[np.frombuffer(seq, dtype=np.uint8)].astype(np.int16)
+    codons = 25*bases[:-2] + 5*bases[1:-1] + bases[2:]
+    for frame in range(0,3):
+        frameCodons = codons[frame::3]
+        numCodons = len(frameCodons)
+        stops = np.flatnonzero(STOP_CODONS[frameCodons])
+        starts = np.flatnonzero(startCodons[frameCodons])
+        commonStarts = np.flatnonzero(COMMON_START_CODONS[frameCodons])
+        if len(starts) == 0:
+            continue
+        segmentStarts = np.concatenate(([0], stops + 1))
+        segmentEnds = np.concatenate((stops + 1, [numCodons]))
+        if not partial:
+            segmentStarts, segmentEnds = segmentStarts[:-1], segmentEnds[:-1]
+        firstStart = np.searchsorted(starts, segmentStarts)
+        hasStart = firstStart < len(starts)
+        orfStarts = starts[np.minimum(firstStart, len(starts) - 1)]
+        hasStart &= orfStarts < segmentEnds
+        hasStart &= 3*(segmentEnds - orfStarts) >= minLength
+        orfStarts, orfEnds = orfStarts[hasStart], segmentEnds[hasStart]
+        # Move the start to the first common start codon if the ORF is still long enough
+        if len(commonStarts) > 0:
+            firstCommon = np.searchsorted(commonStarts, orfStarts)
+            commonCandidates = commonStarts[np.minimum(firstCommon, len(commonStarts) - 1)]
+            useCommon = (firstCommon < len(commonStarts)) & (3*(orfEnds - commonCandidates) >= commonLength)
+            orfStarts = np.where(useCommon, commonCandidates, orfStarts)
+        for start, end in zip(orfStarts, orfEnds):
+            orfs.append((frame + 3*int(start), frame + 3*int(end)))
+    return orfs
+
+def find_orfs(seq, minLength, alternativeStarts=True, partial=True, commonLength=None):
+    '''
+    Six frame ORF calling with the same semantics as
+    ORFfinder -ml minLength -s 1 -g 11 followed by
+    find_common_startcodon(seq, commonLength) (default minLength).
+    Returns a list of (start, end, strand) in 1-based coordinates of seq.
+    '''
+    seq = seq.upper()
+    startCodons = START_CODONS if alternativeStarts else codon_lookup(['ATG'])
+    orfs = []
+    for start, end in find_orfs_in_strand(seq, minLength, startCodons, partial, commonLength):
+        orfs.append((start + 1, end, '+'))
+    nlen = len(seq)
+    for start, end in find_orfs_in_strand(reverse_complement(seq), minLength, startCodons, partial, commonLength):
+        orfs.append((nlen - start, nlen - end + 1, '-'))
+    return orfs
+
+def predict_orfs_native(infile,orfFile,minLength,orfAminoFile=None):
+    '''
+    Native replacement for predict_orfs_orfFinder. Writes the ORFs with
+    ORFfinder style headers and, if orfAminoFile is given, their
+    translations with the headers transeq -frame=1 would give. As with
+    ORFfinder -ml 200 and parse_orfs, the ORFs are at least 200 and more
+    than minLength nucleotides long, and their start is moved to the first
+    common start codon if at least minLength nucleotides remain.
+    '''
+    orfOut = open(orfFile,'w')
+    aminoOut = open(orfAminoFile,'w') if orfAminoFile else None
+    for header, seq in read_fasta(infile,False):
+        seqId = header.split()[0]
+        minOrfLength = max(200, int(minLength) + 1)
+        for i, (start, end, strand) in enumerate(find_orfs(seq, minOrfLength, commonLength=minLength)):
+            if strand == '+':
+                orf = seq[start-1:end]
+            else:
+                orf = reverse_complement(seq[end-1:start])
+            orfId = 'lcl|ORF%s_%s:%s:%s' %(str(i+1),seqId,str(start),str(end))
+            orfOut.write('>%s\n%s\n' %(orfId,orf))
+            if aminoOut:
+                aminoOut.write('>%s_1\n%s\n' %(orfId,translate_nucleotides(orf)))
+    orfOut.close()
+    if aminoOut:
+        aminoOut.close()
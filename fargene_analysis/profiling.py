@@ -0,0 +1,143 @@
+import cProfile
+import glob
+import json
+import os
+import pstats
+import shutil
+import subprocess
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from os import path
+
+_Popen = subprocess.Popen
+_profile_dir = None
+_stages = OrderedDict()
+_workers = {}
+_trace = None
+
+def enable(profile_dir):
+    '''
+    Turns on the profiling of the stages and pool workers, with the
+    statistics and the trace written to profile_dir. From here on every
+    subprocess (also those of the pool workers, which are forked later)
+    is started as a TracedPopen.
+    '''
+    global _profile_dir
+    _profile_dir = path.abspath(profile_dir)
+    if path.isdir(_profile_dir):
+        shutil.rmtree(_profile_dir)
+    os.makedirs(_profile_dir)
+    subprocess.Popen = TracedPopen
+
+def enabled():
+    return _profile_dir is not None
+
+def add_event(event):
+    ''' Appends a trace event to the trace file of this process. '''
+    global _trace
+    if _trace is None or _trace[0] != os.getpid():
+        # A forked worker writes its own file
+        _trace = (os.getpid(), open(path.join(_profile_dir, 'trace-%s.part' %(str(os.getpid()))), 'a'))
+    _trace[1].write(json.dumps(event) + '\n')
+    _trace[1].flush()
+
+def add_span(name, category, start, end, tid=0, args=None):
+    ''' A complete event (ph X) of the Chrome trace event format, in microseconds. '''
+    add_event({'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(), 'tid': tid,
+        'ts': int(start * 1e6), 'dur': int((end - start) * 1e6), 'args': args or {}})
+
+class TracedPopen(_Popen):
+    '''
+    A subprocess.Popen that adds the span of the process (command, start,
+    end and exit code) to the trace. The end is when the exit status is
+    collected, by wait(), communicate(), poll() or subprocess.call().
+    '''
+
+    def __init__(self, args, *popenargs, **kwargs):
+        self.trace_command = args if isinstance(args, basestring) else ' '.join(args)
+        self.trace_start = time.time()
+        _Popen.__init__(self, args, *popenargs, **kwargs)
+
+    def _handle_exitstatus(self, *args, **kwargs):
+        _Popen._handle_exitstatus(self, *args, **kwargs)
+        add_span(path.basename(self.trace_command.split()[0]), 'subprocess', self.trace_start, time.time(),
+                self.pid, {'command': self.trace_command, 'exit_code': self.returncode})
+
+@contextmanager
+def stage(name):
+    '''
+    Profiles the block as (part of) the pipeline stage name. The stages
+    must not be nested, since a thread has one profiler at a time.
+    '''
+    if not enabled():
+        yield
+        return
+    profile = _stages.setdefault(name, cProfile.Profile())
+    start = time.time()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        add_span(name, 'stage', start, time.time())
+
+def worker(name):
+    '''
+    Decorates a function run by pool workers, so that each worker profiles
+    its tasks in stage name, and writes the statistics after every task
+    (the pool gives the workers no chance to do it when they exit).
+    '''
+    def decorate(function):
+        @wraps(function)
+        def run(*args):
+            if not enabled():
+                return function(*args)
+            key = (name, os.getpid())
+            if key not in _workers:
+                _workers[key] = cProfile.Profile()
+            start = time.time()
+            _workers[key].enable()
+            try:
+                return function(*args)
+            finally:
+                _workers[key].disable()
+                add_span(name, 'worker', start, time.time())
+                _workers[key].dump_stats(path.join(_profile_dir, '%s-worker-%s.pstats' %(name, str(os.getpid()))))
+        return run
+    return decorate
+
+def finish():
+    '''
+    Writes the statistics of each stage (STAGE.pstats), merges them with
+    those of the workers into merged.pstats and merged_stats.txt (sorted by
+    cumulative time), and merges the trace files of all processes into
+    trace.json, which can be opened in chrome://tracing or Perfetto.
+    Returns the profile directory, or None if profiling is not enabled.
+    '''
+    if not enabled():
+        return None
+    for name, profile in _stages.items():
+        profile.dump_stats(path.join(_profile_dir, '%s.pstats' %(name)))
+    statsFiles = sorted(glob.glob(path.join(_profile_dir, '*.pstats')))
+    if statsFiles:
+        stats = pstats.Stats(*statsFiles)
+        stats.dump_stats(path.join(_profile_dir, 'merged.pstats'))
+        with open(path.join(_profile_dir, 'merged_stats.txt'), 'w') as f:
+            stats.stream = f
+            stats.sort_stats('cumulative').print_stats()
+
+    if _trace is not None and _trace[0] == os.getpid():
+        _trace[1].close()
+    events = []
+    for traceFile in sorted(glob.glob(path.join(_profile_dir, 'trace-*.part'))):
+        with open(traceFile) as f:
+            events.extend([json.loads(line) for line in f])
+        os.remove(traceFile)
+    for pid in sorted(set([event['pid'] for event in events])):
+        processName = 'fargene' if pid == os.getpid() else 'worker %s' %(str(pid))
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': processName}})
+    with open(path.join(_profile_dir, 'trace.json'), 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    return _profile_dir
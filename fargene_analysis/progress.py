@@ -0,0 +1,188 @@
+import logging
+import threading
+import time
+from multiprocessing import Queue
+from Queue import Empty
+
+STALL_INTERVALS = 3
+
+class QueueHandler(logging.Handler):
+    '''
+    Sends the log records of a pool worker to the main process, where a
+    ProgressListener writes them with the configured handlers (Python 2
+    has no logging.handlers.QueueHandler).
+    '''
+
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+
+    def emit(self, record):
+        try:
+            # The arguments and traceback may not be picklable
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                # Caches the formatted traceback in record.exc_text
+                self.format(record)
+                record.exc_info = None
+            self.queue.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+
+def init_worker_logging(queue, name, level):
+    '''
+    Pool initializer that sends everything the worker logs to the queue,
+    instead of to the (forked) handlers of the main process.
+    '''
+    for logger in [logging.getLogger(name), logging.getLogger()]:
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(queue))
+    root.setLevel(level)
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%d:%02d:%02d' %(hours, minutes, seconds)
+
+def format_size(numBytes):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if numBytes < 1024 or unit == 'GB':
+            break
+        numBytes = numBytes / 1024.0
+    return '%.1f %s' %(numBytes, unit)
+
+def remaining_time(elapsed, fraction):
+    if fraction <= 0:
+        return 'unknown'
+    return format_duration(elapsed * (1 - fraction) / fraction)
+
+class InputProgress(object):
+    '''
+    Counts the bytes and reads of an input file as a worker consumes it,
+    and logs a progress event (a record with a progress attribute, which
+    the ProgressListener adds to the total) at most every interval seconds.
+    Inputs that are not streamed (reporting False) only report their start
+    and end.
+    '''
+
+    def __init__(self, name, size, interval, logger=None, reporting=True):
+        self.name = name
+        self.size = size
+        self.interval = interval
+        self.reporting = reporting
+        self.logger = logger or logging.getLogger(__name__)
+        self.bytes = 0
+        self.reads = 0
+        self.start = time.time()
+        self.last = self.start
+        self.event('started')
+
+    def update(self, numBytes, reads):
+        self.bytes += numBytes
+        self.reads += reads
+        if time.time() - self.last >= self.interval:
+            self.event('running')
+
+    def done(self, hits):
+        self.bytes = self.size
+        self.event('done', hits)
+
+    def event(self, state, hits=None):
+        self.last = time.time()
+        elapsed = self.last - self.start
+        fraction = float(self.bytes) / self.size if self.size else 1.0
+        readRate = self.reads / elapsed if elapsed > 0 else 0.0
+        if state == 'started' and not self.reporting:
+            msg = 'Started %s (%s), no progress is reported until it is done' %(self.name, format_size(self.size))
+        elif state == 'started':
+            msg = 'Started %s (%s)' %(self.name, format_size(self.size))
+        elif state == 'done':
+            msg = 'Done with %s in %s, %s hits' %(self.name, format_duration(elapsed), str(hits))
+        else:
+            msg = '%s: %.1f%% of %s, %s reads (%.0f reads/s), about %s remaining' \
+                    %(self.name, 100 * fraction, format_size(self.size), str(self.reads), readRate,
+                            remaining_time(elapsed, fraction))
+        self.logger.info(msg, extra={'progress': {'input': self.name, 'state': state, 'reporting': self.reporting,
+            'bytes': self.bytes, 'size': self.size, 'reads': self.reads, 'hits': hits}})
+
+class ProgressListener(threading.Thread):
+    '''
+    Runs in the main process while the pool works: writes the records of
+    the workers with the handlers of logger, and every interval seconds
+    logs the progress of all inputs together (bytes consumed, reads/s,
+    hits so far and the estimated time remaining). Inputs that report
+    their progress, but have sent no progress event for several intervals,
+    are reported as stalled.
+    '''
+
+    def __init__(self, logger, sizes, interval):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.queue = Queue()
+        self.logger = logger
+        self.sizes = sizes
+        self.interval = interval
+        self.inputs = {}
+        self.start_time = time.time()
+        self.last_report = self.start_time
+
+    def initializer(self):
+        ''' The initializer and its arguments for the Pool of the workers. '''
+        return init_worker_logging, (self.queue, self.logger.name, self.logger.getEffectiveLevel())
+
+    def run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=self.interval)
+            except Empty:
+                record = False
+            if record is None:
+                break
+            if record:
+                self.handle(record)
+                if hasattr(record, 'progress'):
+                    self.update(record.progress)
+            self.check_stalled()
+            if time.time() - self.last_report >= self.interval:
+                self.report()
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+        self.report()
+
+    def handle(self, record):
+        for handler in self.logger.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def update(self, progress):
+        progress['time'] = time.time()
+        self.inputs[progress['input']] = progress
+
+    def check_stalled(self):
+        now = time.time()
+        for progress in self.inputs.values():
+            if not progress['reporting'] or progress['state'] == 'done':
+                continue
+            if now - progress['time'] >= STALL_INTERVALS * self.interval:
+                self.logger.warning('No progress on %s for %s' \
+                        %(progress['input'], format_duration(now - progress['time'])))
+                progress['time'] = now
+
+    def report(self):
+        self.last_report = time.time()
+        elapsed = self.last_report - self.start_time
+        total = sum(self.sizes)
+        consumed = sum([progress['bytes'] for progress in self.inputs.values()])
+        reads = sum([progress['reads'] for progress in self.inputs.values()])
+        hits = sum([progress['hits'] for progress in self.inputs.values() if progress['hits'] is not None])
+        done = len([progress for progress in self.inputs.values() if progress['state'] == 'done'])
+        fraction = float(consumed) / total if total else 0.0
+        self.logger.info('Progress: %.1f%% of %s searched, %s of %s files done, %.0f reads/s, '\
+                '%s hits so far, about %s remaining' \
+                %(100 * fraction, format_size(total), str(done), str(len(self.sizes)), reads / elapsed,
+                        str(hits), remaining_time(elapsed, fraction)))
@@ -0,0 +1,103 @@
+import itertools
+
+ILLUMINA_ADAPTER = 'AGATCGGAAGAGC'
+
+def read_fastq_records(fastq):
+    '''
+    Yields (header, seq, plus, qual) from an open FASTQ handle (four lines per record).
+    '''
+    while True:
+        header = fastq.readline()
+        if not header:
+            break
+        seq = fastq.readline().rstrip()
+        plus = fastq.readline().rstrip()
+        qual = fastq.readline().rstrip()
+        yield header.rstrip(), seq, plus, qual
+
+def write_fastq_record(outfile, record):
+    outfile.write('%s\n%s\n%s\n%s\n' %record)
+
+def quality_trim_index(qual, cutoff, base=33):
+    '''
+    Returns the position the read should be cut at when trimming low
+    quality bases from the 3' end. Same algorithm as cutadapt
+    (and thereby Trim Galore!) use for -q.
+    '''
+    s = 0
+    maxQual = 0
+    maxIndex = len(qual)
+    for i in reversed(xrange(len(qual))):
+        s = s + cutoff - (ord(qual[i]) - base)
+        if s < 0:
+            break
+        if s > maxQual:
+            maxQual = s
+            maxIndex = i
+    return maxIndex
+
+def adapter_trim_index(seq, adapter, errorRate, minOverlap):
+    '''
+    Returns the leftmost position where the (possibly partial) adapter
+    matches the 3' end of the read with at most errorRate mismatches
+    per aligned base. Indels are not considered.
+    '''
+    seqLength = len(seq)
+    for pos in xrange(0, seqLength - minOverlap + 1):
+        overlap = min(len(adapter), seqLength - pos)
+        maxErrors = int(overlap * errorRate)
+        errors = 0
+        for a, b in itertools.izip(seq[pos:pos+overlap], adapter):
+            if a != b:
+                errors = errors + 1
+                if errors > maxErrors:
+                    break
+        if errors <= maxErrors:
+            return pos
+    return seqLength
+
+def trim_record(record, cutoff, adapter, errorRate, minOverlap):
+    header, seq, plus, qual = record
+    end = quality_trim_index(qual, cutoff)
+    seq, qual = seq[:end], qual[:end]
+    end = adapter_trim_index(seq.upper(), adapter, errorRate, minOverlap)
+    return header, seq[:end], plus, qual[:end]
+
+def trim_paired_reads(reads1, reads2, trimmedOutfiles, rawOutfiles=None, cutoff=30,
+        adapter=ILLUMINA_ADAPTER, errorRate=0.1, minOverlap=1, minLength=20):
+    '''
+    Quality and adapter trimming of paired-end reads, mimicking
+    trim_galore --paired -q 30 with the default Illumina adapter.
+    Pairs where either read gets shorter than minLength are discarded.
+    Untrimmed records are written to rawOutfiles if given.
+    Returns the number of read pairs read and the number that passed.
+    Raises IOError if one of the files has more reads than the other.
+    '''
+    trimmed = [open(outfile, 'w') for outfile in trimmedOutfiles]
+    raw = [open(outfile, 'w') for outfile in rawOutfiles] if rawOutfiles else None
+    numPairs = 0
+    numPassed = 0
+    try:
+        for record1, record2 in itertools.izip_longest(reads1, reads2):
+            if record1 is None or record2 is None:
+                raise IOError('The paired reads differ in number, %s pairs were read before the reads of '\
+                        'one file ended' %(str(numPairs)))
+            numPairs = numPairs + 1
+            if raw:
+                write_fastq_record(raw[0], record1)
+                write_fastq_record(raw[1], record2)
+            record1 = trim_record(record1, cutoff, adapter, errorRate, minOverlap)
+            record2 = trim_record(record2, cutoff, adapter, errorRate, minOverlap)
+            if len(record1[1]) >= minLength and len(record2[1]) >= minLength:
+                numPassed = numPassed + 1
+                write_fastq_record(trimmed[0], record1)
+                write_fastq_record(trimmed[1], record2)
+    finally:
+        for f in trimmed + (raw or []):
+            f.close()
+    return numPairs, numPassed
+
+def trim_paired_fastq(fastqfiles, trimmedOutfiles, cutoff=30):
+    with open(fastqfiles[0]) as f1, open(fastqfiles[1]) as f2:
+        return trim_paired_reads(read_fastq_records(f1), read_fastq_records(f2),
+                trimmedOutfiles, cutoff=cutoff)
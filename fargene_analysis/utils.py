@@ -7,11 +7,17 @@ from sys import argv
 from collections import defaultdict
 from os.path import basename, splitext, abspath, isfile, isdir, getsize
 from os import makedirs
+import os
 from multiprocessing import Pool, cpu_count
 import itertools
 import glob
 import logging
 
+from assemble_reads import assemble_reads, count_reads
+from trim_reads import trim_paired_reads, read_fastq_records, write_fastq_record
+from ProfileHmm import ProfileHmm
+import profiling
+
 def convert_fastq_to_fasta(fastqInfile,fastaOutfile):
     msg = 'seqtk seq -a %s' %(fastqInfile)
     commands = shlex.split(msg)
@@ -40,33 +46,114 @@ def perform_hmmsearch(aminofile,hmmModel,hmmOutfile,options):
             stderr=sp.PIPE,stdout=tmp).communicate()
     logging.info('Running command: %s' %(msg))
  
-def translate_and_search(infile,hmmModel,hmmOutfile,options):
+def is_small_sequence_set(fastaInfile,options):
+    '''
+    True if fastaInfile has at least one and at most in_process_max_seqs
+    records. The records are counted before the translation, so with six
+    frames up to six times as many sequences are scored in-process.
+    '''
+    maxSeqs = options.in_process_max_seqs
+    count = 0
+    with open(fastaInfile) as f:
+        for line in f:
+            if line.startswith('>'):
+                count = count + 1
+                if count > maxSeqs:
+                    return False
+    return count > 0
+
+def translate_fasta(infile,aminofile,frame):
+    '''
+    Translates the sequences the same way as transeq -frame=<frame>,
+    where frame is either '1' or '6' (all six frames).
+    '''
+    frames = range(1,7) if frame == '6' else [int(frame)]
+    with open(aminofile,'w') as f:
+        for header, seq in read_fasta(infile,False):
+            s_id = header.split()[0]
+            for i in frames:
+                f.write('>%s_%s\n%s\n' %(s_id,str(i),translate_frame(seq,i)))
+
+def search_in_process(aminofile,hmmModel,hmmOutfile):
+    sequences = [(header.split()[0],seq) for header, seq in read_fasta(aminofile,False)]
+    logging.info('Scoring %s sequences in %s against %s in-process' \
+            %(str(len(sequences)),aminofile,hmmModel))
+    model = ProfileHmm(hmmModel)
+    model.write_domtblout(model.search(sequences),hmmOutfile,len(sequences))
+
+def rescore_sequences(infile,aminofile,hmmOutfile,options,frame,translate=True):
+    '''
+    Translates (unless the amino acid file already exists) and searches the
+    sequences against the model. Small sets are scored in-process instead of
+    through transeq and hmmsearch; the domtblout output is the same.
+    '''
+    if is_small_sequence_set(infile,options):
+        if translate:
+            translate_fasta(infile,aminofile,frame)
+        search_in_process(aminofile,options.hmm_model,hmmOutfile)
+    else:
+        if translate:
+            translate_sequence(infile,aminofile,options,frame)
+        perform_hmmsearch(aminofile,options.hmm_model,hmmOutfile,options)
+
+def translate_and_search(infile,hmmModel,hmmOutfile,options,progress=None):
+    '''
+    Pipes the sequences of infile through transeq to hmmsearch. The input
+    is fed to transeq from here, so that progress (an InputProgress) can
+    count the bytes and reads consumed.
+    '''
     tmpout = '%s/tmp.out' %abspath(options.tmp_dir)
     if options.sensitive:
         flag = '--max'
     else:
         flag = ''
-    msg = 'cat %s | transeq -filter -frame=6 -table=11 sformat=pearson' \
-            '| hmmsearch %s -E 1000 --domE 1000 --domtblout %s %s - > %s' \
-            % (infile, flag, hmmOutfile,hmmModel,tmpout)
-    logging.info('Running command: %s' %(msg))
-    sp.call(msg, shell=True)
-    
-        
+    translate = 'transeq -filter -frame=6 -table=11 sformat=pearson'
+    search = 'hmmsearch %s -E 1000 --domE 1000 --domtblout %s %s -' \
+            % (flag, hmmOutfile,hmmModel)
+    logging.info('Running command: cat %s | %s | %s > %s' %(infile, translate, search, tmpout))
+    with open(tmpout,'w') as tmp:
+        transeq = sp.Popen(shlex.split(translate), stdin=sp.PIPE, stdout=sp.PIPE)
+        hmmsearch = sp.Popen(shlex.split(search), stdin=transeq.stdout, stdout=tmp)
+        transeq.stdout.close()
+        feed_input(infile, transeq.stdin, progress)
+        transeq.wait()
+        hmmsearch.wait()
+
+def feed_input(infile, pipe, progress=None, blocksize=2**20):
+    ''' Writes infile (FASTA) to pipe in blocks, counting the bytes and reads. '''
+    with open(infile,'rb') as f:
+        try:
+            for block in iter(lambda: f.read(blocksize), ''):
+                pipe.write(block)
+                if progress is not None:
+                    progress.update(len(block), block.count('>'))
+        except IOError:
+            logging.error('The translation of %s stopped before the end of the input' %(infile))
+    pipe.close()
+
 def classifier(hmmOutfile,hitFile,options):
     ''' 
-    Returns the sequence id,sequence length (in peptides),
+    Writes the sequence id,sequence length (in peptides),
     env_start and env_end of the sequences classified as positives
-    in a file
+    in a file, and returns the number of positives
     '''
-    if options.meta:
-        threshold = "$14/($21-$20)>%s" %(options.meta_score)
-    else:
-        threshold = "$14>%s" %(options.long_score)
-    msg = "grep -v '^#' %s | awk '%s' | awk '{print $1,$3,$20,$21}' > %s" \
-            %(hmmOutfile,threshold,hitFile) 
-    logging.info('Running command: %s' %(msg))
-    sp.call(msg, shell=True)
+    logging.info('Classifying the hits in %s' %(hmmOutfile))
+    numHits = 0
+    with open(hmmOutfile) as f, open(hitFile,'w') as out:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            fields = line.split()
+            score = float(fields[13])
+            if options.meta:
+                envLength = int(fields[20]) - int(fields[19])
+                positive = envLength > 0 and score/envLength > float(options.meta_score)
+            else:
+                positive = score > float(options.long_score)
+            if positive:
+                out.write('%s %s %s %s\n' %(fields[0],fields[2],fields[19],fields[20]))
+                numHits = numHits + 1
+    return numHits
 
 
 def add_hits_to_fastq_dictionary(hitFile,fastqDict,fastqInfile,options,transformer):
@@ -106,35 +193,117 @@ def create_file_with_ids(nameOfIdFile,listOfIds,transformer):
     return nameOfIdFile
 
 
+def counted_records(records, counts):
+    ''' Passes FASTQ records through, counting the reads and bases in counts. '''
+    for record in records:
+        counts[0] = counts[0] + 1
+        counts[1] = counts[1] + len(record[1])
+        yield record
+
+def kill_processes(processes):
+    ''' Stops processes whose output will not be read (so they cannot block on a full pipe). '''
+    for process in processes:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+
+def wait_for_processes(processes, commands):
+    '''
+    Waits for processes whose output has been read to the end, and raises
+    CalledProcessError if one of them failed.
+    '''
+    for process, command in zip(processes, commands):
+        process.stdout.close()
+        if process.wait() != 0:
+            raise sp.CalledProcessError(process.returncode, command)
+
 def extract_fastq_from_file(nameOfIdFile,fastqInfile,fastqOutfile):
+    '''
+    Extracts the reads of nameOfIdFile with seqtk, writing them as they are
+    read from its output. Returns the number of reads and bases.
+    '''
     call_list = ''.join(['seqtk subseq ',fastqInfile,' ',nameOfIdFile]) 
     logging.info('Running command: ' + call_list)
     commands = shlex.split(call_list)                                       
-    fastqOutfile = open(fastqOutfile,'w')                               
-    sp.Popen(commands, stdin=sp.PIPE,                       
-         stderr=sp.PIPE,stdout=fastqOutfile).communicate()     
+    devnull = open(os.devnull,'w')
+    process = sp.Popen(commands, stdin=sp.PIPE, stderr=devnull, stdout=sp.PIPE)
+    counts = [0, 0]
+    try:
+        with open(fastqOutfile,'w') as out:
+            for record in counted_records(read_fastq_records(process.stdout), counts):
+                write_fastq_record(out, record)
+    except:
+        kill_processes([process])
+        raise
+    finally:
+        devnull.close()
+    wait_for_processes([process], [call_list])
+    return counts[0], counts[1]
+
+def extract_and_trim_paired_fastq(nameOfIdFiles,fastqInfiles,fastqOutfiles,trimmedOutfiles):
+    devnull = open(os.devnull,'w')
+    processes = []
+    call_lists = []
+    for nameOfIdFile,fastqInfile in zip(nameOfIdFiles,fastqInfiles):
+        call_list = ''.join(['seqtk subseq ',fastqInfile,' ',nameOfIdFile])
+        logging.info('Running command: ' + call_list)
+        processes.append(sp.Popen(shlex.split(call_list), stdout=sp.PIPE, stderr=devnull))
+        call_lists.append(call_list)
+    counts = [0, 0]
+    try:
+        numPairs, numPassed = trim_paired_reads(counted_records(read_fastq_records(processes[0].stdout), counts),
+                counted_records(read_fastq_records(processes[1].stdout), counts), trimmedOutfiles, fastqOutfiles)
+    except:
+        kill_processes(processes)
+        raise
+    finally:
+        devnull.close()
+    wait_for_processes(processes, call_lists)
+    logging.info('%s of %s retrieved read pairs passed quality trimming' %(str(numPassed),str(numPairs)))
+    return counts[0], counts[1]
 
 def retrieve_paired_end_fastq(fastqDict,fastqPath,options,transformer):
-    tmpfile = abspath(options.tmp_dir) + '/listOfIds'
+    if options.processes > cpu_count():
+        options.processes = cpu_count()
+    p = Pool(options.processes)
+    results = p.map(retrieve_sample_fastq, itertools.izip(fastqDict.iteritems(),
+        itertools.repeat((fastqPath,options,transformer))))
+    p.close()
+    p.join()
+    return results
+
+@profiling.worker('retrieve_reads')
+def retrieve_sample_fastq(key_item_options):
+    '''
+    Retrieves the reads of the hits of one read pair. Returns the name of
+    the pair and the number of retrieved reads and bases.
+    '''
+    (key, item), (fastqPath, options, transformer) = key_item_options
+    tmpfile = '%s/listOfIds-%s' %(abspath(options.tmp_dir),key)
     name,_,endsuffix = basename(options.infiles[0]).rpartition('.')
     endsuffix = '.%s' %(endsuffix)
-    for key, item in fastqDict.iteritems():
-        nameOfIdFile = create_file_with_ids(tmpfile, item,transformer)
-        if not transformer:
-            fastqBase = abspath(fastqPath) + '/' + key
-            fastqInfiles = ['%s_%s%s' %(fastqBase,str(i),endsuffix) for i in range(1,3)] 
-        else:
-            fastqnames = transformer.get_full_fastq_filename(key,endsuffix)
-            fastqInfiles = ['%s/%s' %(abspath(fastqPath),fastqnames[i]) for i in range(0,2)] 
-        fastqOutfiles = ['%s/%s_%s_retrieved.fastq' %(abspath(options.res_dir),key,str(i)) for i in range(1,3)] 
-        i = 0
-        for fastqInfile,fastqOutfile in zip(fastqInfiles,fastqOutfiles):
-            if isfile(fastqInfile):
-                if not transformer:
-                    extract_fastq_from_file(nameOfIdFile,fastqInfile,fastqOutfile)
-                else:
-                    extract_fastq_from_file(nameOfIdFile[i],fastqInfile,fastqOutfile)
-                    i = i+1
+    nameOfIdFile = create_file_with_ids(tmpfile, item,transformer)
+    if not transformer:
+        nameOfIdFile = [nameOfIdFile, nameOfIdFile]
+        fastqBase = abspath(fastqPath) + '/' + key
+        fastqInfiles = ['%s_%s%s' %(fastqBase,str(i),endsuffix) for i in range(1,3)] 
+    else:
+        fastqnames = transformer.get_full_fastq_filename(key,endsuffix)
+        fastqInfiles = ['%s/%s' %(abspath(fastqPath),fastqnames[i]) for i in range(0,2)] 
+    fastqOutfiles = ['%s/%s_%s_retrieved.fastq' %(abspath(options.res_dir),key,str(i)) for i in range(1,3)] 
+    trimInProcess = not options.no_quality_filtering and not options.trim_galore
+    if trimInProcess and isfile(fastqInfiles[0]) and isfile(fastqInfiles[1]):
+        # Same file names as trim_galore --paired would give
+        trimmedOutfiles = ['%s/%s_%s_retrieved_val_%s.fq' %(abspath(options.trimmed_dir),key,str(i),str(i))
+                for i in range(1,3)]
+        numReads, numBases = extract_and_trim_paired_fastq(nameOfIdFile,fastqInfiles,fastqOutfiles,trimmedOutfiles)
+        return key, numReads, numBases
+    numReads, numBases = 0, 0
+    for i,(fastqInfile,fastqOutfile) in enumerate(zip(fastqInfiles,fastqOutfiles)):
+        if isfile(fastqInfile):
+            reads, bases = extract_fastq_from_file(nameOfIdFile[i],fastqInfile,fastqOutfile)
+            numReads, numBases = numReads + reads, numBases + bases
+    return key, numReads, numBases
 
 def quality(fastqBases,options):
     if options.processes > cpu_count():
@@ -168,7 +337,15 @@ def run_spades(options):
     spades_msg = 'spades.py --meta -1 %s -2 %s -o %s > %s'\
             %(retrievedFastqGrouped[0],retrievedFastqGrouped[1],options.assembly_dir,tmp_spades_out)
     if isfile(retrievedFastqGrouped[0]) and getsize(retrievedFastqGrouped[0]) > 0:
-        sp.call(spades_msg,shell=True)
+        numReads = count_reads(retrievedFastqGrouped[0])
+        if numReads <= options.builtin_assembly_max_reads:
+            logging.info('Assembling %s read pairs with the built-in assembler' %(str(numReads)))
+            create_dir(options.assembly_dir)
+            contigFile = '%s/contigs.fasta' %(abspath(options.assembly_dir))
+            assemble_reads(retrievedFastqGrouped, contigFile)
+        else:
+            logging.info('Running command: %s' %(spades_msg))
+            sp.call(spades_msg,shell=True)
     else:
         msg = 'No retrieved data to assemble'
         print '\n%s\n' %msg
@@ -190,12 +367,17 @@ def create_dictionary(hitFile,options):
     return hitDict
 
 def retrieve_fasta(hitDict,fastaInfile,fastaOutfile,options):
+    '''
+    Appends the hits (or the whole sequences with hits) to fastaOutfile.
+    Returns the number of sequences and bases written.
+    '''
     fastaBaseName = splitext(basename(fastaInfile))[0]
     if not hitDict:
         msg = 'No hits in file %s' %(abspath(fastaInfile))
         print '\n%s\n' %msg
         logging.error(msg)
-        return
+        return 0, 0
+    numRecords, numBases = 0, 0
     outfile = open(fastaOutfile,'a')
     for header, seq in read_fasta(fastaInfile,False):
         written = False
@@ -207,11 +389,15 @@ def retrieve_fasta(hitDict,fastaInfile,fastaOutfile,options):
                 if options.retrieve_whole and not written:
                     outfile.write('%s\n%s\n' %(header,seq))
                     written = True
+                    numRecords, numBases = numRecords + 1, numBases + len(seq)
                 elif not options.retrieve_whole:
                     ali_start, ali_end = int(info[1]),int(info[2])
                     if not options.protein:
                         ali_start, ali_end = translate_position(info[1],info[2],info[3],info[0],len(seq))
                     outfile.write('%s\n%s\n' %(header,seq[ali_start:ali_end]))
+                    numRecords, numBases = numRecords + 1, numBases + len(seq[ali_start:ali_end])
+    outfile.close()
+    return numRecords, numBases
 
 def retrieve_peptides(hitDict,aminoInFile,aminoOut,options):
     fastaBaseName = splitext(basename(aminoInFile))[0]
@@ -233,6 +419,26 @@ def retrieve_peptides(hitDict,aminoInFile,aminoOut,options):
                         ali_start, ali_end = int(info[1]),int(info[2])
                         outfile.write('%s\n%s\n' %(header,seq[ali_start:ali_end]))
 
+def retrieve_hit_peptides(hitDict,fastaInfile,aminoOut,options):
+    '''
+    Writes the peptide sequences of the hits using the frame and envelope
+    coordinates of the first hmmsearch, instead of translating and
+    searching the retrieved sequences once more.
+    '''
+    fastaBaseName = splitext(basename(fastaInfile))[0]
+    if not hitDict:
+        return
+    outfile = open(aminoOut,'a')
+    for header, seq in read_fasta(fastaInfile,False):
+        s_id = header.split()[0]
+        if hitDict.has_key(s_id):
+            for i in range(0,len(hitDict[s_id])):
+                info = hitDict[s_id][i]
+                ali_start, ali_end = int(info[1]),int(info[2])
+                outfile.write('>%s_%s_seq%s_%s\n%s\n' %(fastaBaseName,s_id,str(i+1),info[3],
+                    translate_envelope(seq,info[3],ali_start,ali_end)))
+    outfile.close()
+
 def make_fasta_unique(fastaout,options):
     tmp_fastaout = '%s/fastaout_tmp.fasta' %(abspath(options.tmp_dir))
     f = open(tmp_fastaout,'w')
@@ -259,20 +465,24 @@ def retrieve_assembled_genes(options):
     hmmOut = '%s/contigs-%s-hmmsearched.out' %(abspath(options.hmm_out_dir),modelName)
     hitFile = '%s/contigs-positives.out' %(abspath(options.tmp_dir))
     if isfile(contigFile):
-        translate_sequence(contigFile,aminoFile,options,frame)
-        perform_hmmsearch(aminoFile,options.hmm_model,hmmOut,options)
+        rescore_sequences(contigFile,aminoFile,hmmOut,options,frame)
         classifier(hmmOut,hitFile,options)
         hitDict = create_dictionary(hitFile,options)
 
         retrieve_peptides(hitDict,aminoFile,aminoOut,options)
         options.retrieve_whole = True
-        retrieve_fasta(hitDict,contigFile,fastaOut,options)
-        return (fastaOut,hitDict)
+        written = retrieve_fasta(hitDict,contigFile,fastaOut,options)
+        return (fastaOut,hitDict,written)
     else:
         logging.error('The file %s does not exist' %(contigFile))
-        return ('', None)
+        return ('', None, (0, 0))
 
-def retrieve_predicted_orfs(options,orfFile):
+def retrieve_predicted_orfs(options,orfFile,orfAminoFile=None):
+    '''
+    Rescores the predicted ORFs and appends the best ORF of each hit to
+    predicted-orfs.fasta. Returns the file and the number of ORFs and
+    bases written.
+    '''
     options.meta = False
     options.retrieve_whole = True
     frame ='1'
@@ -283,16 +493,19 @@ def retrieve_predicted_orfs(options,orfFile):
     hmmOut = '%s/orfs-%s-hmmsearched.out' %(abspath(options.hmm_out_dir),modelName)
     hitFile = '%s/orfs-positives.out' %(abspath(options.tmp_dir))
     if isfile(orfFile) and getsize(orfFile) > 0:
-        translate_sequence(orfFile,aminoFile,options,frame)
-        perform_hmmsearch(aminoFile,options.hmm_model,hmmOut,options)
+        translate = True
+        if orfAminoFile and isfile(orfAminoFile):
+            aminoFile = orfAminoFile
+            translate = False
+        rescore_sequences(orfFile,aminoFile,hmmOut,options,frame,translate)
         hitDict = orf_classifier(hmmOut,hitFile,options)
 
         retrieve_peptides(hitDict,aminoFile,aminoOut,options)
-        retrieve_fasta(hitDict,orfFile,fastaOut,options)
-        return fastaOut
+        written = retrieve_fasta(hitDict,orfFile,fastaOut,options)
+        return fastaOut, written
     else:
         logging.error('The file %s does not exist' %(orfFile))
-        return fastaOut
+        return fastaOut, (0, 0)
 
 def orf_classifier(hmmOut,hitFile,options):
     threshold = "$14>%s" %(options.long_score)
@@ -333,8 +546,7 @@ def retrieve_predicted_genes_as_amino(options,retrievedNucFile,aminoOut,frame):
     hmmOut = '%s/retrieved-genes-%s-hmmsearched.out' %(abspath(options.hmm_out_dir),modelName)
     hitFile = '%s/retrieved-genes-positives.out' %(abspath(options.tmp_dir))
     if isfile(retrievedNucFile):
-        translate_sequence(retrievedNucFile,aminoTmpFile,options,frame)
-        perform_hmmsearch(aminoTmpFile,options.hmm_model,hmmOut,options)
+        rescore_sequences(retrievedNucFile,aminoTmpFile,hmmOut,options,frame)
         classifier(hmmOut,hitFile,options)
         hitDict = create_dictionary(hitFile,options)
         retrieve_peptides(hitDict,aminoTmpFile,aminoOut,options)
@@ -403,40 +615,114 @@ def decide_min_ORF_length(hmmModel):
             if line[0].startswith('LENG'):
                 return round((0.9*float(line[1])*3))
 
-def read_fasta(filename, keep_formatting=True):
+def read_fasta(filename, keep_formatting=True, start=0, end=None):
     """Read sequence entries from FASTA file
     NOTE: This is a generator, it yields after each completed sequence.
+    With end, only the entries in the byte range from start to end
+    (see fasta_shards) are read.
     Usage example:
     for header, seq in read_fasta(filename):
         print ">"+header
         print seq
     """
 
+    if keep_formatting:
+        sep = "\n"
+    else:
+        sep = ""
     with open(filename) as fasta:
-        line = fasta.readline().rstrip()
-        if not line.startswith(">"):
-            raise IOError("Not FASTA format? First line didn't start with '>'")
-        if keep_formatting:
-            sep = "\n"
+        if end is None:
+            lines = fasta
         else:
-            sep = ""
-        first = True
+            fasta.seek(start)
+            lines = fasta.read(end - start).splitlines()
+        header = None
         seq = []
-        header = ""
-        while fasta:
-            if line == "": #EOF
-                yield header, sep.join(seq)
-                break
-            elif line.startswith(">") and not first:
-                yield header, sep.join(seq)
-                header = line.rstrip()[1:]
+        for line in lines:
+            line = line.rstrip()
+            if line.startswith(">"):
+                if header is not None:
+                    yield header, sep.join(seq)
+                header = line[1:]
                 seq = []
-            elif line.startswith(">") and first:
-                header = line.rstrip()[1:]
-                first = False
+            elif header is None:
+                raise IOError("Not FASTA format? First line didn't start with '>'")
             else:
-                seq.append(line.rstrip())
-            line = fasta.readline()
+                seq.append(line)
+        if header is None:
+            raise IOError("Not FASTA format? First line didn't start with '>'")
+        yield header, sep.join(seq)
+
+def fasta_shards(filename, shard_size):
+    """
+    Splits a FASTA file into byte ranges (start, end) of about shard_size
+    bytes that each begin with a header, to be read in parallel with
+    read_fasta. Files smaller than shard_size are one range.
+    """
+    if shard_size < 1:
+        raise ValueError('The shard size must be at least one byte, got %s' %(str(shard_size)))
+    size = getsize(filename)
+    starts = [0]
+    if size > shard_size:
+        with open(filename) as fasta:
+            for offset in range(shard_size, size, shard_size):
+                if offset <= starts[-1]:
+                    continue
+                fasta.seek(offset)
+                fasta.readline()
+                position = fasta.tell()
+                line = fasta.readline()
+                while line and not line.startswith(">"):
+                    position = fasta.tell()
+                    line = fasta.readline()
+                if line:
+                    starts.append(position)
+    return zip(starts, starts[1:] + [size])
+
+CODON_TABLE = dict(zip([a+b+c for a in 'TCAG' for b in 'TCAG' for c in 'TCAG'],
+    'FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG'))
+
+def translate_nucleotides(seq):
+    '''
+    Translates a nucleotide sequence in frame 1 using the bacterial
+    codon table (11), the same table as transeq is called with.
+    '''
+    seq = seq.upper()
+    return ''.join([CODON_TABLE.get(seq[i:i+3],'X') for i in range(0,len(seq)-2,3)])
+
+def reverse_complement(sequence):
+    comp = {'A': 'T', 'T': 'A', 'G': 'C', 'C': 'G',\
+            'a': 't', 't': 'a', 'g': 'c', 'c': 'g'}
+    return ''.join(reversed([comp.get(base,base) for base in sequence]))
+
+def translate_frame(seq, frame):
+    '''
+    Translates seq in one of the six frames the way transeq -frame=6 does,
+    frames 4-6 being the reverse complement of the codons in frames 1-3.
+    '''
+    frame = int(frame)
+    offset = (frame - 1) % 3
+    codons = seq[offset:offset + 3*((len(seq) - offset)//3)]
+    if frame > 3:
+        codons = reverse_complement(codons)
+    return translate_nucleotides(codons)
+
+def translate_envelope(seq, frame, a_start, a_end):
+    '''
+    The residues a_start to a_end (1-based, inclusive) of translate_frame(seq,
+    frame), translating only their codons instead of the whole sequence.
+    '''
+    frame = int(frame)
+    offset = (frame - 1) % 3
+    numCodons = (len(seq) - offset)//3
+    a_start = max(int(a_start), 1)
+    a_end = min(int(a_end), numCodons)
+    if a_end < a_start:
+        return ''
+    if frame > 3:
+        end = offset + 3*(numCodons - a_start + 1)
+        return translate_nucleotides(reverse_complement(seq[end - 3*(a_end - a_start + 1):end]))
+    return translate_nucleotides(seq[offset + 3*(a_start - 1):offset + 3*a_end])
 
 def translate_position(a_start, a_end, frame, alen, nlen):
     frame = int(frame)
@@ -8,6 +8,10 @@ class MetaData(object):
         self.tmpdir = tmpdir
         self.resultsdir = resultsdir
         self.hmmdir = hmmdir
+        self.num_fragments = None
+        self.cluster_sizes = None
+        self.sens_score_files = {}
+        self.spec_score_files = {}
 
 
     def has_specificity(self):
@@ -0,0 +1,70 @@
+import logging
+import os
+import numpy as np
+from estimate_sensitivity import estimate_sensitivity, sensitivity_scores_file
+from estimate_specificity import estimate_specificity, specificity_scores_file
+from calculate_performance import load_performance, target_fprs
+
+def merge_rounds(round_files, merged_file):
+    '''
+    Concatenates the score files of the sampling rounds. The merged file
+    is written under a temporary name and renamed.
+    '''
+    tmpfile = merged_file + '.tmp'
+    with open(tmpfile, 'w') as merged:
+        for round_file in round_files:
+            with open(round_file) as f:
+                merged.write(f.read())
+    os.rename(tmpfile, merged_file)
+
+def sample_adaptively(options, est_obj):
+    '''
+    Estimates the sensitivity and specificity of the fragments in rounds of
+    options.batch_fragments fragments per sequence, with new fragments in
+    each round. After each round, the 95% confidence intervals of the
+    sensitivity and specificity at the suggested threshold scores are
+    computed for every fragment length, and the sampling stops when none
+    is wider than options.ci_width, or when options.num_fragments fragments
+    per sequence (rounded up to whole rounds) have been searched. The score files of the rounds are
+    merged into the score files of a run without rounds, and
+    est_obj.num_fragments is set to the number of fragments per sequence
+    that were searched.
+    '''
+    tmpdir = est_obj.tmpdir
+    num_rounds = int(np.ceil(options.num_fragments / float(options.batch_fragments)))
+    sens_rounds = dict((fragment_length, []) for fragment_length in options.fragment_lengths)
+    spec_rounds = dict((fragment_length, []) for fragment_length in options.fragment_lengths)
+    for fragment_round in range(num_rounds):
+        options.fragment_round = fragment_round
+        estimate_sensitivity(options.reference_sequences, est_obj, options)
+        estimate_specificity(options, est_obj)
+        for fragment_length in options.fragment_lengths:
+            sens_rounds[fragment_length].append(sensitivity_scores_file(tmpdir, options, fragment_length))
+            spec_rounds[fragment_length].append(specificity_scores_file(tmpdir, options, fragment_length))
+        options.fragment_round = None
+        est_obj.num_fragments = (fragment_round + 1) * options.batch_fragments
+
+        widths = []
+        for fragment_length in options.fragment_lengths:
+            merge_rounds(sens_rounds[fragment_length], sensitivity_scores_file(tmpdir, options, fragment_length))
+            merge_rounds(spec_rounds[fragment_length], specificity_scores_file(tmpdir, options, fragment_length))
+            performance = load_performance(est_obj, options,
+                    sensitivity_scores_file(tmpdir, options, fragment_length),
+                    specificity_scores_file(tmpdir, options, fragment_length), fragment_length)
+            dt = 0.1
+            scores = performance.grid(dt, performance.max_score()+dt)
+            rows = performance.optimize(target_fprs(est_obj, options), options.target_sensitivity, scores)
+            widths.append(performance.interval_width(rows))
+        logging.info('After %s fragments per sequence the widest confidence interval is %.4f' \
+                %(str(est_obj.num_fragments), max(widths)))
+        if max(widths) <= options.ci_width:
+            break
+    else:
+        logging.warning('The confidence intervals are wider than %s after all %s fragments per sequence' \
+                %(str(options.ci_width), str(est_obj.num_fragments)))
+    est_obj.sens_score_files = dict((fragment_length, sensitivity_scores_file(tmpdir, options, fragment_length)) \
+            for fragment_length in options.fragment_lengths)
+    est_obj.spec_score_files = dict((fragment_length, specificity_scores_file(tmpdir, options, fragment_length)) \
+            for fragment_length in options.fragment_lengths)
+    est_obj.sens_score_file = est_obj.sens_score_files[options.fragment_lengths[-1]]
+    est_obj.spec_score_file = est_obj.spec_score_files[options.fragment_lengths[-1]]
@@ -1,5 +1,6 @@
 import numpy as np
-from plot_cross_validation import plot_cross_validation
+from plot_cross_validation import plot_cross_validation, plot_score_per_aa
+from performance import Performance, load_sorted_scores, fraction_above, write_score_per_aa, effective_sample_size
 #from suggest_cutoffs import corresponding_scores
 import time
 import argparse
@@ -18,183 +19,142 @@ preferred_sensitivity = 0.90
 max_fpr = 0.005'''
 
 def summarize_sens_or_spec(est_obj,options,only_sensitivity):
+    if est_obj.full_length:
+        summarize_score_file(est_obj,options,only_sensitivity,None)
+        return
+    for fragment_length in options.fragment_lengths:
+        summarize_score_file(est_obj,options,only_sensitivity,fragment_length)
+
+def summarize_score_file(est_obj,options,only_sensitivity,fragment_length):
     """ Read files """
     if only_sensitivity:
-        ref_scores = np.loadtxt(est_obj.sens_score_file)
+        score_file = est_obj.sens_score_files.get(fragment_length, est_obj.sens_score_file)
+        ref_scores, ref_weights = load_sorted_scores(score_file)
         num_ref_sequences = int((get_read_information(options.reference_sequences))[0].strip())
         name1 = 'sensitivity'
         name2 = name1
     else:
-        ref_scores = np.loadtxt(est_obj.spec_score_file)
+        score_file = est_obj.spec_score_files.get(fragment_length, est_obj.spec_score_file)
+        ref_scores, ref_weights = load_sorted_scores(score_file)
         num_ref_sequences = int((get_read_information(options.negative_sequences))[0].strip())
         name1 = 'specificity'
         name2 = '1-specificity'
 
     full_length = est_obj.full_length
     resultsdir = est_obj.resultsdir
-    max_fpr = est_obj.get_max_fpr()
     if full_length:
         results_file = '%s/resulting_%s_%s_full_length.txt' \
                 %(path.abspath(resultsdir),name1,options.modelname)
     else:
         results_file = '%s/resulting_%s_%s_%s.txt' \
-                %(path.abspath(resultsdir),name1,options.modelname,str(options.fragment_lengths[0]))
+                %(path.abspath(resultsdir),name1,options.modelname,str(fragment_length))
 
     if not full_length:
         num_ref_seq_runs = num_ref_sequences * options.num_fragments
     else:
         num_ref_seq_runs = num_ref_sequences
 
-    ''' Add missed (low scoring) elements to score arrays '''
-    min_score = ref_scores.min()
-    max_score = ref_scores.max()
-
-    missed_ref = min_score*np.ones(num_ref_seq_runs - len(ref_scores),dtype=float)
-    ref_scores = np.append(missed_ref,ref_scores)
-
-    """ Create score array and initialize sensitivity and specificity arrays """
-    dt = 0.1
-    scores = np.arange(min_score-dt,max_score+dt,dt)
-    scores = np.arange(0,max_score+dt,dt)
-    size = len(scores)
-    ref_fraction = np.empty(size,float)
-    score_per_aa = np.empty(size,float)
-
-    ref_max= float(ref_scores.max())
-    len_ref_scores = float(len(ref_scores))
-
-    """ Calculate sensitivity and 1-specificity as a function of score """
-    for i,score in enumerate(scores):
-        ref_fraction[i] = np.divide(np.sum(np.greater(ref_scores,score)),len_ref_scores) 
-        score_per_aa[i] = np.divide(score,float(options.fragment_lengths[0]))
-
-    max_ref = np.amax(ref_fraction)
-
-    """ Calculate corresponding sensitivity and specificity for a given score """
-    potential_cutoffs = np.arange(0,max_score,1)
-    corresponding_sensitivity(potential_cutoffs,scores,ref_fraction,name2,results_file)
+    """ Calculate the fraction scoring above each potential cutoff """
+    max_score = np.max(np.append(ref_scores, 0))
+    potential_cutoffs = np.arange(0,max_score,options.score_step)
+    ref_fraction = fraction_above(ref_scores, num_ref_seq_runs, potential_cutoffs, ref_weights)
+    corresponding_sensitivity(potential_cutoffs,ref_fraction,name2,results_file)
     
 
-def calculate_performance(est_obj,preferred_sensitivity,options):
-    """ Read files """
-    ref_scores = np.loadtxt(est_obj.sens_score_file)
-    neg_scores = np.loadtxt(est_obj.spec_score_file)
-    full_length = est_obj.full_length
-    resultsdir = est_obj.resultsdir
-    max_fpr = est_obj.get_max_fpr()
-    if full_length:
-        results_file = '%s/resulting_sensitivity_specificity_%s_full_length.txt' \
-                %(path.abspath(resultsdir),options.modelname)
-        figfile = '%s/resulting_sensitivity_specificity_%s_full_length.png' \
-                %(path.abspath(resultsdir),options.modelname)
-    else:
-        results_file = '%s/resulting_sensitivity_specificity_%s_%s.txt' \
-                %(path.abspath(resultsdir),options.modelname,str(options.fragment_lengths[0]))
-        figfile = '%s/resulting_sensitivity_specificity_%s_%s.png' \
-                %(path.abspath(resultsdir),options.modelname,str(options.fragment_lengths[0]))
+def target_fprs(est_obj,options):
+    if options.max_fpr:
+        return options.max_fpr
+    return [est_obj.get_max_fpr()]
 
+def load_performance(est_obj,options,sens_score_file,spec_score_file,fragment_length=None):
+    """ Read files """
+    ref_scores, ref_weights = load_sorted_scores(sens_score_file)
+    neg_scores, neg_weights = load_sorted_scores(spec_score_file)
     num_ref_sequences = int((get_read_information(options.reference_sequences))[0].strip())
     num_neg_sequences = int((get_read_information(options.negative_sequences))[0].strip())
-    if not full_length:
-        num_ref_seq_runs = num_ref_sequences * options.num_fragments
-        num_neg_seq_runs = num_neg_sequences * options.num_fragments
+    if fragment_length is not None:
+        """ With adaptive sampling, the number of fragments that were searched """
+        num_fragments = est_obj.num_fragments or options.num_fragments
     else:
-        num_ref_seq_runs, num_neg_seq_runs = num_ref_sequences, num_neg_sequences
-
-    ''' Add missed (low scoring) elements to score arrays '''
-    min_score = min([ref_scores.min(),neg_scores.min()])
-    max_score = max([ref_scores.max(),neg_scores.max()])
-
-    missed_neg = min_score*np.ones(num_neg_seq_runs - len(neg_scores),dtype=float)
-    neg_scores = np.append(missed_neg,neg_scores)
-    missed_ref = min_score*np.ones(num_ref_seq_runs - len(ref_scores),dtype=float)
-    ref_scores = np.append(missed_ref,ref_scores)
-
-    """ Create score array and initialize sensitivity and specificity arrays """
-    dt = 0.1
-    scores = np.arange(min_score-dt,max_score+dt,dt)
-    scores = np.arange(0,max_score+dt,dt)
-    size = len(scores)
-    ref_fraction = np.empty(size,float)
-    neg_fraction = np.empty(size,float)
-    score_per_aa = np.empty(size,float)
-
-    neg_max = float(neg_scores.max())
-    ref_max= float(ref_scores.max())
-
-    len_ref_scores = float(len(ref_scores))
-    len_neg_scores = float(len(neg_scores))
-
-    """ Calculate sensitivity and 1-specificity as a function of score """
-    for i,score in enumerate(scores):
-        ref_fraction[i] = np.divide(np.sum(np.greater(ref_scores,score)),len_ref_scores) 
-        neg_fraction[i] = np.divide(np.sum(np.greater(neg_scores,score)),len_neg_scores) 
-        score_per_aa[i] = np.divide(score,float(options.fragment_lengths[0]))
-
-
-    max_ref = np.amax(ref_fraction)
-    max_neg = np.amax(neg_fraction)
-
-    """ Calculate corresponding specificity and score for a given sensitivity """
-    sensitivity, specificity,suggested_score  = find_score_for_max_fpr(ref_fraction,neg_fraction,scores,max_fpr) 
-
-    """ Calculate corresponding sensitivity and specificity for a given score """
-    potential_cutoffs = np.arange(0,max_score,1)
-    
+        num_fragments = 1
+    num_ref_seq_runs = num_ref_sequences * num_fragments
+    num_neg_seq_runs = num_neg_sequences * num_fragments
+    ref_sample_size = None
+    if est_obj.cluster_sizes is not None:
+        """ Only the representatives were sampled, the weights stand in for the other members """
+        ref_sample_size = effective_sample_size(est_obj.cluster_sizes) * num_fragments
+    return Performance(ref_scores, num_ref_seq_runs, neg_scores, num_neg_seq_runs, fragment_length, ref_weights,
+            est_obj.num_fragments is not None, ref_sample_size)
+
+def calculate_performance(est_obj,options):
+    """
+    Writes the performance tables of the full length genes, or of each
+    fragment length of the sweep and the suggested score per AA of all
+    lengths (to choose a --meta-score for the read lengths of a data set).
+    """
     if est_obj.full_length:
-        corresponding_sens_spec_whole(potential_cutoffs,scores,ref_fraction,neg_fraction,results_file)
-        print '\nFor a preferred sensitivity of %s and max false positive rate of %s,\n'\
-        'the suggested minimal score and corresponding sensitivity and specificity are:\n'\
-        'score=%s\tsensitivity=%.4f\tspecificity=%.4f'\
-        %(preferred_sensitivity,max_fpr,suggested_score,sensitivity,1-specificity)
+        report_performance(est_obj,options,est_obj.sens_score_file,est_obj.spec_score_file,None)
+        return
+    rows_by_length = []
+    for fragment_length in options.fragment_lengths:
+        rows = report_performance(est_obj,options,est_obj.sens_score_files[fragment_length],
+                est_obj.spec_score_files[fragment_length],fragment_length)
+        rows_by_length.append((fragment_length, rows))
+    score_per_aa_file = '%s/resulting_score_per_aa_%s' %(path.abspath(est_obj.resultsdir),options.modelname)
+    write_score_per_aa(score_per_aa_file + '.txt', rows_by_length)
+    plot_score_per_aa(rows_by_length, score_per_aa_file + '.png')
+
+def report_performance(est_obj,options,sens_score_file,spec_score_file,fragment_length):
+    full_length = fragment_length is None
+    resultsdir = est_obj.resultsdir
+    max_fprs = target_fprs(est_obj,options)
+    if full_length:
+        suffix = '%s_full_length' %(options.modelname)
     else:
-        corresponding_sens_spec_frag(potential_cutoffs,scores,ref_fraction,neg_fraction,score_per_aa,results_file)
-        print '\nFor a max false positive rate of %s,\n'\
-        'the suggested minimal score, score/AA and corresponding sensitivity and specificity are:\n'\
-        'score=%.2f\tscore/AA=%.4f\tsensitivity=%.4f\tspecificity=%.4f'\
-        %(max_fpr,float(suggested_score),suggested_score/(float(options.fragment_lengths[0])),sensitivity,1-specificity)
-    
-    plot_cross_validation(scores,ref_fraction,neg_fraction,figfile)
-
-def find_score_for_preferred_sensitivity(ref_fraction,neg_fraction,scores,preferred_sensitivity,max_fpr):
-    tpr = float(preferred_sensitivity)
-    neg = max_fpr + 1
+        suffix = '%s_%s' %(options.modelname,str(fragment_length))
+        print '\nFragments of length %s AA:' %(str(fragment_length))
+    results_file = '%s/resulting_sensitivity_specificity_%s.txt' %(path.abspath(resultsdir),suffix)
+    roc_file = '%s/resulting_roc_%s.txt' %(path.abspath(resultsdir),suffix)
+    thresholds_file = '%s/resulting_thresholds_%s.txt' %(path.abspath(resultsdir),suffix)
+    figfile = '%s/resulting_sensitivity_specificity_%s.png' %(path.abspath(resultsdir),suffix)
+    performance = load_performance(est_obj,options,sens_score_file,spec_score_file,fragment_length)
+
+    """ Create score array and calculate sensitivity and 1-specificity as a function of score """
     dt = 0.1
-    score = 0
-    while neg >= max_fpr:
-        (ref,neg,score) =  corresponding_scores(ref_fraction,neg_fraction,scores,tpr,dt)
-        tpr = tpr - 0.01
-    return ref,neg,score
+    scores = performance.grid(dt, performance.max_score()+dt)
 
-def find_score_for_max_fpr(ref_fraction,neg_fraction,scores,max_fpr):
-    sens = 0.1
-    return fpr_corresponding_scores(ref_fraction, neg_fraction,scores,max_fpr,sens)
+    """ Find the thresholds meeting each false positive rate and sensitivity target """
+    rows = performance.optimize(max_fprs, options.target_sensitivity, scores)
+    performance.write_thresholds(thresholds_file, rows)
+    roc = performance.roc()
+    performance.write_roc(roc_file, roc)
 
-def corresponding_sens_spec_frag(potential_cutoffs,scores,ref_fraction,neg_fraction,score_per_aa,results_file):
-    with open(results_file,'w') as f:
-        f.write("Score\tScore/AA\tSensitivity\tSpecificity\n")
-        for i in potential_cutoffs:
-            index = np.where(scores==i)[0][0]
-            if i < 10:
-                f.write("%0.2f\t%.4f\t%.4f\t%.4f\n" %(i,score_per_aa[index],ref_fraction[index],1-neg_fraction[index]))
-            else:
-                f.write("%0.1f\t%.4f\t%.4f\t%.4f\n" %(i,score_per_aa[index],ref_fraction[index],1-neg_fraction[index]))
-
-def corresponding_sens_spec_whole(potential_cutoffs,scores,ref_fraction,neg_fraction,results_file):
-    with open(results_file,'w') as f:
-        f.write("Score\tSensitivity\tSpecificity\n")
-        for i in potential_cutoffs:
-            index = np.where(scores==i)[0][0]
-            if i < 10:
-                f.write("%0.2f\t%.4f\t%.4f\n" %(i,ref_fraction[index],1-neg_fraction[index]))
-            else:
-                f.write("%0.1f\t%.4f\t%.4f\n" %(i,ref_fraction[index],1-neg_fraction[index]))
-
-def corresponding_sensitivity(potential_cutoffs,scores,ref_fraction,name,results_file):
+    """ Calculate corresponding sensitivity and specificity for a given score """
+    performance.write_table(results_file, performance.grid(options.score_step))
+
+    print '\nArea under the ROC curve: %.4f' %(performance.auc(roc))
+    if performance.intervals:
+        print 'From %s fragments per sequence, the 95%% confidence intervals at the suggested scores are at most %.4f wide' \
+                %(str(est_obj.num_fragments),performance.interval_width(rows))
+    for target, value, suggested_score, sensitivity, specificity in rows:
+        if suggested_score is None:
+            print 'No threshold score reaches a %s of %s' %(target.replace('_',' '),value)
+        elif full_length:
+            print 'For a %s of %s, the suggested minimal score and corresponding sensitivity and specificity are:\n'\
+            'score=%.2f\tsensitivity=%.4f\tspecificity=%.4f'\
+            %(target.replace('_',' '),value,suggested_score,sensitivity,specificity)
+        else:
+            print 'For a %s of %s, the suggested minimal score, score/AA and corresponding sensitivity and specificity are:\n'\
+            'score=%.2f\tscore/AA=%.4f\tsensitivity=%.4f\tspecificity=%.4f'\
+            %(target.replace('_',' '),value,suggested_score,suggested_score/float(fragment_length),sensitivity,specificity)
+
+    plot_cross_validation(scores,performance.sensitivity(scores),performance.fpr(scores),figfile)
+    return rows
+
+def corresponding_sensitivity(potential_cutoffs,ref_fraction,name,results_file):
     with open(results_file,'w') as f:
         f.write("Score\t%s\t\n" %name)
-        for i in potential_cutoffs:
-            index = np.where(scores==i)[0][0]
+        for index, i in enumerate(potential_cutoffs):
             if i < 10:
                 f.write("%0.2f\t%.4f\n" %(i,ref_fraction[index]))
             else:
@@ -203,18 +163,6 @@ def corresponding_sensitivity(potential_cutoffs,scores,ref_fraction,name,results
 
 
 
-def fpr_corresponding_scores(ref_fraction, neg_fraction,scores,fpr,sens):
-    i =  np.where(np.logical_and(neg_fraction > fpr-sens, neg_fraction < fpr+sens))[0][:]
-    closest_i = (np.absolute(fpr - neg_fraction[i])).argmin()
-    final_i = i[closest_i]
-    return ref_fraction[final_i], neg_fraction[final_i],scores[final_i]
-
-def corresponding_scores(ref_fraction, neg_fraction,scores,tpr,sens):
-    i =  np.where(np.logical_and(ref_fraction > tpr-sens, ref_fraction < tpr+sens))[0][:]
-    closest_i = (np.absolute(tpr - ref_fraction[i])).argmin()
-    final_i = i[closest_i]
-    return ref_fraction[final_i], neg_fraction[final_i],scores[final_i]
-
 def get_read_information(fastafile):
     call_list = ''.join(['grep -c "^>" ',fastafile])
     commands = shlex.split(call_list)
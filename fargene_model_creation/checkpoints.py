@@ -0,0 +1,155 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+from os import path, makedirs
+import numpy as np
+
+RUN_FILE = 'run.json'
+
+def md5sum(filename):
+    checksum = hashlib.md5()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+def run_description(options):
+    '''
+    The input and options that the checkpoints depend on. A run can only
+    be resumed with the same description.
+    '''
+    return {'reference_sequences': md5sum(options.reference_sequences),
+            'negative_sequences': md5sum(options.negative_sequences),
+            'fragment_lengths': [int(length) for length in options.fragment_lengths],
+            'num_fragments': int(options.num_fragments),
+            'ci_width': options.ci_width,
+            'batch_fragments': int(options.batch_fragments),
+            'seed': options.seed,
+            'folds': options.folds,
+            'cluster_identity': options.cluster_identity,
+            'reuse_alignment': options.reuse_alignment}
+
+def prepare_checkpoints(options, checkpointdir, hmmdir):
+    '''
+    Starts a new run, removing the checkpoints and the model of a previous
+    run in the same output directory, or with --resume checks that the
+    previous run used the same input and options. Its seed is reused if
+    none is given.
+    '''
+    runfile = '%s%s' %(checkpointdir, RUN_FILE)
+    if options.resume and path.isfile(runfile):
+        with open(runfile) as f:
+            previous = json.load(f)
+        if options.seed is None:
+            options.seed = previous['seed']
+        current = run_description(options)
+        changed = [key for key in sorted(current) if current[key] != previous.get(key)]
+        if changed:
+            logging.critical('Cannot resume %s, the run used other %s' %(checkpointdir, ', '.join(changed)))
+            exit()
+        logging.info('Resuming the run checkpointed in %s' %(checkpointdir))
+        return
+    if path.isdir(checkpointdir):
+        shutil.rmtree(checkpointdir)
+    fastabasename = path.splitext(path.basename(options.reference_sequences))[0]
+    for modelfile in glob.glob('%s/%s.hmm*' %(path.abspath(hmmdir), fastabasename)):
+        os.remove(modelfile)
+    makedirs(checkpointdir)
+    if options.seed is None:
+        options.seed = np.random.randint(0, 2**31 - 1)
+    with open(runfile, 'w') as f:
+        json.dump(run_description(options), f, indent=4, sort_keys=True)
+
+def unit_checkpoint(checkpointdir, full_seq, fragment_length, name):
+    if not checkpointdir:
+        return None
+    if full_seq:
+        unit = 'full-length'
+    else:
+        unit = str(fragment_length)
+    return '%ssensitivity-%s/%s.npz' %(checkpointdir, unit, name)
+
+def model_checkpoint(checkpointdir, name):
+    if not checkpointdir:
+        return None
+    return '%smodels/%s.hmm' %(checkpointdir, name)
+
+def remove_models(checkpointdir):
+    '''
+    Removes the leave-one-out models kept with the checkpoints. They are
+    reused by the full length and fragment passes (and every adaptive
+    sampling round), so this is done once the whole run has finished.
+    '''
+    if not checkpointdir:
+        return
+    modeldir = path.dirname(model_checkpoint(checkpointdir, ''))
+    if path.isdir(modeldir):
+        shutil.rmtree(modeldir)
+
+def scores_checkpoint(checkpointdir, resultsfile):
+    '''
+    The marker of a finished score file. It is kept with the checkpoints,
+    so that a new run (which removes them) searches again instead of
+    using the score files a previous run left in tmpdir.
+    '''
+    if not checkpointdir:
+        return None
+    return '%sscores/%s.done' %(checkpointdir, path.basename(resultsfile))
+
+def scores_done(checkpointdir, resultsfile):
+    marker = scores_checkpoint(checkpointdir, resultsfile)
+    return marker is not None and path.isfile(marker) and path.isfile(resultsfile)
+
+def mark_scores_done(checkpointdir, resultsfile):
+    marker = scores_checkpoint(checkpointdir, resultsfile)
+    if marker is None:
+        return
+    if not path.isdir(path.dirname(marker)):
+        makedirs(path.dirname(marker))
+    open(marker, 'w').close()
+
+def save_unit(checkpoint, names, scores, lines, comparison):
+    '''
+    Saves the result of one held-out unit. The file is written under a
+    temporary name and renamed, so a checkpoint is either complete or
+    missing.
+    '''
+    tmpfile = checkpoint + '.tmp'
+    with open(tmpfile, 'wb') as f:
+        np.savez(f, names=np.array(names, dtype=str), scores=scores,
+                lines=np.array(lines if lines is not None else [], dtype=str),
+                full_seq=lines is not None,
+                comparison=np.array(comparison if comparison is not None else [], dtype=float))
+    os.rename(tmpfile, checkpoint)
+
+def load_unit(checkpoint):
+    data = np.load(checkpoint)
+    try:
+        names = [str(name) for name in data['names']]
+        lines = None
+        if data['full_seq']:
+            lines = [str(line) for line in data['lines']]
+        comparison = None
+        if len(data['comparison']) > 0:
+            comparison = tuple(data['comparison'])
+        return names, data['scores'], lines, comparison
+    finally:
+        data.close()
+
+def store_model(hmmfile, target):
+    '''
+    Moves a built and pressed model to target. The .hmm file is moved
+    last, so a stored model is complete if it exists.
+    '''
+    for pressed in glob.glob(hmmfile + '.h3*'):
+        os.rename(pressed, target + pressed[len(hmmfile):])
+    os.rename(hmmfile, target)
+    return target
+
+def save_scores(resultsfile, scores):
+    tmpfile = resultsfile + '.tmp'
+    np.savetxt(tmpfile, scores, fmt='%f')
+    os.rename(tmpfile, resultsfile)
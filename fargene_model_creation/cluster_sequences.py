@@ -0,0 +1,59 @@
+import numpy as np
+
+KMER_SIZE = 5
+SKETCH_SIZE = 256
+
+def kmer_sketch(sequence, k=KMER_SIZE, sketch_size=SKETCH_SIZE):
+    '''
+    Returns the sketch_size smallest hashes of the k-mers of sequence
+    (a bottom MinHash sketch), sorted. Short sequences keep all k-mers,
+    so their sketch is exact.
+    '''
+    residues = np.frombuffer(sequence.upper().encode('ascii'), dtype=np.uint8).astype(np.uint64)
+    num_kmers = len(residues) - k + 1
+    if num_kmers <= 0:
+        return np.array([], dtype=np.uint64)
+    kmers = np.zeros(num_kmers, dtype=np.uint64)
+    for j in range(k):
+        kmers = kmers * np.uint64(128) + residues[j:j + num_kmers]
+    hashes = kmers * np.uint64(11400714819323198485)
+    hashes ^= hashes >> np.uint64(29)
+    return np.unique(hashes)[:sketch_size]
+
+def sketch_identity(jaccard, k=KMER_SIZE):
+    '''
+    Estimates the sequence identity from the k-mer Jaccard index
+    with the Mash distance, -ln(2J/(1+J))/k.
+    '''
+    with np.errstate(divide='ignore'):
+        distance = -np.log(2 * jaccard / (1 + jaccard)) / k
+    return np.clip(1 - distance, 0, 1)
+
+def greedy_clusters(sequences, identity, k=KMER_SIZE, sketch_size=SKETCH_SIZE):
+    '''
+    Clusters the sequences greedily, longest first: a sequence joins the
+    most similar representative if the estimated identity is at least
+    identity, otherwise it becomes a representative itself. Returns the
+    index of the representative of each sequence.
+    '''
+    sketches = [kmer_sketch(seq, k, sketch_size) for seq in sequences]
+    padding = np.iinfo(np.uint64).max
+    rep_sketches = np.full((len(sequences), sketch_size), padding, dtype=np.uint64)
+    rep_sizes = np.zeros(len(sequences))
+    representatives = []
+    assignment = np.empty(len(sequences), dtype=int)
+    for i in np.argsort([-len(seq) for seq in sequences], kind='mergesort'):
+        sketch = sketches[i]
+        num_reps = len(representatives)
+        if num_reps > 0 and len(sketch) > 0:
+            shared = np.isin(rep_sketches[:num_reps], sketch).sum(axis=1)
+            jaccard = shared / (rep_sizes[:num_reps] + len(sketch) - shared)
+            best = np.argmax(jaccard)
+            if sketch_identity(jaccard[best], k) >= identity:
+                assignment[i] = representatives[best]
+                continue
+        rep_sketches[num_reps, :len(sketch)] = sketch
+        rep_sizes[num_reps] = len(sketch)
+        representatives.append(i)
+        assignment[i] = i
+    return assignment
@@ -6,7 +6,12 @@ from estimate_sensitivity import estimate_sensitivity
 from estimate_specificity import estimate_specificity
 from estimate_specificity import create_model
 from MetaData import MetaData
+from checkpoints import prepare_checkpoints, remove_models
+from work_queue import WorkQueue, start_local_workers
 from calculate_performance import calculate_performance, summarize_sens_or_spec
+from adaptive_sampling import sample_adaptively
+from model_cache import open_cache, cache_key, build_cached, tool_versions
+from checkpoints import md5sum
 import logging
 
 def parse_args(argv):
@@ -25,12 +30,76 @@ def parse_args(argv):
     parser.add_argument('--modelname',dest = 'modelname',
                         help = 'The name of the new model' )
     
-    parser.add_argument('--fragment-lengths','-l',type=int,dest='fragment_lengths',
-                        help = 'The length (aa) of the fragments that should be used to determine the threshold score \n'\
-                                'for metagenomic input. (default: 33 AA)')
+    parser.add_argument('--fragment-lengths','-l',type=int,nargs='+',dest='fragment_lengths',
+                        help = 'One or more lengths (aa) of the fragments that should be used to determine the \n'\
+                                'threshold score for metagenomic input, e.g. 33 83 for 100 and 250 bp reads. \n'\
+                                'Each leave-one-out model is built once and searched with the fragments of all \n'\
+                                'lengths. (default: 33 AA)')
     parser.add_argument('--num-fragments',type=int,dest='num_fragments',
                         help = 'The number of fragments that should be created from each gene. '\
                                 '(default: 10 000)')
+    parser.add_argument('--ci-width',type=float,dest='ci_width',
+                        help = 'Sample the fragments in batches and stop when the 95%% confidence intervals of \n'\
+                                'the sensitivity and specificity at the suggested scores are at most this wide \n'\
+                                '(e.g. 0.01), or after --num-fragments fragments per gene. By default all \n'\
+                                '--num-fragments fragments are sampled.')
+    parser.add_argument('--batch-fragments',type=int,dest='batch_fragments',
+                        help = 'The number of fragments per gene in each batch with --ci-width (default: %(default)s).')
+
+    parser.add_argument('--score-step',type=float,dest='score_step',
+                        help = 'The spacing of the threshold scores in the resulting sensitivity and \n'\
+                                'specificity tables (default: %(default)s).')
+    parser.add_argument('--max-fpr',type=float,nargs='+',dest='max_fpr',
+                        help = 'One or more false positive rates for which the lowest threshold score \n'\
+                                'is suggested (default: 0 for full length genes, 0.05 for fragments).')
+    parser.add_argument('--target-sensitivity',type=float,nargs='+',dest='target_sensitivity',
+                        help = 'One or more sensitivities for which the highest threshold score \n'\
+                                'is suggested (default: %(default)s).')
+    parser.add_argument('--seed',type=int,dest='seed',
+                        help = 'Seed for the random fragment start positions, to make the fragments reproducible. \n'\
+                                'By default a random seed is drawn and written to the log.')
+    parser.add_argument('--processes','-p',type=int,dest='processes',
+                        help = 'The number of leave-one-out models that are built and searched in parallel '\
+                                '(default: %(default)s).')
+    parser.add_argument('--queue',dest='use_queue',action='store_true',
+                        help = 'Run the model builds and searches as units of a work queue in <output>/queue/. \n'\
+                                'The --processes local workers, and work_queue.py workers started on other \n'\
+                                'machines sharing the output directory, claim units from the queue.')
+    parser.add_argument('--lease',type=int,dest='lease',
+                        help = 'Seconds after which a queued unit is given to another worker if its worker \n'\
+                                'stopped renewing the lease (default: %(default)s).')
+    parser.add_argument('--shards',type=int,dest='shards',
+                        help = 'The number of parts of the negative sequences whose fragments are searched \n'\
+                                'in parallel when estimating the specificity (default: one per process).')
+    parser.add_argument('--threads',type=int,dest='threads',
+                        help = 'The number of threads each clustalo, hmmbuild and hmmsearch call may use. '\
+                                'By default the programs decide.')
+
+    parser.add_argument('--folds','-k',type=int,dest='folds',
+                        help = 'Estimate the sensitivity by k-fold cross-validation, building k models that \n'\
+                                'each leave out one fold of the reference sequences, instead of one model \n'\
+                                'per reference sequence (leave-one-out, the default).')
+    parser.add_argument('--cluster-identity',type=float,dest='cluster_identity',
+                        help = 'Cluster the reference sequences at this estimated identity (e.g. 0.95) and build \n'\
+                                'the leave-one-out models from one representative per cluster, weighting \n'\
+                                'the sensitivity by the cluster sizes. By default all sequences are used.')
+    parser.add_argument('--reuse-alignment',dest='reuse_alignment',action='store_true',
+                        help = 'Align the reference sequences once and build each leave-one-out model from \n'\
+                                'that alignment without the held-out sequence, instead of realigning the subsets.')
+    parser.add_argument('--agreement-sample',type=int,dest='agreement_sample',
+                        help = 'The number of leave-one-out models that are also built from a realignment \n'\
+                                'to report how well the scores agree with --reuse-alignment (default: %(default)s).')
+
+    parser.add_argument('--cache-dir',dest='cache_dir',
+                        help = 'A directory where the built models and the scores of the searches are kept \n'\
+                                'between runs, keyed by the sequences, the tool versions and the parameters, \n'\
+                                'so that e.g. a run with a new negative set only searches the negative sequences.')
+    parser.add_argument('--cache-size',type=int,dest='cache_size',
+                        help = 'The size in MB above which the least recently used cache entries are \n'\
+                                'removed (default: %(default)s).')
+    parser.add_argument('--resume',dest='resume',action='store_true',
+                        help = 'Resume an interrupted run in the same output directory, skipping the \n'\
+                                'models, searches and specificity estimates that were already finished.')
 
     parser.add_argument('--only-sens',dest='specificity',action='store_false',
                         help = 'Should be used if only sensitivity of the model should be estimated.')
@@ -52,7 +121,27 @@ def parse_args(argv):
             only_full_length = False,
             only_fragments = False,
             fragment_lengths = [33],
-            num_fragments = 10000)
+            num_fragments = 10000,
+            ci_width = None,
+            batch_fragments = 1000,
+            fragment_round = None,
+            score_step = 1.0,
+            max_fpr = None,
+            target_sensitivity = [0.90, 0.95],
+            seed = None,
+            processes = 1,
+            threads = None,
+            shards = None,
+            reuse_alignment = False,
+            resume = False,
+            use_queue = False,
+            lease = 60,
+            folds = None,
+            cluster_identity = None,
+            cache_dir = None,
+            cache_size = 2000,
+            tool_versions = None,
+            agreement_sample = 5)
     options = parser.parse_args()
     return options
 
@@ -64,9 +153,37 @@ def main():
         options.fragment_lengths = [options.fragment_lengths]
     tmpdir,resultsdir,hmmdir = create_dirs(options)
     logfile = '%s/model_creation_optimization.log' %(path.abspath(options.output_dir))
-    logging.basicConfig(filename=logfile,filemode='w',
+    if options.resume:
+        filemode = 'a'
+    else:
+        filemode = 'w'
+    logging.basicConfig(filename=logfile,filemode=filemode,
             format='%(asctime)s %(levelname)s %(message)s', level=logging.DEBUG)
 
+    options.checkpoint_dir = '%s/checkpoints/' %(path.abspath(options.output_dir))
+    prepare_checkpoints(options, options.checkpoint_dir, hmmdir)
+    logging.info('Fragments are created using seed %s' %(str(options.seed)))
+    if options.cache_dir:
+        options.tool_versions = tool_versions()
+        logging.info('Caching models and scores in %s, tool versions: %s' \
+                %(path.abspath(options.cache_dir), str(options.tool_versions)))
+
+    workers = []
+    options.queue_dir = None
+    if options.use_queue:
+        options.queue_dir = '%s/queue/' %(path.abspath(options.output_dir))
+        queue = WorkQueue(options.queue_dir, options.lease)
+        queue.reset()
+        workers = start_local_workers(options.queue_dir, options.processes)
+    try:
+        optimize_thresholds(options, tmpdir, resultsdir, hmmdir)
+    finally:
+        if options.use_queue:
+            queue.close()
+            for worker in workers:
+                worker.join()
+
+def optimize_thresholds(options, tmpdir, resultsdir, hmmdir):
     if options.only_full_length:
         full_lengths = [True]
     elif options.only_fragments:
@@ -78,21 +195,25 @@ def main():
         # TODO handle if the input is already fragments
         est_obj = MetaData(full_length,None,None,None,tmpdir,resultsdir,hmmdir)
 
-        if options.sensitivity:
-            estimate_sensitivity(options.reference_sequences,est_obj,options)
-        if options.specificity:
-            estimate_specificity(options, est_obj)
+        if options.ci_width and not full_length and options.sensitivity and options.specificity:
+            sample_adaptively(options, est_obj)
+        else:
+            if options.sensitivity:
+                estimate_sensitivity(options.reference_sequences,est_obj,options)
+            if options.specificity:
+                estimate_specificity(options, est_obj)
 
         if not options.sensitivity:
             summarize_sens_or_spec(est_obj,options,False)
         elif not options.specificity:
             summarize_sens_or_spec(est_obj,options,True)
         else:
-            calculate_performance(est_obj,1,options)
+            calculate_performance(est_obj,options)
 
     ''' If not specificity, create a HMM-model '''
     if not options.specificity:
         create_hmm(options,est_obj)
+    remove_models(options.checkpoint_dir)
 
 
 def create_dirs(options):
@@ -118,7 +239,12 @@ def create_hmm(args,est_obj):
     fastabasename = path.splitext(path.basename(args.reference_sequences))[0]
     alignfile = '%s/%s-aligned.fasta' %(path.abspath(tmpdir),fastabasename)
     hmmmodel = '%s/%s.hmm' %(path.abspath(modeldir),fastabasename)
-    create_model(args.reference_sequences, alignfile, hmmmodel)
+    cache = open_cache(args)
+    model_key = None
+    if cache is not None:
+        model_key = cache_key('model', args.tool_versions, 'sequences', md5sum(args.reference_sequences))
+    build_cached(cache, model_key, hmmmodel,
+            lambda: create_model(args.reference_sequences, alignfile, hmmmodel, args.threads))
 
 
 if __name__ == '__main__':
@@ -1,54 +1,99 @@
 from os import path, makedirs, system
-from random import randint
 from multiprocessing import Pool, cpu_count
 from distutils.spawn import find_executable
 import glob
 import shlex, subprocess
 import glob
+import hashlib
 import argparse
 import os
 import time
 import logging
+import threading
+import numpy as np
+from itertools import chain
+from generate_fragments import fragment_rng, fragment_chunks, sampling_round, length_label
+from cluster_sequences import greedy_clusters
+from work_queue import WorkQueue
+from checkpoints import unit_checkpoint, model_checkpoint, save_unit, load_unit, store_model, md5sum
+from model_cache import open_cache, cache_key, build_cached
 
+# The reference sequences (and their master alignment in the alignment
+# reuse mode), loaded once and shared with the pool workers
+reference_store = None
+master_alignment = None
 
 def estimate_sensitivity(reference_sequences, est_obj,args):
     full_seq = est_obj.full_length 
     modelpath = './' + args.modelname + '/'
     tmpdir = est_obj.tmpdir
     resultsdir = est_obj.resultsdir
+    store = load_reference_sequences(reference_sequences)
+    weights = None
+    if args.cluster_identity:
+        clusterfile = '%s/%s-reference-clusters.txt' %(path.abspath(resultsdir),args.modelname)
+        store, weights = reduce_redundancy(store, args.cluster_identity, clusterfile)
+        est_obj.cluster_sizes = weights
+        reference_sequences = write_representatives(store, reference_sequences, tmpdir)
+    folds = assign_folds(len(store), args.folds, args.seed)
+    alignment = None
+    if args.reuse_alignment:
+        alignment = align_reference_sequences(reference_sequences, args.checkpoint_dir or tmpdir, len(store), args.threads)
+        compared = set(agreement_sample(len(folds), args.agreement_sample))
+    else:
+        compared = set()
 
-    for FRAGMENT_LENGTH in args.fragment_lengths:
-        if full_seq:
-            target = 'for full length genes...'
-        else:
-            target = 'for fragments of lengths %s AA...' %(str(FRAGMENT_LENGTH))
-        print '\nEstimating sensitivity %s' %target
-
-        create_subsets(reference_sequences,tmpdir, args.num_fragments, int(FRAGMENT_LENGTH), full_seq)
-        modelfiles = glob.glob(tmpdir + "without*")
-        fragmentfiles = glob.glob(tmpdir + "fragments-*")
-        for modelfile in modelfiles:
-            modelbasename = path.basename(modelfile).split('-')[1]
-            alignfile = tmpdir + modelfile.split('/')[-1] + ".aligned"
-            hmmfile =  alignfile + ".hmm"
-            create_model(modelfile, alignfile, hmmfile)
-            for fragmentfile in fragmentfiles:
-                if path.basename(fragmentfile).split('-')[1] == modelbasename:
-                    fragment = fragmentfile
-                    outputfile = "%s%s-hmmsearched.out" %(tmpdir,path.basename(modelfile))
-            run_hmmsearch(hmmfile, fragment, outputfile,tmpdir)
-            remove_tmp_files([alignfile,modelfile,fragment])
-            remove_tmp_files(glob.glob(hmmfile + "*"))
-        truehmm = glob.glob(tmpdir + "*-hmmsearched.out")
-        if full_seq:
-            resultsfile = '%s%s_full_length_sensitivity_scores.txt' %(tmpdir,args.modelname)
-            sum_hmmsearch_file = '%s/%s-hmmsearch-reference-sequences-full-length.txt' %(path.abspath(resultsdir),args.modelname)
-            extract_full_seq_hmm_info(truehmm,sum_hmmsearch_file)
-        else:
-            resultsfile = '%s%s_%s_sensitivity_scores.txt' %(tmpdir,args.modelname,str(FRAGMENT_LENGTH))
-        pooled_sort_hmmerfiles(truehmm,resultsfile)
+    if full_seq:
+        target = 'for full length genes...'
+        lengths = 'full-length'
+    else:
+        target = 'for fragments of lengths %s AA...' %(', '.join([str(length) for length in args.fragment_lengths]))
+        lengths = length_label(args.fragment_lengths)
+    print '\nEstimating sensitivity %s' %target
+    if args.checkpoint_dir:
+        for checkpoint in [unit_checkpoint(args.checkpoint_dir, full_seq, lengths, ''),
+                model_checkpoint(args.checkpoint_dir, '')]:
+            if not path.isdir(path.dirname(checkpoint)):
+                makedirs(path.dirname(checkpoint))
+
+    jobs = [(held_out, tmpdir, full_seq, [int(length) for length in args.fragment_lengths], i in compared, args) \
+            for i, held_out in enumerate(folds)]
+    if args.queue_dir:
+        results = WorkQueue(args.queue_dir).map('sensitivity-%s' %(lengths), build_and_search, jobs,
+                init_worker, (store, alignment))
+    else:
+        p = Pool(args.processes, init_worker, (store, alignment))
+        results = p.map(build_and_search, jobs)
+        p.close()
+        p.join()
+    if compared:
+        agreementfile = '%s/%s-alignment-reuse-agreement-%s.txt' %(path.abspath(resultsdir),args.modelname,lengths)
+        write_agreement(results, [job_name(held_out, store) for held_out in folds], agreementfile)
+    scores = np.concatenate([result[1] for result in results])
+    names = [name for result in results for name in result[0]]
+    if full_seq:
+        resultsfile = '%s%s_full_length_sensitivity_scores.txt' %(tmpdir,args.modelname)
+        sum_hmmsearch_file = '%s/%s-hmmsearch-reference-sequences-full-length.txt' %(path.abspath(resultsdir),args.modelname)
+        extract_full_seq_hmm_info([result[2] for result in results],sum_hmmsearch_file)
+        save_sensitivity_scores(resultsfile, scores, names, store, weights, full_seq)
+        est_obj.sens_score_file = resultsfile
+        return
+    est_obj.sens_score_files = {}
+    for fragment_length in args.fragment_lengths:
+        resultsfile = sensitivity_scores_file(tmpdir, args, fragment_length)
+        is_length = np.array([name.rsplit('_', 2)[1] == str(fragment_length) for name in names], dtype=bool)
+        save_sensitivity_scores(resultsfile, scores[is_length], np.array(names, dtype=object)[is_length],
+                store, weights, full_seq)
+        est_obj.sens_score_files[fragment_length] = resultsfile
         est_obj.sens_score_file = resultsfile
-        remove_tmp_files(truehmm)
+
+def save_sensitivity_scores(resultsfile, scores, names, store, weights, full_seq):
+    if weights is not None:
+        scores = np.column_stack((scores, score_weights(names, store, weights, full_seq)))
+    np.savetxt(resultsfile, scores, fmt='%f')
+
+def sensitivity_scores_file(tmpdir, args, fragment_length):
+    return '%s%s_%s_sensitivity_scores%s.txt' %(tmpdir,args.modelname,str(fragment_length),sampling_round(args)[2])
 
 def main():
     parser = argparse.ArgumentParser()
@@ -58,21 +103,161 @@ def main():
     parser.add_argument('--num-fragments',dest='num_fragments')
     full_seq = False
     parser.set_defaults(fragment_lengths = [33],
-            num_fragments = 10000)
+            num_fragments = 10000,
+            fragment_round = None,
+            batch_fragments = 1000,
+            processes = 1,
+            threads = None,
+            reuse_alignment = False,
+            agreement_sample = 0,
+            checkpoint_dir = None,
+            queue_dir = None,
+            folds = None,
+            cluster_identity = None,
+            cache_dir = None,
+            cache_size = None,
+            tool_versions = None,
+            seed = 1)
     args = parser.parse_args()
     estimate_sensitivity(args.reference_sequences,full_seq,args)
 
-def create_fragments(sequence, num_fragments, fragment_length):
-    fragments = []
-    sequence_length = len(sequence)
-    max_start = sequence_length - fragment_length 
-    for i in range(0,int(num_fragments)):
-        start = randint(0,max_start)
-        fragments.append(sequence[start:start+fragment_length])
-    return fragments
-
-def create_subsets(fastafile,subsetpath,num_fragments, fragment_length,full_seq):
-    header_list = []
+def build_and_search(job):
+    '''
+    One leave-one-out unit: builds the model without the held-out sequence
+    (or all sequences of the held-out fold in the k-fold mode) and searches
+    the held-out sequences (or their fragments of all fragment_lengths)
+    with it in one hmmsearch.
+    The subset file is written just before it is needed and, as all
+    intermediate files, kept in a directory of their own, so
+    that the units can run in parallel and the disk usage is bounded by
+    the number of processes. In the alignment reuse mode the model is
+    built from the master alignment without the held-out row, and if
+    compare is set also from a realignment of the subset, to measure how
+    well the two agree. Returns the targets and their best scores, the domtblout
+    lines for full length sequences and the comparison (None if not compared).
+    With checkpoints, the result of a finished unit is loaded instead, and
+    the model is kept so that the full length and fragment passes (every
+    adaptive sampling round and resumed runs) build it only once; the
+    models are removed when the whole run has finished. With a cache
+    (--cache-dir), models and results are also reused across runs with
+    the same subset, tools and parameters.
+    '''
+    held_out, tmpdir, full_seq, fragment_lengths, compare, args = job
+    headername = job_name(held_out, reference_store)
+    suffix = '' if full_seq else sampling_round(args)[2]
+    checkpoint = unit_checkpoint(args.checkpoint_dir, full_seq, length_label(fragment_lengths), headername + suffix)
+    if checkpoint and path.isfile(checkpoint):
+        return load_unit(checkpoint)
+    jobdir = '%sjob-%s/' %(tmpdir, headername)
+    if not path.isdir(jobdir):
+        makedirs(jobdir)
+    modelfile = '%swithout-%s.fasta' %(jobdir, headername)
+    alignfile = '%swithout-%s.fasta.aligned' %(jobdir, headername)
+    if master_alignment is None:
+        write_subset(held_out, modelfile)
+    else:
+        write_subset_alignment(held_out, alignfile)
+    database_size = None if full_seq else len(held_out) * int(args.num_fragments)
+    cache = open_cache(args)
+    model_key = None
+    result = None
+    if cache is not None:
+        if master_alignment is None:
+            model_key = cache_key('model', args.tool_versions, 'sequences', md5sum(modelfile))
+        else:
+            model_key = cache_key('model', args.tool_versions, 'alignment', md5sum(alignfile))
+        unit_key = cache_key('sensitivity', model_key, held_out_digest(held_out), [int(index) for index in held_out],
+                full_seq, fragment_lengths, args.seed, sampling_round(args)[:2], database_size, compare)
+        result = cache.fetch_unit(unit_key)
+    if result is None:
+        result = search_held_out(held_out, jobdir, headername, modelfile, alignfile, full_seq, fragment_lengths,
+                compare, database_size, cache, model_key, args)
+        if cache is not None:
+            cache.store_unit(unit_key, *result)
+    for tmpfile in [alignfile, modelfile]:
+        if path.isfile(tmpfile):
+            remove_tmp_files([tmpfile])
+    os.rmdir(jobdir)
+    names, scores, lines, comparison = result
+    if checkpoint:
+        save_unit(checkpoint, names, scores, lines, comparison)
+    return names, scores, lines, comparison
+
+def search_held_out(held_out, jobdir, headername, modelfile, alignfile, full_seq, fragment_lengths,
+        compare, database_size, cache, model_key, args):
+    '''
+    Builds (or loads from the checkpoints or the cache) the model of a
+    leave-one-out unit from its subset file, and searches the held-out
+    sequences with it, see build_and_search.
+    '''
+    hmmfile = model_checkpoint(args.checkpoint_dir, headername)
+    if hmmfile is None or not path.isfile(hmmfile):
+        builtfile = alignfile + '.hmm'
+        if master_alignment is None:
+            build = lambda: create_model(modelfile, alignfile, builtfile, args.threads)
+        else:
+            build = lambda: build_model(alignfile, builtfile, args.threads)
+        build_cached(cache, model_key, builtfile, build)
+        if hmmfile is None:
+            hmmfile = builtfile
+        else:
+            store_model(builtfile, hmmfile)
+    lines = [] if full_seq else None
+    names, scores = search_scores(hmmfile, job_fragments(held_out, full_seq, fragment_lengths, args), args.threads,
+            lines, database_size)
+    comparison = None
+    if compare:
+        if not path.isfile(modelfile):
+            write_subset(held_out, modelfile)
+        realignedfile = '%swithout-%s.fasta.realigned' %(jobdir, headername)
+        realignedhmm = realignedfile + '.hmm'
+        create_model(modelfile, realignedfile, realignedhmm, args.threads)
+        realigned = search_scores(realignedhmm, job_fragments(held_out, full_seq, fragment_lengths, args), args.threads,
+                database_size=database_size)
+        comparison = compare_scores((names, scores), realigned)
+        remove_tmp_files([realignedfile])
+        remove_tmp_files(glob.glob(realignedhmm + "*"))
+    if not args.checkpoint_dir:
+        remove_tmp_files(glob.glob(hmmfile + "*"))
+    return names, scores, lines, comparison
+
+def init_worker(store, alignment=None):
+    global reference_store, master_alignment
+    reference_store = store
+    master_alignment = alignment
+
+def assign_folds(num_sequences, folds=None, seed=None):
+    '''
+    Splits the indices of the reference sequences into folds that are
+    held out together. Without folds (or with at least one fold per
+    sequence) every sequence is a fold of its own, i.e. leave-one-out.
+    The sequences are shuffled with seed before they are split.
+    '''
+    if not folds or folds >= num_sequences:
+        return [(index,) for index in range(num_sequences)]
+    indices = np.random.RandomState(seed).permutation(num_sequences)
+    return [tuple(sorted(fold)) for fold in np.array_split(indices, folds)]
+
+def held_out_digest(held_out):
+    ''' Hashes the held-out sequences, which their fragments are cut from. '''
+    checksum = hashlib.md5()
+    for index in held_out:
+        checksum.update('%s\n%s\n' %(reference_store[index][1], reference_store[index][2]))
+    return checksum.hexdigest()
+
+def job_name(held_out, store):
+    if len(held_out) == 1:
+        return store[held_out[0]][0]
+    return 'fold-%s' %(store[held_out[0]][0])
+
+def load_reference_sequences(fastafile):
+    '''
+    Reads the reference sequences once. Returns a list of
+    (headername, header, sequence), where headername is the
+    sanitized and unique name used for the leave-one-out files.
+    '''
+    store = []
+    header_list = set()
     unique_count = 1
     for header, seq in read_fasta(fastafile, False):
         headername = header.split()[0]
@@ -82,111 +267,252 @@ def create_subsets(fastafile,subsetpath,num_fragments, fragment_length,full_seq)
         if headername in header_list:
             headername = headername + '_' + str(unique_count)
             unique_count = unique_count + 1
-        header_list.append(headername)
-        fragmentfile = open(subsetpath + "fragments-" + headername + ".fasta",'w')
-        if not full_seq: 
-            fragments = create_fragments(seq, num_fragments, fragment_length)
-            for i,fragment in enumerate(fragments):
-                fragmentfile.write('>%s_%s\n%s\n' %(headername,str(i),fragment))
-        else:
-            fragmentfile.write('>%s\n%s\n' %(header,seq))
-        
-        subsetfile = open(subsetpath + "without-" + headername + ".fasta","w")
+        header_list.add(headername)
+        store.append((headername, header, seq))
+    return store
+
+def reduce_redundancy(store, identity, clusterfile):
+    '''
+    Clusters the reference sequences at identity and keeps one
+    representative per cluster for the leave-one-out models. Returns the
+    representatives and the size of their clusters, by which their
+    scores are weighted. The clusters are written to clusterfile.
+    '''
+    assignment = greedy_clusters([seq for headername, header, seq in store], identity)
+    representatives = sorted(set(assignment))
+    sizes = np.bincount(assignment, minlength=len(store))
+    with open(clusterfile,'w') as f:
+        f.write('Representative\tSize\tMembers\n')
+        for rep in representatives:
+            members = [store[i][0] for i in np.where(assignment == rep)[0]]
+            f.write('%s\t%d\t%s\n' %(store[rep][0], sizes[rep], ','.join(members)))
+    msg = 'Clustered %s reference sequences at %s identity into %s clusters, see %s' \
+            %(str(len(store)), str(identity), str(len(representatives)), clusterfile)
+    logging.info(msg)
+    print msg
+    return [store[i] for i in representatives], sizes[representatives]
+
+def write_representatives(store, fastafile, tmpdir):
+    fastabasename = path.splitext(path.basename(fastafile))[0]
+    representativesfile = '%s%s-representatives.fasta' %(tmpdir, fastabasename)
+    with open(representativesfile,'w') as f:
+        for headername, header, seq in store:
+            f.write('>%s\n%s\n' %(header,seq))
+    return representativesfile
+
+def score_weights(names, store, weights, full_seq):
+    '''
+    The weight of each hit, the size of the cluster of the held-out
+    sequence it comes from.
+    '''
+    if full_seq:
+        weight = dict((header.split()[0], w) for (headername, header, seq), w in zip(store, weights))
+        return np.array([weight[name] for name in names], dtype=float)
+    weight = dict((headername, w) for (headername, header, seq), w in zip(store, weights))
+    return np.array([weight[name.rsplit('_', 2)[0]] for name in names], dtype=float)
+
+def job_fragments(held_out, full_seq, fragment_lengths, args):
+    '''
+    The held-out sequences, or their fragments of all lengths, in FASTA
+    format. The fragments only depend on the seed, the index of the
+    sequence, the length and the sampling round, not on the folds or on
+    the other lengths of the sweep.
+    '''
+    if full_seq:
+        return ['>%s\n%s\n' %(reference_store[index][1],reference_store[index][2]) for index in held_out]
+    num_fragments, keys, suffix = sampling_round(args)
+    return chain.from_iterable(fragment_chunks([(reference_store[index][0], reference_store[index][2])],
+            num_fragments, [fragment_length], fragment_rng(args.seed, 1, int(fragment_length), index, *keys)) \
+            for index in held_out for fragment_length in fragment_lengths)
+
+def write_subset(held_out, subsetfile):
+    ''' Writes all reference sequences except the held-out ones. '''
+    with open(subsetfile,'w') as f:
+        for i, (headername, header, seq) in enumerate(reference_store):
+            if i not in held_out:
+                f.write('>%s\n%s\n' %(header,seq))
+
+def align_reference_sequences(fastafile, tmpdir, num_sequences, threads=None):
+    '''
+    Aligns the whole reference set once for the alignment reuse mode.
+    Returns the aligned rows in the order of the reference sequences.
+    '''
+    fastabasename = path.splitext(path.basename(fastafile))[0]
+    alignfile = '%s%s-master-aligned.fasta' %(tmpdir, fastabasename)
+    if not path.isfile(alignfile):
+        align_sequences(fastafile, alignfile + '.tmp', threads)
+        os.rename(alignfile + '.tmp', alignfile)
+    alignment = [seq.upper() for header, seq in read_fasta(alignfile, False)]
+    if len(alignment) != num_sequences:
+        logging.critical('The master alignment %s does not contain all %s reference sequences' \
+                %(alignfile, str(num_sequences)))
+        exit()
+    return alignment
+
+def write_subset_alignment(held_out, alignfile):
+    '''
+    Writes the master alignment without the held-out rows and without
+    the columns that only contain gaps in the remaining rows.
+    '''
+    rows = [row for i, row in enumerate(master_alignment) if i not in held_out]
+    matrix = np.frombuffer(''.join(rows).encode('ascii'), dtype=np.uint8).reshape(len(rows), -1)
+    keep = np.any((matrix != ord('-')) & (matrix != ord('.')), axis=0)
+    headers = [header for i, (headername, header, seq) in enumerate(reference_store) if i not in held_out]
+    with open(alignfile,'w') as f:
+        for header, row in zip(headers, matrix[:,keep]):
+            f.write('>%s\n%s\n' %(header, row.tostring().decode('ascii')))
 
-        for header2, seq2 in read_fasta(fastafile, True):
-            if not header == header2:
-                subsetfile.write(">%s\n%s\n" %(header2,seq2))
+def agreement_sample(num_sequences, sample_size):
+    ''' Evenly spaced leave-one-out units that are also realigned. '''
+    if sample_size <= 0:
+        return []
+    sample_size = min(sample_size, num_sequences)
+    return sorted(set(np.linspace(0, num_sequences - 1, sample_size).astype(int)))
+
+def compare_scores(reused, realigned):
+    '''
+    Compares the best score per target from the model built from the
+    master alignment with the one built from a realignment.
+    '''
+    reused = dict(zip(*reused))
+    realigned = dict(zip(*realigned))
+    common = [name for name in reused if name in realigned]
+    differences = np.array([reused[name] - realigned[name] for name in common])
+    if len(common) > 0:
+        mean_diff, max_diff = np.mean(np.abs(differences)), np.max(np.abs(differences))
+    else:
+        mean_diff, max_diff = float('nan'), float('nan')
+    return (len(reused), len(realigned), np.mean(list(reused.values()) or [np.nan]),
+            np.mean(list(realigned.values()) or [np.nan]), mean_diff, max_diff)
 
-def create_model(fastafile, alignfile, hmmfile):
+def write_agreement(results, names, agreementfile):
+    compared = [(names[i], comparison) for i, (targets, scores, lines, comparison) in enumerate(results) \
+            if comparison is not None]
+    with open(agreementfile,'w') as f:
+        f.write('Sequence\tHits_reused\tHits_realigned\tMean_score_reused\t'\
+                'Mean_score_realigned\tMean_abs_difference\tMax_abs_difference\n')
+        for headername, comparison in compared:
+            f.write('%s\t%d\t%d\t%.2f\t%.2f\t%.2f\t%.2f\n' %((headername,) + comparison))
+    mean_diff = np.nanmean([comparison[4] for headername, comparison in compared])
+    msg = 'Alignment reuse: mean absolute score difference to realigned models is %.2f '\
+            '(%s leave-one-out models compared, see %s)' %(mean_diff, str(len(compared)), agreementfile)
+    logging.info(msg)
+    print msg
+
+def align_sequences(fastafile, alignfile, threads=None):
     clustalo_path = find_executable('clustalo')
     if clustalo_path:
         logging.debug('Found clustalo at: %s', clustalo_path)
     else:
         logging.critical('Cannot find Clustal Omega (clustalo)!')
         exit()
-    call_list = ''.join(['clustalo -quiet -infile=',fastafile, \
-            ' -align -outfile=',alignfile, ' -output=fasta'])
+    clustalo_threads = thread_flags(threads)[0]
+    call_list = ''.join(['clustalo -quiet',clustalo_threads,' -infile=',fastafile, \
+            ' -align -outfile=',alignfile, ' -output=fasta --output-order=input-order'])
     commands = shlex.split(call_list)
     with open(os.devnull,'w') as devnull:
         subprocess.Popen(commands, stdin=subprocess.PIPE,
                 stderr=subprocess.PIPE, stdout=devnull).communicate()
-    
-        call_list = ''.join(['hmmbuild ',hmmfile,' ', alignfile])
+
+def build_model(alignfile, hmmfile, threads=None):
+    hmmer_threads = thread_flags(threads)[1]
+    with open(os.devnull,'w') as devnull:
+        call_list = ''.join(['hmmbuild',hmmer_threads,' ',hmmfile,' ', alignfile])
         commands = shlex.split(call_list)
         subprocess.Popen(commands, stdin=subprocess.PIPE,
                 stderr=subprocess.PIPE,stdout=devnull).communicate()
     
-        call_list = ''.join(['hmmpress ', hmmfile])
+        call_list = ''.join(['hmmpress -f ', hmmfile])
         commands = shlex.split(call_list)
         subprocess.Popen(commands, stdin=subprocess.PIPE,
                 stderr=subprocess.PIPE,stdout=devnull).communicate()
 
+def create_model(fastafile, alignfile, hmmfile, threads=None):
+    align_sequences(fastafile, alignfile, threads)
+    build_model(alignfile, hmmfile, threads)
+
+
+def thread_flags(threads):
+    ''' Returns the thread options for clustalo and HMMER, empty if not given. '''
+    if not threads:
+        return '', ''
+    return ' --threads=%s' %(str(threads)), ' --cpu %s' %(str(threads))
+
+def feed_stdin(stdin, chunks):
+    try:
+        for chunk in chunks:
+            stdin.write(chunk)
+    except IOError:
+        logging.error('hmmsearch stopped reading its input')
+    finally:
+        stdin.close()
+
+def search_scores(hmmfile, chunks, threads=None, lines=None, database_size=None):
+    '''
+    Runs hmmsearch on sequences written to its stdin, so that the
+    fragments never have to be stored on disk, and reduces the domtblout
+    output as it is read from its stdout. Returns the target names and
+    their best scores (see reduce_domtblout). database_size sets the
+    number of targets the E-values are computed for, so that a search
+    split into shards reports the same hits as the whole search.
+    '''
+    size_flags = ''
+    if database_size:
+        size_flags = ' -Z %d --domZ %d' %(database_size, database_size)
+    call_list = ''.join(['hmmsearch',thread_flags(threads)[1],' --max -E 1000 --domE 1000',size_flags, \
+            ' --tformat fasta -o /dev/null --domtblout /dev/stdout ', hmmfile, ' -'])
+    commands = shlex.split(call_list)
+    logging.info('Running command:\n%s' %(call_list))
+    with open(os.devnull,'w') as devnull:
+        process = subprocess.Popen(commands, stdin=subprocess.PIPE,
+                stderr=devnull, stdout=subprocess.PIPE)
+        writer = threading.Thread(target=feed_stdin, args=(process.stdin, chunks))
+        writer.start()
+        names, scores = reduce_domtblout(process.stdout, lines)
+        writer.join()
+        process.wait()
+    logging.info('Done')
+    return names, scores
+
+def reduce_domtblout(domtblout, lines=None):
+    '''
+    Keeps the best domain score of each target in one pass over hmmsearch
+    --domtblout output. Returns the target names and a NumPy array of
+    their scores in the same order. All lines are also appended to lines,
+    if given.
+    '''
+    best = {}
+    for line in domtblout:
+        if lines is not None:
+            lines.append(line)
+        if line.startswith('#'):
+            continue
+        fields = line.split(None, 14)
+        name, score = fields[0], float(fields[13])
+        if score > best.get(name, -np.inf):
+            best[name] = score
+    names = list(best.keys())
+    return names, np.fromiter((best[name] for name in names), dtype=float, count=len(names))
 
-def run_hmmsearch(hmmfile, fragmentfile, outputfile, tmpdir):
-    call_list = ''.join(['hmmsearch --max -E 1000 --domE 1000 --domtblout ',outputfile, \
+def run_hmmsearch(hmmfile, fragmentfile, outputfile, tmpdir, threads=None):
+    call_list = ''.join(['hmmsearch',thread_flags(threads)[1],' --max -E 1000 --domE 1000 --domtblout ',outputfile, \
             ' ', hmmfile, ' ', fragmentfile])
     commands = shlex.split(call_list)
     msg =  'Running command:\n%s' %(call_list)
     logging.info(msg)
-    tmpfile = open(tmpdir + 'hmmer_stdout.txt','w')
     with open(os.devnull,'w') as devnull:
         subprocess.Popen(commands, stdin=subprocess.PIPE,
             stderr=subprocess.PIPE, stdout=devnull).communicate()
     logging.info('Done')
 
-def sort_hmmerfiles(hmmerfileslist,outfile,full_seq):
-    score = []
-    name_dic = {}
-    for hmm in hmmerfileslist:
-        hmm = open(hmm,'r')
-        for line in hmm:
-            if not line.startswith('#'):
-                line = line.split()
-                name = line[0]
-                score = float(line[13])
-                if not name in name_dic.keys():
-                    name_dic[name] = score
-                elif name_dic[name] < score:
-                    name_dic[name] = score
-    
-    outfile = open(outfile,'w')
-    for item in name_dic.values():
-        outfile.write('%f\n' %(item))
-
-def pooled_sort_hmmerfiles(hmmerfileslist,outfile):
-    p = Pool(cpu_count())
-    scores = p.map(sort_one_hmmerfile,hmmerfileslist)
-    outfile = open(outfile,'w')
-    for score_list in scores:
-        for item in score_list:
-            outfile.write('%f\n' %(item))
-
-
-def sort_one_hmmerfile(hmmfile):
-    hmm = open(hmmfile,'r')
-    name_dic = {}
-    for line in hmm:
-        if not line.startswith('#'):
-            line = line.split()
-            name = line[0]
-            score = float(line[13])
-            if not name in name_dic.keys():
-                name_dic[name] = score
-            elif name_dic[name] < score:
-                name_dic[name] = score
-    return name_dic.values()
-
-def extract_full_seq_hmm_info(hmmerfileslist,outfile):
+def extract_full_seq_hmm_info(hmmerlineslist,outfile):
     out = open(outfile,'w')
-    with open(hmmerfileslist[0],'r') as f:
-        for i,line in enumerate(f):
-            if i < 3:
+    for line in hmmerlineslist[0][:3]:
+        out.write(line)
+    for hmmerlines in hmmerlineslist:
+        for line in hmmerlines:
+            if not line.startswith('#'):
                 out.write(line)
-    for hmmerfile in hmmerfileslist:
-        with open(hmmerfile,'r') as f:
-            for line in f:
-                if not line.startswith('#'):
-                    out.write(line)
     out.close()
         
 
@@ -3,8 +3,15 @@ from os import path, makedirs
 import os
 import argparse
 #from read_fasta import read_fasta
-from random import randint
+from estimate_sensitivity import thread_flags, search_scores, reduce_domtblout
+import numpy as np
+from generate_fragments import fragment_rng, fragment_chunks, split_by_length, sampling_round
+from checkpoints import store_model, save_scores, md5sum, scores_done, mark_scores_done
+from model_cache import open_cache, cache_key, build_cached
+from work_queue import WorkQueue
+from itertools import chain
 import logging
+from multiprocessing import Pool
 
 def main():
     parser = argparse.ArgumentParser()
@@ -17,7 +24,18 @@ def main():
 
     parser.set_defaults(fragment_lengths = [33],
             num_fragments = 10000,
-            create_fragments = True)
+            fragment_round = None,
+            batch_fragments = 1000,
+            create_fragments = True,
+            threads = None,
+            checkpoint_dir = None,
+            queue_dir = None,
+            processes = 1,
+            shards = None,
+            cache_dir = None,
+            cache_size = None,
+            tool_versions = None,
+            seed = 1)
     args = parser.parse_args()
 
     full_seq = False
@@ -44,95 +62,147 @@ def estimate_specificity(args,est_obj):
     alignfile = '%s/%s-aligned.fasta' %(path.abspath(tmpdir),fastabasename)
     hmmmodel = '%s/%s.hmm' %(path.abspath(modeldir),fastabasename)
     summarized_hmmsearchfile = '%s/%s-hmmsearch-negative-sequences-full-length.txt' %(path.abspath(est_obj.resultsdir),args.modelname)
-    create_model(args.reference_sequences, alignfile, hmmmodel)
+    cache = open_cache(args)
+    model_key = None
+    if cache is not None:
+        model_key = cache_key('model', args.tool_versions, 'sequences', md5sum(args.reference_sequences))
+    if not args.checkpoint_dir:
+        build_cached(cache, model_key, hmmmodel,
+                lambda: create_model(args.reference_sequences, alignfile, hmmmodel, args.threads))
+    elif not path.isfile(hmmmodel):
+        builtmodel = '%s/%s.hmm' %(path.abspath(tmpdir),fastabasename)
+        build_cached(cache, model_key, builtmodel,
+                lambda: create_model(args.reference_sequences, alignfile, builtmodel, args.threads))
+        store_model(builtmodel, hmmmodel)
 
     print 'Estimating specificity...'
     
     #if full_seq:
     #    args.create_fragments = False
 
+    if not full_seq and args.create_fragments:
+        search_negative_fragments(hmmmodel, tmpdir, args, est_obj)
+        return
     
     for fragment_length in args.fragment_lengths:
         #TODO handle full length sequences
-        if not full_seq and args.create_fragments:
-            fastabasename = path.splitext(path.basename(args.negative_sequences))[0]
-            targetfile = '%s/%s-fragmented-%s.fasta' %(path.abspath(tmpdir),fastabasename,str(fragment_length))
-            create_subsets(args.negative_sequences,targetfile,args.num_fragments,int(fragment_length))
-        else:
-            targetfile = args.negative_sequences
+        targetfile = args.negative_sequences
 
         hmmsearchfile = '%s/specificity_%s-hmmsearched.out' %(path.abspath(tmpdir),str(fragment_length))
         if full_seq:                                                                      
             resultsfile = '%s/%s_full_length_specificity_scores.txt' %(tmpdir,args.modelname)
         else:                                                                             
             resultsfile = '%s/%s_%s_specificity_scores.txt' %(tmpdir,args.modelname,str(fragment_length))
+        est_obj.spec_score_file = resultsfile
+        if scores_done(args.checkpoint_dir, resultsfile):
+            continue
         
-        run_hmmsearch(hmmmodel, targetfile, hmmsearchfile)
+        run_hmmsearch(hmmmodel, targetfile, hmmsearchfile, args.threads)
         
-        extract_scores(hmmsearchfile,resultsfile)
-        sort_scores(resultsfile)
-        est_obj.spec_score_file = resultsfile
+        with open(hmmsearchfile) as f:
+            names, scores = reduce_domtblout(f)
         if full_seq:
             move_tmp_file(hmmsearchfile,summarized_hmmsearchfile)
             #remove_tmp_files([hmmsearchfile])
         else:
-            remove_tmp_files([targetfile,hmmsearchfile])
-
-def extract_scores(hmmsearchfile,resultsfile):
-    commands = "grep -v '^#' " + hmmsearchfile + " | awk '{print $1,$14}' > " + resultsfile
-    msg = "Running command: " + commands
-    logging.info(msg)
-    subprocess.call(commands, shell=True)
-    logging.info("Done")
-
-def sort_scores(resultsfile):
-    name_dic = {}
-    with open(resultsfile,'r') as f:
-        for line in f:
-            line = line.split()
-            name,score = line[0],float(line[1])
-            if not name in name_dic:
-                name_dic[name] = score
-            elif name_dic[name] < score:
-                name_dic[name] = score
-    with open(resultsfile,'w') as f:
-        for score in name_dic.values():
-            f.write('%f\n' %(score))
-
-def create_fragments(sequence, num_fragments, fragment_length):
-    fragments = []                                             
-    sequence_length = len(sequence)                            
-    max_start = sequence_length - fragment_length              
-    for i in range(0,num_fragments):                           
-        start = randint(0,max_start)                           
-        fragments.append(sequence[start:start+fragment_length])
-    return fragments                                           
-
-def create_subsets(fastafile,fragmentfile,num_fragments,fragment_length):
-    f = open(fragmentfile,'a')
-    for header, seq in read_fasta(fastafile):
-        fragments = create_fragments(seq,num_fragments,fragment_length)
-        for i,fragment in enumerate(fragments):
-            f.write('>%s_%s\n%s\n' %(header.split()[0],str(i),fragment))
-
-
-def create_model(fastafile, alignfile, hmmfile):                
+            remove_tmp_files([hmmsearchfile])
+        save_scores(resultsfile, scores)
+        mark_scores_done(args.checkpoint_dir, resultsfile)
+
+def search_negative_fragments(hmmmodel, tmpdir, args, est_obj):
+    '''
+    Searches the fragments of all lengths of the negative sequences.
+    The negative sequences are split into shards (one per process by
+    default) that are searched in parallel, each by one hmmsearch
+    to which the fragments of all lengths are streamed instead of being
+    written to disk. As each fragment belongs to one shard, the best scores
+    per fragment of the shards are merged by concatenation. Writes one score
+    file per fragment length, the lengths with a score file are not searched
+    again when checkpointing. Each sequence and length has its own random
+    stream, so the fragments do not depend on the shards, and the lengths
+    can be searched separately, as units of the work queue.
+    '''
+    resultsfiles = dict((fragment_length, specificity_scores_file(tmpdir, args, fragment_length)) \
+            for fragment_length in args.fragment_lengths)
+    est_obj.spec_score_file = resultsfiles[args.fragment_lengths[-1]]
+    est_obj.spec_score_files = resultsfiles
+    lengths = [fragment_length for fragment_length in args.fragment_lengths \
+            if not scores_done(args.checkpoint_dir, resultsfiles[fragment_length])]
+    if not lengths:
+        return
+    num_shards = args.shards or max(args.processes, 1)
+    num_negatives = count_sequences(args.negative_sequences)
+    if args.queue_dir:
+        jobs = [(hmmmodel, [fragment_length], shard, num_shards, num_negatives, args) \
+                for fragment_length in lengths for shard in range(num_shards)]
+        results = WorkQueue(args.queue_dir).map('specificity', search_negative_shard, jobs)
+    else:
+        jobs = [(hmmmodel, lengths, shard, num_shards, num_negatives, args) for shard in range(num_shards)]
+        p = Pool(min(args.processes, num_shards))
+        results = p.map(search_negative_shard, jobs)
+        p.close()
+        p.join()
+    for fragment_length in lengths:
+        scores = [shard_scores[fragment_length] for shard_scores in results if fragment_length in shard_scores]
+        save_scores(resultsfiles[fragment_length], np.concatenate(scores))
+        mark_scores_done(args.checkpoint_dir, resultsfiles[fragment_length])
+
+def specificity_scores_file(tmpdir, args, fragment_length):
+    return '%s/%s_%s_specificity_scores%s.txt' %(tmpdir,args.modelname,str(fragment_length),sampling_round(args)[2])
+
+def search_negative_shard(job):
+    '''
+    Searches the fragments of the given lengths of every num_shards:th
+    negative sequence, starting at shard, in one hmmsearch. Only the
+    sequences of the shard are kept in memory. Returns the best scores per
+    fragment for each length. The E-values are computed as for a search
+    of all fragments of one length (of num_negatives sequences). With a
+    cache, the scores are reused when the model, the negative sequences
+    and the fragments are the same.
+    '''
+    hmmmodel, lengths, shard, num_shards, num_negatives, args = job
+    negatives = [(index, header.split()[0], seq) for index, (header, seq) \
+            in enumerate(read_fasta(args.negative_sequences, False)) if index % num_shards == shard]
+    database_size = num_negatives * int(args.num_fragments)
+    num_fragments, keys, suffix = sampling_round(args)
+    cache = open_cache(args)
+    if cache is not None:
+        key = cache_key('specificity', args.tool_versions, md5sum(hmmmodel), md5sum(args.negative_sequences),
+                [int(length) for length in lengths], shard, num_shards, args.seed, [num_fragments, keys], database_size)
+        cached = cache.fetch_scores(key)
+        if cached is not None:
+            return dict((fragment_length, cached[str(fragment_length)]) for fragment_length in lengths)
+    chunks = chain.from_iterable(fragment_chunks([(name, seq)], num_fragments, [fragment_length],
+            fragment_rng(args.seed, 0, int(fragment_length), index, *keys)) \
+            for fragment_length in lengths for index, name, seq in negatives)
+    names, scores = search_scores(hmmmodel, chunks, args.threads, database_size=database_size)
+    scores = split_by_length(names, scores, lengths)
+    if cache is not None:
+        cache.store_scores(key, scores)
+    return dict((fragment_length, scores[str(fragment_length)]) for fragment_length in lengths)
+
+def count_sequences(fastafile):
+    with open(fastafile) as f:
+        return sum([1 for line in f if line.startswith('>')])
+
+def create_model(fastafile, alignfile, hmmfile, threads=None):
     devnull = open(os.devnull, 'w')
-    call_list = ''.join(['clustalo -quiet -infile=',fastafile, \
+    clustalo_threads, hmmer_threads = thread_flags(threads)
+    call_list = ''.join(['clustalo -quiet',clustalo_threads,' -infile=',fastafile, \
             ' -align -outfile=',alignfile, ' -output=fasta'])   
     logging.info('Running command:\n%s' %(call_list))
     commands = shlex.split(call_list)                                                                        
     subprocess.Popen(commands, stdin=subprocess.PIPE,           
             stderr=subprocess.PIPE,stdout=devnull).communicate()               
     logging.info('Done')                                                            
-    call_list = ''.join(['hmmbuild ',hmmfile,' ', alignfile])   
+    call_list = ''.join(['hmmbuild',hmmer_threads,' ',hmmfile,' ', alignfile])
     commands = shlex.split(call_list)                           
     logging.info('Running command:\n%s' %(call_list))
     subprocess.Popen(commands, stdin=subprocess.PIPE,           
             stderr=subprocess.PIPE,stdout=devnull).communicate()               
     logging.info('Done')                                                            
                                                                 
-    call_list = ''.join(['hmmpress ', hmmfile])                 
+    call_list = ''.join(['hmmpress -f ', hmmfile])                 
     commands = shlex.split(call_list)                           
     logging.info('Running command:\n%s' %(call_list))
     subprocess.Popen(commands, stdin=subprocess.PIPE,           
@@ -141,8 +211,8 @@ def create_model(fastafile, alignfile, hmmfile):
     devnull.close()
     remove_tmp_files([alignfile])
 
-def run_hmmsearch(hmmfile, fragmentfile, outputfile):                          
-    call_list = ''.join(['hmmsearch --max -E 1000 --domE 1000 --domtblout ',outputfile,
+def run_hmmsearch(hmmfile, fragmentfile, outputfile, threads=None):
+    call_list = ''.join(['hmmsearch',thread_flags(threads)[1],' --max -E 1000 --domE 1000 --domtblout ',outputfile,
             ' ', hmmfile, ' ', fragmentfile])                                          
     commands = shlex.split(call_list)                                                  
     with open(os.devnull,'w') as devnull:                                              
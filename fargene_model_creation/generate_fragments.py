@@ -0,0 +1,58 @@
+import numpy as np
+
+def fragment_rng(seed, *keys):
+    '''
+    Returns a random generator for one fragment stream. The same seed and
+    keys (e.g. the index of a held-out sequence) give the same fragments,
+    regardless of which process generates them.
+    '''
+    return np.random.RandomState([seed] + list(keys))
+
+def sampling_round(args):
+    '''
+    Returns the number of fragments per sequence, the extra random stream
+    keys and the file name suffix of the current adaptive sampling round
+    (args.fragment_round), or of all fragments if sampling is not adaptive.
+    '''
+    if args.fragment_round is None:
+        return args.num_fragments, (), ''
+    return args.batch_fragments, (args.fragment_round,), '-round%d' %(args.fragment_round)
+
+def length_label(fragment_lengths):
+    ''' Names a sweep over fragment lengths, e.g. 33-83. '''
+    return '-'.join([str(fragment_length) for fragment_length in fragment_lengths])
+
+def create_fragments(sequence, num_fragments, fragment_length, rng):
+    '''
+    Cuts num_fragments fragments of fragment_length at uniformly drawn
+    start positions. Sequences shorter than the fragment length are
+    returned whole.
+    '''
+    max_start = len(sequence) - fragment_length
+    if max_start <= 0:
+        return np.array([sequence]*int(num_fragments))
+    starts = rng.randint(0, max_start + 1, size=int(num_fragments))
+    residues = np.frombuffer(sequence.encode('ascii'), dtype='S1')
+    matrix = residues[starts[:,None] + np.arange(fragment_length)]
+    return matrix.view('S%d' %(fragment_length)).ravel()
+
+def fragment_chunks(sequences, num_fragments, fragment_lengths, rng):
+    '''
+    Yields the fragments of (name, sequence) pairs in FASTA format, one
+    chunk per sequence and length. The fragments are named
+    <name>_<length>_<i>, so that several lengths can be searched in one pass.
+    '''
+    for name, sequence in sequences:
+        for fragment_length in fragment_lengths:
+            fragments = create_fragments(sequence, num_fragments, int(fragment_length), rng)
+            yield ''.join(['>%s_%s_%d\n%s\n' %(name, str(fragment_length), i, fragment.decode('ascii')) \
+                    for i, fragment in enumerate(fragments)])
+
+def split_by_length(names, scores, fragment_lengths):
+    '''
+    Splits the scores of fragments named by fragment_chunks into one
+    array of scores per fragment length.
+    '''
+    lengths = np.array([name.rsplit('_', 2)[1] for name in names], dtype=object)
+    return dict((str(fragment_length), scores[lengths == str(fragment_length)]) \
+            for fragment_length in fragment_lengths)
@@ -0,0 +1,168 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+from os import path, makedirs
+import numpy as np
+from checkpoints import save_unit, load_unit
+
+DEFAULT_CACHE_SIZE = 2000
+
+def tool_versions():
+    '''
+    The versions of clustalo and HMMER, which the cached models and
+    scores depend on.
+    '''
+    versions = {}
+    for tool, commands in [('clustalo', ['clustalo', '--version']), ('hmmer', ['hmmbuild', '-h'])]:
+        try:
+            output = subprocess.Popen(commands, stdin=subprocess.PIPE,
+                    stderr=subprocess.PIPE, stdout=subprocess.PIPE).communicate()[0]
+        except OSError:
+            output = ''
+        lines = [line.strip('# ') for line in output.splitlines() if tool == 'clustalo' or 'HMMER' in line]
+        versions[tool] = lines[0] if lines else 'unknown'
+    return versions
+
+def cache_key(*parts):
+    ''' Hashes everything an entry depends on (JSON serializable parts). '''
+    return hashlib.md5(json.dumps(parts, sort_keys=True)).hexdigest()
+
+def open_cache(args):
+    if not args.cache_dir:
+        return None
+    return ModelCache(args.cache_dir, args.cache_size)
+
+def build_cached(cache, key, hmmfile, build):
+    '''
+    Fetches the model of key from the cache into hmmfile, or calls build
+    to build it there and caches it. Without a cache the model is built.
+    '''
+    if cache is not None and cache.fetch_model(key, hmmfile):
+        return
+    build()
+    if cache is not None:
+        cache.store_model(key, hmmfile)
+
+class ModelCache(object):
+    '''
+    A persistent cache of built models and score arrays, shared between
+    runs. Each entry is a directory named by the hash of everything its
+    content depends on (the sequences, the tool versions and the
+    parameters), so changed input never finds a stale entry. Entries are
+    written under a temporary name and renamed, so that several processes
+    can use the cache at once, and the least recently used entries are
+    removed when the cache grows beyond max_size megabytes.
+    '''
+
+    def __init__(self, cachedir, max_size=None):
+        self.cachedir = path.abspath(cachedir)
+        self.max_size = max_size or DEFAULT_CACHE_SIZE
+        if not path.isdir(self.cachedir):
+            try:
+                makedirs(self.cachedir)
+            except OSError:
+                pass
+
+    def entry(self, key):
+        return path.join(self.cachedir, key)
+
+    def lookup(self, key):
+        ''' Returns the entry of key, marked as recently used, or None. '''
+        entry = self.entry(key)
+        try:
+            os.utime(entry, None)
+        except OSError:
+            return None
+        return entry
+
+    def insert(self, key, write):
+        ''' Adds the entry of key, whose files are written by write(directory). '''
+        tmpdir = path.join(self.cachedir, 'tmp-%s-%s' %(key, str(os.getpid())))
+        makedirs(tmpdir)
+        write(tmpdir)
+        try:
+            os.rename(tmpdir, self.entry(key))
+        except OSError:
+            # Another process stored the same entry
+            shutil.rmtree(tmpdir, True)
+        self.evict()
+
+    def fetch_model(self, key, hmmfile):
+        entry = self.lookup(key)
+        if entry is None:
+            return False
+        try:
+            for name in sorted(os.listdir(entry), key=lambda name: name == 'model.hmm'):
+                shutil.copyfile(path.join(entry, name), hmmfile + name[len('model.hmm'):])
+        except (IOError, OSError):
+            return False
+        logging.info('Using the cached model %s for %s' %(key, hmmfile))
+        return True
+
+    def store_model(self, key, hmmfile):
+        def write(entry):
+            for filename in glob.glob(hmmfile + '*'):
+                shutil.copyfile(filename, path.join(entry, 'model.hmm' + filename[len(hmmfile):]))
+        self.insert(key, write)
+
+    def fetch_unit(self, key):
+        ''' Returns a cached leave-one-out result (see checkpoints.load_unit), or None. '''
+        entry = self.lookup(key)
+        if entry is None:
+            return None
+        try:
+            return load_unit(path.join(entry, 'unit.npz'))
+        except (IOError, OSError):
+            return None
+
+    def store_unit(self, key, names, scores, lines, comparison):
+        self.insert(key, lambda entry: save_unit(path.join(entry, 'unit.npz'), names, scores, lines, comparison))
+
+    def fetch_scores(self, key):
+        ''' Returns a cached dictionary of score arrays, or None. '''
+        entry = self.lookup(key)
+        if entry is None:
+            return None
+        try:
+            data = np.load(path.join(entry, 'scores.npz'))
+            try:
+                return dict((name, data[name]) for name in data.files)
+            finally:
+                data.close()
+        except (IOError, OSError):
+            return None
+
+    def store_scores(self, key, scores):
+        def write(entry):
+            with open(path.join(entry, 'scores.npz'), 'wb') as f:
+                np.savez(f, **scores)
+        self.insert(key, write)
+
+    def evict(self):
+        ''' Removes the least recently used entries until the cache fits in max_size megabytes. '''
+        entries = []
+        for key in os.listdir(self.cachedir):
+            if key.startswith('tmp-'):
+                continue
+            entry = self.entry(key)
+            try:
+                size = sum([path.getsize(path.join(entry, name)) for name in os.listdir(entry)])
+                entries.append((path.getmtime(entry), size, key))
+            except OSError:
+                continue
+        total = sum([size for last_used, size, key in entries])
+        for last_used, size, key in sorted(entries):
+            if total <= self.max_size * 2**20:
+                break
+            evicted = path.join(self.cachedir, 'tmp-evicted-%s-%s' %(key, str(os.getpid())))
+            try:
+                os.rename(self.entry(key), evicted)
+            except OSError:
+                continue
+            shutil.rmtree(evicted, True)
+            total -= size
+            logging.info('Evicted %s from the model cache' %(key))
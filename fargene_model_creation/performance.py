@@ -0,0 +1,258 @@
+import numpy as np
+
+def load_sorted_scores(score_file):
+    """
+    Returns the sorted scores of a score file and, if the file has a
+    second column of weights (the cluster sizes of redundancy reduced
+    reference sequences), the total weight from each sorted score to
+    the end. The weights are None otherwise.
+    """
+    data = np.loadtxt(score_file, ndmin=2)
+    if data.size == 0:
+        return np.array([]), None
+    order = np.argsort(data[:,0], kind='mergesort')
+    if data.shape[1] < 2:
+        return data[order,0], None
+    tail_weights = np.append(np.cumsum(data[order,1][::-1])[::-1], 0)
+    return data[order,0], tail_weights
+
+def count_from(sorted_scores, positions, tail_weights=None):
+    if tail_weights is None:
+        return len(sorted_scores) - positions
+    return tail_weights[positions]
+
+def fraction_above(sorted_scores, num_runs, thresholds, tail_weights=None):
+    """
+    Returns the fraction of the num_runs searched sequences (or fragments)
+    that score above each of the thresholds, which can be any grid.
+    Only the (sorted) scores of the hits are given; the
+    num_runs - len(sorted_scores) sequences without a hit count as below
+    every threshold. With tail_weights (see load_sorted_scores) each hit
+    counts as its weight.
+    """
+    positions = np.searchsorted(sorted_scores, thresholds, side='right')
+    return count_from(sorted_scores, positions, tail_weights) / float(num_runs)
+
+def fraction_at_least(sorted_scores, num_runs, thresholds, tail_weights=None):
+    positions = np.searchsorted(sorted_scores, thresholds, side='left')
+    return count_from(sorted_scores, positions, tail_weights) / float(num_runs)
+
+def effective_sample_size(weights):
+    '''
+    Kish's effective sample size (sum w)^2 / sum w^2 of a weighted
+    estimate from draws with the given weights.
+    '''
+    weights = np.asarray(weights, dtype=float)
+    return np.sum(weights)**2 / np.sum(weights**2)
+
+def wilson_interval(fraction, num_runs, z=1.96):
+    '''
+    The Wilson score interval of a binomial fraction observed in num_runs
+    trials, 95% by default. The fragments are treated as independent draws.
+    '''
+    fraction = np.asarray(fraction, dtype=float)
+    denominator = 1 + z**2 / num_runs
+    center = (fraction + z**2 / (2 * num_runs)) / denominator
+    half_width = z * np.sqrt(fraction * (1 - fraction) / num_runs + z**2 / (4 * num_runs**2)) / denominator
+    return center - half_width, center + half_width
+
+def write_score_per_aa(outfile, rows_by_length):
+    '''
+    Writes the suggested thresholds of a sweep over fragment lengths,
+    given as (fragment_length, rows of Performance.optimize) pairs, as one
+    table with the score per AA of each target as a function of the length.
+    '''
+    with open(outfile, 'w') as f:
+        f.write('\t'.join(['Length', 'Target', 'Value', 'Score', 'Score/AA', 'Sensitivity', 'Specificity']) + '\n')
+        for fragment_length, rows in rows_by_length:
+            for target, value, threshold, sens, spec in rows:
+                if threshold is None:
+                    columns = ['NA'] * 4
+                else:
+                    columns = ['%.2f' %(threshold), '%.4f' %(threshold / float(fragment_length)),
+                            '%.4f' %(sens), '%.4f' %(spec)]
+                f.write('\t'.join([str(fragment_length), target, '%g' %(value)] + columns) + '\n')
+
+class Performance(object):
+    '''
+    Sensitivity and specificity of a model as a function of the threshold
+    score, from the sorted scores of the reference and negative hits of
+    num_ref and num_neg searched sequences (or fragments). For fragments,
+    fragment_length gives the thresholds per amino acid as well, and
+    ref_weights the tail weights of weighted reference scores. With
+    intervals, the tables also give the 95% confidence intervals of the
+    sensitivity and specificity. The sensitivity interval uses
+    ref_sample_size, the effective number of sampled reference sequences
+    (or fragments) of a weighted estimate, and num_ref otherwise.
+    All quantities are computed with searchsorted on the sorted scores,
+    so any number of thresholds, targets or fragment lengths is cheap.
+    '''
+
+    def __init__(self, ref_scores, num_ref, neg_scores, num_neg, fragment_length=None, ref_weights=None,
+            intervals=False, ref_sample_size=None):
+        self.intervals = intervals
+        self.ref_scores = ref_scores
+        self.ref_weights = ref_weights
+        self.ref_sample_size = num_ref if ref_sample_size is None else ref_sample_size
+        self.neg_scores = neg_scores
+        self.num_ref = num_ref
+        self.num_neg = num_neg
+        self.fragment_length = fragment_length
+
+    def max_score(self):
+        return np.max(np.concatenate((self.ref_scores, self.neg_scores, [0])))
+
+    def grid(self, step, end=None):
+        if end is None:
+            end = self.max_score()
+        return np.arange(0, end, step)
+
+    def sensitivity(self, thresholds):
+        return fraction_above(self.ref_scores, self.num_ref, thresholds, self.ref_weights)
+
+    def fpr(self, thresholds):
+        return fraction_above(self.neg_scores, self.num_neg, thresholds)
+
+    def sensitivity_interval(self, thresholds):
+        return wilson_interval(self.sensitivity(thresholds), self.ref_sample_size)
+
+    def specificity_interval(self, thresholds):
+        low, high = wilson_interval(self.fpr(thresholds), self.num_neg)
+        return 1 - high, 1 - low
+
+    def interval_width(self, rows):
+        '''
+        The widest confidence interval of the sensitivity and specificity
+        at the thresholds of the targets that could be met (see optimize).
+        '''
+        thresholds = [row[2] for row in rows if row[2] is not None]
+        if not thresholds:
+            return 1.0
+        widths = [high - low for low, high in [self.sensitivity_interval(thresholds),
+                self.specificity_interval(thresholds)]]
+        return np.max(widths)
+
+    def per_aa(self, thresholds):
+        if self.fragment_length is None:
+            return None
+        return np.asarray(thresholds) / float(self.fragment_length)
+
+    def roc(self):
+        '''
+        Returns the thresholds, sensitivities and false positive rates
+        of the full ROC curve, evaluated at every distinct score
+        (a hit is positive if it scores at least the threshold).
+        The curve starts at (0, 0) and ends at (1, 1), where the sequences
+        without a hit are counted as tied below every score.
+        Points on straight segments are dropped.
+        '''
+        thresholds = np.unique(np.concatenate((self.ref_scores, self.neg_scores)))[::-1]
+        thresholds = np.concatenate(([np.inf], thresholds, [-np.inf]))
+        tpr = fraction_at_least(self.ref_scores, self.num_ref, thresholds, self.ref_weights)
+        fpr = fraction_at_least(self.neg_scores, self.num_neg, thresholds)
+        tpr[-1], fpr[-1] = 1.0, 1.0
+        if len(thresholds) > 2:
+            keep = np.concatenate(([True],
+                np.logical_or(np.diff(tpr, 2), np.diff(fpr, 2)), [True]))
+            thresholds, tpr, fpr = thresholds[keep], tpr[keep], fpr[keep]
+        return thresholds, tpr, fpr
+
+    def auc(self, roc=None):
+        thresholds, tpr, fpr = roc if roc is not None else self.roc()
+        return np.trapz(tpr, fpr)
+
+    def thresholds_for_fpr(self, targets, thresholds):
+        '''
+        Returns, for each target false positive rate, the index of the
+        lowest of the (increasing) thresholds that does not exceed it,
+        or -1 if there is none.
+        '''
+        fpr = self.fpr(thresholds)
+        index = np.searchsorted(-fpr, -np.asarray(targets, dtype=float), side='left')
+        return np.where(index < len(thresholds), index, -1)
+
+    def thresholds_for_sensitivity(self, targets, thresholds):
+        '''
+        Returns, for each target sensitivity, the index of the highest of
+        the (increasing) thresholds that still reaches it, or -1 if there
+        is none.
+        '''
+        sensitivity = self.sensitivity(thresholds)
+        return np.searchsorted(-sensitivity, -np.asarray(targets, dtype=float), side='right') - 1
+
+    def optimize(self, max_fprs, sensitivities, thresholds):
+        '''
+        Returns one row (target, value, threshold, sensitivity, specificity)
+        per target, the threshold is None if the target can not be met.
+        '''
+        sens = self.sensitivity(thresholds)
+        fpr = self.fpr(thresholds)
+        rows = []
+        for target, values, indices in [
+                ('max_fpr', max_fprs, self.thresholds_for_fpr(max_fprs, thresholds)),
+                ('sensitivity', sensitivities, self.thresholds_for_sensitivity(sensitivities, thresholds))]:
+            for value, i in zip(values, indices):
+                if i < 0:
+                    rows.append((target, value, None, None, None))
+                else:
+                    rows.append((target, value, thresholds[i], sens[i], 1 - fpr[i]))
+        return rows
+
+    def write_table(self, outfile, thresholds):
+        '''
+        Writes sensitivity and specificity at each threshold as a
+        tab-separated table.
+        '''
+        sens = self.sensitivity(thresholds)
+        spec = 1 - self.fpr(thresholds)
+        per_aa = self.per_aa(thresholds)
+        intervals = self.format_intervals(thresholds)
+        with open(outfile, 'w') as f:
+            f.write('\t'.join(self.score_columns() + ['Sensitivity', 'Specificity'] + \
+                    self.interval_columns()) + '\n')
+            for i, threshold in enumerate(thresholds):
+                f.write('\t'.join(self.format_score(threshold, per_aa, i) + \
+                        ['%.4f' %(sens[i]), '%.4f' %(spec[i])] + intervals[i]) + '\n')
+
+    def write_roc(self, outfile, roc=None):
+        thresholds, tpr, fpr = roc if roc is not None else self.roc()
+        per_aa = self.per_aa(thresholds)
+        with open(outfile, 'w') as f:
+            f.write('# AUC=%.6f\n' %(self.auc((thresholds, tpr, fpr))))
+            f.write('\t'.join(self.score_columns() + ['Sensitivity', 'FPR']) + '\n')
+            for i, threshold in enumerate(thresholds):
+                f.write('\t'.join(self.format_score(threshold, per_aa, i) + \
+                        ['%.6f' %(tpr[i]), '%.6f' %(fpr[i])]) + '\n')
+
+    def write_thresholds(self, outfile, rows):
+        with open(outfile, 'w') as f:
+            f.write('\t'.join(['Target', 'Value'] + self.score_columns() + \
+                    ['Sensitivity', 'Specificity'] + self.interval_columns()) + '\n')
+            for target, value, threshold, sens, spec in rows:
+                if threshold is None:
+                    columns = ['NA'] * (len(self.score_columns()) + 2 + len(self.interval_columns()))
+                else:
+                    columns = self.format_score(threshold, self.per_aa([threshold]), 0) + \
+                            ['%.4f' %(sens), '%.4f' %(spec)] + self.format_intervals([threshold])[0]
+                f.write('\t'.join([target, '%g' %(value)] + columns) + '\n')
+
+    def interval_columns(self):
+        if not self.intervals:
+            return []
+        return ['Sensitivity_low', 'Sensitivity_high', 'Specificity_low', 'Specificity_high']
+
+    def format_intervals(self, thresholds):
+        if not self.intervals:
+            return [[] for threshold in thresholds]
+        columns = self.sensitivity_interval(thresholds) + self.specificity_interval(thresholds)
+        return [['%.4f' %(column[i]) for column in columns] for i in range(len(thresholds))]
+
+    def score_columns(self):
+        if self.fragment_length is None:
+            return ['Score']
+        return ['Score', 'Score/AA']
+
+    def format_score(self, threshold, per_aa, i):
+        if per_aa is None:
+            return ['%.2f' %(threshold)]
+        return ['%.2f' %(threshold), '%.4f' %(per_aa[i])]
@@ -32,3 +32,27 @@ def plot_cross_validation(scores,sensitivity,specificity,figfile):
 
     plt.savefig(figfile)
     #plt.show()
+
+def plot_score_per_aa(rows_by_length,figfile):
+    plt.figure(figsize=(8,6), dpi=80)
+    plt.subplot(111)
+
+    targets = [(target, value) for target, value, threshold, sens, spec in rows_by_length[0][1]]
+    for i, (target, value) in enumerate(targets):
+        lengths = [fragment_length for fragment_length, rows in rows_by_length if rows[i][2] is not None]
+        score_per_aa = [rows[i][2] / float(fragment_length) for fragment_length, rows in rows_by_length \
+                if rows[i][2] is not None]
+        plt.plot(lengths, score_per_aa, linewidth=2.5, linestyle="-", marker="o",
+                label="%s %g" %(target.replace('_',' '),value))
+
+    plt.xlabel('Fragment length [AA]')
+    plt.ylabel('Suggested score/AA')
+
+    ax = plt.gca()
+    ax.spines['right'].set_color('none')
+    ax.spines['top'].set_color('none')
+    plt.legend(loc='upper right',frameon=False)
+    for label in ax.get_xticklabels() + ax.get_yticklabels():
+        label.set_fontsize(16)
+
+    plt.savefig(figfile)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python2.7
+import argparse
+import importlib
+import json
+import logging
+import os
+import pickle
+import socket
+import threading
+import time
+import traceback
+from multiprocessing import Process
+from os import path, makedirs
+
+QUEUE_FILE = 'queue.json'
+DEFAULT_LEASE = 60
+SUBDIRS = ['pending', 'claimed', 'results', 'failed', 'batches']
+
+def write_pickle(filename, obj):
+    ''' Writes obj under a temporary name and renames it, so readers never see a partial file. '''
+    tmpfile = '%s.tmp-%s' %(filename, str(os.getpid()))
+    with open(tmpfile, 'wb') as f:
+        pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+    os.rename(tmpfile, filename)
+
+def read_pickle(filename):
+    with open(filename, 'rb') as f:
+        return pickle.load(f)
+
+class WorkQueue(object):
+    '''
+    A work queue in a directory that can be shared between machines, so
+    that no broker is needed. Units are files in pending/. A worker claims
+    a unit by renaming it to claimed/ under a name of its own (the unit
+    and the host and process of the worker), which is atomic, and renews
+    its lease by touching the claimed file while it works. Units whose
+    lease has expired (the worker died) are moved back to pending/. The
+    result of each unit is written as a shard in results/, which the
+    coordinator collects in the order of the jobs.
+    '''
+
+    def __init__(self, queuedir, lease=None):
+        self.queuedir = path.abspath(queuedir)
+        for subdir in SUBDIRS:
+            if not path.isdir(self.subdir(subdir)):
+                makedirs(self.subdir(subdir))
+        queuefile = path.join(self.queuedir, QUEUE_FILE)
+        if lease is None and path.isfile(queuefile):
+            with open(queuefile) as f:
+                lease = json.load(f)['lease']
+        self.lease = lease or DEFAULT_LEASE
+        self.owner = '%s-%s' %(socket.gethostname(), str(os.getpid()))
+
+    def subdir(self, subdir):
+        return path.join(self.queuedir, subdir)
+
+    def reset(self):
+        ''' Removes the units of a previous run and opens the queue. '''
+        for subdir in SUBDIRS:
+            for name in os.listdir(self.subdir(subdir)):
+                os.remove(path.join(self.subdir(subdir), name))
+        if self.is_closed():
+            os.remove(path.join(self.queuedir, 'closed'))
+        with open(path.join(self.queuedir, QUEUE_FILE), 'w') as f:
+            json.dump({'lease': self.lease}, f)
+
+    def close(self):
+        ''' Tells the workers to stop when the queue is empty. '''
+        open(path.join(self.queuedir, 'closed'), 'w').close()
+
+    def is_closed(self):
+        return path.isfile(path.join(self.queuedir, 'closed'))
+
+    def submit(self, batch, function, jobs, initializer=None, initargs=()):
+        '''
+        Queues function(job) for each job. function and initializer
+        (called once with initargs in each worker before the units of
+        the batch) must be module level functions. The batch is numbered,
+        so that the units of every submission have names of their own, and
+        the late result of a unit whose lease expired is never taken for
+        that of a later submission.
+        '''
+        batch = '%s-%03d' %(batch, len(os.listdir(self.subdir('batches'))))
+        write_pickle(path.join(self.subdir('batches'), batch), {
+                'module': function.__module__, 'function': function.__name__,
+                'initializer': initializer.__name__ if initializer else None,
+                'initargs': initargs, 'submitted': time.time()})
+        names = ['%s.%06d' %(batch, i) for i in range(len(jobs))]
+        for name, job in zip(names, jobs):
+            write_pickle(path.join(self.subdir('pending'), name), job)
+        logging.info('Queued %s units of %s in %s' %(str(len(jobs)), batch, self.queuedir))
+        return names
+
+    def claim(self):
+        try:
+            pending = sorted(os.listdir(self.subdir('pending')))
+        except OSError:
+            return None
+        for name in pending:
+            if '.tmp-' in name:
+                continue
+            claimed = self.claimed_file(name)
+            try:
+                os.rename(path.join(self.subdir('pending'), name), claimed)
+                os.utime(claimed, None)
+                return name
+            except OSError:
+                continue
+        return None
+
+    def claimed_file(self, name):
+        ''' The claim of unit name by this worker. '''
+        return path.join(self.subdir('claimed'), '%s@%s' %(name, self.owner))
+
+    def renew(self, name):
+        try:
+            os.utime(self.claimed_file(name), None)
+        except OSError:
+            pass
+
+    def release(self, name):
+        ''' Removes the claim, unless it expired (then another worker may hold the unit now). '''
+        try:
+            os.remove(self.claimed_file(name))
+        except OSError:
+            pass
+
+    def requeue_expired(self):
+        now = time.time()
+        for claim in os.listdir(self.subdir('claimed')):
+            claimed = path.join(self.subdir('claimed'), claim)
+            name = claim.rsplit('@', 1)[0]
+            try:
+                if now - path.getmtime(claimed) > self.lease:
+                    os.rename(claimed, path.join(self.subdir('pending'), name))
+                    logging.warning('The lease of %s expired, queued it again' %(name))
+            except OSError:
+                continue
+
+    def complete(self, name, result):
+        write_pickle(path.join(self.subdir('results'), name), result)
+        self.release(name)
+
+    def fail(self, name, message):
+        with open(path.join(self.subdir('failed'), name), 'w') as f:
+            f.write(message)
+        self.release(name)
+
+    def wait(self, names, poll=1.0):
+        remaining = set(names)
+        while remaining:
+            remaining = set(name for name in remaining \
+                    if not path.isfile(path.join(self.subdir('results'), name)))
+            for name in remaining:
+                failed = path.join(self.subdir('failed'), name)
+                if path.isfile(failed):
+                    with open(failed) as f:
+                        logging.critical('Unit %s failed:\n%s' %(name, f.read()))
+                    exit()
+            if remaining:
+                self.requeue_expired()
+                time.sleep(poll)
+
+    def collect(self, names):
+        results = []
+        for name in names:
+            shard = path.join(self.subdir('results'), name)
+            results.append(read_pickle(shard))
+            os.remove(shard)
+        return results
+
+    def map(self, batch, function, jobs, initializer=None, initargs=()):
+        ''' Like Pool.map, but run by the workers of the queue. '''
+        names = self.submit(batch, function, jobs, initializer, initargs)
+        self.wait(names)
+        return self.collect(names)
+
+def renew_lease(queue, name, stop):
+    while not stop.wait(queue.lease / 3.0):
+        queue.renew(name)
+
+def run_worker(queuedir, poll=1.0):
+    '''
+    Runs units until the queue is closed and empty.
+    '''
+    queue = WorkQueue(queuedir)
+    initialized = None
+    while True:
+        name = queue.claim()
+        if name is None:
+            if queue.is_closed():
+                return
+            time.sleep(poll)
+            continue
+        batch = name.rsplit('.', 1)[0]
+        stop = threading.Event()
+        renewer = threading.Thread(target=renew_lease, args=(queue, name, stop))
+        renewer.daemon = True
+        renewer.start()
+        try:
+            job = read_pickle(queue.claimed_file(name))
+            spec = read_pickle(path.join(queue.subdir('batches'), batch))
+            module = importlib.import_module(spec['module'])
+            if spec['initializer'] and initialized != (batch, spec['submitted']):
+                getattr(module, spec['initializer'])(*spec['initargs'])
+            initialized = (batch, spec['submitted'])
+            result = getattr(module, spec['function'])(job)
+        except BaseException as e:
+            # Also a unit that calls exit() fails, or map would wait for it forever
+            logging.error('Unit %s failed' %(name))
+            stop.set()
+            queue.fail(name, traceback.format_exc())
+            if isinstance(e, KeyboardInterrupt):
+                raise
+            continue
+        stop.set()
+        renewer.join()
+        queue.complete(name, result)
+
+def start_local_workers(queuedir, num_workers):
+    workers = [Process(target=run_worker, args=(queuedir,)) for i in range(num_workers)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    return workers
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the units of a model creation work queue, '\
+            'e.g. on another machine sharing the output directory.')
+    parser.add_argument('queue_dir',
+                        help = 'The queue directory (<output>/queue/ of fargene_model_creation --queue).')
+    parser.add_argument('--processes','-p',type=int,dest='processes',
+                        help = 'The number of workers to run (default: %(default)s).')
+    parser.set_defaults(processes = 1)
+    args = parser.parse_args()
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', level=logging.INFO)
+    for worker in start_local_workers(args.queue_dir, args.processes):
+        worker.join()
+
+if __name__ == '__main__':
+    main()
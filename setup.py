@@ -16,6 +16,7 @@ setup(name='fargene',
                 'fargene=fargene_analysis.fargene_analysis:main',
                 'pick_long_reads=fargene_analysis.pick_long_reads:main',
                 'fargene_model_creation=fargene_model_creation.create_and_optimize_model:main',
+                'fargene_model_creation_worker=fargene_model_creation.work_queue:main',
                 ],
             },
         zip_safe=False)
@@ -0,0 +1,50 @@
+import sys
+import unittest
+from os import path
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, path.join(ROOT, 'fargene_analysis'))
+
+from ProfileHmm import ProfileHmm
+from utils import read_fasta
+
+MODEL = path.join(ROOT, 'fargene_analysis', 'models', 'class_B_1_2.hmm')
+SEQUENCES = path.join(ROOT, 'tutorial', 'tutorialdata', 'class_b1_b2.fasta')
+
+class StopCodonTest(unittest.TestCase):
+    '''
+    The in-process search scores stop codons the way hmmsearch (HMMER 3)
+    does: match states cannot emit them, but insert states emit them, like
+    every residue, with score 0. So stops inside a hit lower its score
+    without splitting the domain. The expected scores and envelopes are
+    those of hmmsearch for the same sequences.
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model = ProfileHmm(MODEL)
+        cls.seq = list(read_fasta(SEQUENCES, False))[0][1]
+
+    def search(self, seq):
+        name, length, score, bias, domains = self.model.search([('seq', seq)])[0]
+        return score, [(round(domain[0], 1), domain[2], domain[3]) for domain in domains]
+
+    def test_intact(self):
+        score, domains = self.search(self.seq)
+        self.assertAlmostEqual(score, 300.7, places=1)
+        self.assertEqual(domains, [(300.5, 1, 237)])
+
+    def test_stops_in_hit(self):
+        spliced = self.seq[:100] + '***' + self.seq[100:180] + '**' + self.seq[180:]
+        score, domains = self.search(spliced)
+        self.assertAlmostEqual(score, 282.1, places=1)
+        self.assertEqual(domains, [(281.9, 1, 242)])
+
+    def test_stop_never_matched(self):
+        intact = self.search(self.seq)[0]
+        stopped = self.search(self.seq[:60] + '*' + self.seq[60:])[0]
+        self.assertAlmostEqual(stopped, 293.1, places=1)
+        self.assertLess(stopped, intact)
+
+if __name__ == '__main__':
+    unittest.main()